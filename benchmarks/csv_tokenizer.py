@@ -0,0 +1,116 @@
+"""
+Benchmarks tokenizing a 50k row "show stat" response, comparing the plain
+`str.split()` that doesn't handle quoted fields, the `csv` module on its own
+and `split_stat_sections()`, both for responses without any quoted field
+and ones where every tenth row has one.
+
+Each tokenizer's rows are consumed one at a time without being kept, the
+way the plugin reads them.
+
+Run from the repository root with::
+
+    python benchmarks/csv_tokenizer.py
+"""
+import collections
+import csv
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from collectd_haproxy.connection import split_stat_sections  # noqa: E402
+
+
+ROWS = 50000
+REPEAT = 5
+
+
+def make_response(quoted_every=None):
+    """
+    Builds a "show stat" response of `ROWS` server rows out of the example
+    stats, optionally with a comma-bearing quoted `check_desc` field on every
+    Nth row.
+
+    :param quoted_every: How often to add a quoted field, or `None`.
+    :type quoted_every: int
+    """
+    path = os.path.join(
+        os.path.dirname(__file__), "..", "tests", "example_stats.csv"
+    )
+    with open(path) as fd:
+        lines = fd.read().strip().split("\n")
+
+    header, rows = lines[0] + ",check_desc", lines[1:]
+    body = []
+    for i in range(ROWS):
+        desc = "Layer4 check passed"
+        if quoted_every and i % quoted_every == 0:
+            desc = '"Layer7 wrong status, 503"'
+        body.append(rows[i % len(rows)] + "," + desc)
+
+    return "\n".join([header] + body)
+
+
+def consume(rows):
+    """
+    Runs through an iterable of rows, dropping each one.
+
+    :param rows: The rows.
+    :type rows: iterable
+    """
+    collections.deque(rows, maxlen=0)
+
+
+def naive(response):
+    """
+    Splits every line on commas, mis-splitting quoted fields.
+
+    :param response: The "show stat" response.
+    :type response: str
+    """
+    consume(line.split(",") for line in response.split("\n"))
+
+
+def csv_only(response):
+    """
+    Tokenizes every line with the `csv` module.
+
+    :param response: The "show stat" response.
+    :type response: str
+    """
+    consume(csv.reader(response.split("\n")))
+
+
+def sections(response):
+    """
+    Tokenizes the response with `split_stat_sections()`.
+
+    :param response: The "show stat" response.
+    :type response: str
+    """
+    consume(split_stat_sections(response))
+
+
+def main():
+    """
+    Prints the best time out of `REPEAT` runs for each tokenizer.
+    """
+    for label, response in (
+        ("unquoted", make_response()),
+        ("10% quoted", make_response(quoted_every=10)),
+    ):
+        sys.stdout.write("%s (%d rows)\n" % (label, ROWS))
+        for name, func in (
+                ("naive", naive),
+                ("csv_only", csv_only),
+                ("split_stat_sections", sections),
+        ):
+            best = min(timeit.repeat(
+                lambda: func(response), number=1, repeat=REPEAT
+            ))
+            sys.stdout.write("  %-22s %8.2f ms\n" % (name, best * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import asyncio
+import time
+
+from .connection import HAProxySocket, MasterSocket
+
+
+class AsyncHAProxySocket(HAProxySocket):
+    """
+    An `HAProxySocket` whose command responses can be fetched ahead of time
+    by an `AsyncEngine`.
+
+    The socket keeps track of which commands were sent during a read, and
+    those same commands are fetched concurrently at the start of the next
+    one.  `send_command()` then answers from the prefetched responses, so
+    the `gen_info()`/`gen_stats()` semantics are unchanged and any command
+    that wasn't prefetched (e.g. on the very first read, or for slower
+    collectors that just came due) falls back to a regular blocking fetch.
+    """
+
+    def __init__(self, collectd, socket_file_path, name=None):
+        """
+        The AsyncHAProxySocket constructor.
+
+        :param collectd: The collectd module.
+        :type collectd: module
+
+        :param socket_file_path: Full path to HAProxy's socket file.
+        :type socket_file_path: str
+
+        :param name: Optional name of the instance behind the socket.
+        :type name: str
+        """
+        super(AsyncHAProxySocket, self).__init__(
+            collectd, socket_file_path, name=name
+        )
+
+        self.commands = set()
+        self.prefetched = {}
+
+    def send_command(self, command):
+        """
+        Returns the prefetched response for a command if there is one,
+        falling back to a blocking `HAProxySocket.send_command()` otherwise.
+
+        :param command: The command to send, e.g. "show stat"
+        :type command: str
+        """
+        self.commands.add(command)
+
+        response = self.prefetched.pop(command, None)
+        if response is None:
+            return super(AsyncHAProxySocket, self).send_command(command)
+
+        return self.process_command_response(command, response)
+
+    def reset(self):
+        """
+        Drops any responses prefetched from the replaced process.
+        """
+        self.prefetched = {}
+
+    def replace_command(self, command, upcoming):
+        """
+        Swaps a command sent during this read for the one the next read is
+        going to send in its place (e.g. the next `ServerSampling` slice of
+        servers), so that it's the upcoming one that gets prefetched.
+
+        :param command: The command sent during this read, or `None`.
+        :type command: str
+
+        :param upcoming: The command the next read will send, or `None`.
+        :type upcoming: str
+        """
+        self.commands.discard(command)
+        if upcoming:
+            self.commands.add(upcoming)
+
+    def pop_commands(self):
+        """
+        Returns the set of commands sent since the last call and resets it.
+        """
+        commands, self.commands = self.commands, set()
+        return commands
+
+    async def fetch(self, command):
+        """
+        Coroutine that sends a command over a new connection and returns the
+        raw response, capped at `max_response_bytes` if set and recorded if
+        a `recorder` is set.
+
+        :param command: The command to send, e.g. "show stat"
+        :type command: str
+        """
+        start = time.time()
+        reader, writer = await asyncio.open_unix_connection(
+            self.socket_file_path
+        )
+        try:
+            writer.write((command + "\n").encode())
+            if self.max_response_bytes:
+                response = await reader.read(self.max_response_bytes)
+                while len(response) < self.max_response_bytes:
+                    chunk = await reader.read(
+                        self.max_response_bytes - len(response)
+                    )
+                    if not chunk:
+                        break
+                    response += chunk
+            else:
+                response = await reader.read()
+        finally:
+            writer.close()
+
+        response = response.decode("ascii")
+        if self.recorder is not None:
+            self.recorder.record(command, response, time.time() - start)
+
+        return self.limit(response)
+
+
+class AsyncMasterSocket(MasterSocket, AsyncHAProxySocket):
+    """
+    A `MasterSocket` whose commands (including the pipelined "show stat" to
+    all workers) can be prefetched by an `AsyncEngine`.
+    """
+
+
+class AsyncEngine(object):
+    """
+    Drives `AsyncHAProxySocket` prefetches on a private asyncio event loop.
+
+    Every command for every socket is issued at once, so a single read of
+    dozens of sockets costs roughly one round trip rather than one per
+    command per socket.
+    """
+
+    def __init__(self, collectd):
+        """
+        The AsyncEngine constructor.
+
+        :param collectd: The collectd module.
+        :type collectd: module
+        """
+        self.collectd = collectd
+        self.loop = asyncio.new_event_loop()
+
+    def prefetch(self, sockets):
+        """
+        Concurrently fetches the responses to the commands each socket sent
+        during the previous read.
+
+        Failed fetches are left out, the blocking fallback in `send_command()`
+        takes care of reporting the error in the usual way.
+
+        :param sockets: The sockets to prefetch for.
+        :type sockets: list
+        """
+        jobs = []
+        for socket in sockets:
+            socket.prefetched = {}
+            for command in socket.pop_commands():
+                jobs.append((socket, command))
+
+        if not jobs:
+            return
+
+        results = self.loop.run_until_complete(self.fetch_all(jobs))
+
+        for (socket, command), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                self.collectd.debug(
+                    "Prefetch of '%s' from %s failed: %s" % (
+                        command, socket.socket_file_path, result
+                    )
+                )
+                continue
+            socket.prefetched[command] = result
+
+    async def fetch_all(self, jobs):
+        """
+        Coroutine that runs every (socket, command) fetch concurrently,
+        returning the responses (or exceptions) in the same order.
+
+        :param jobs: List of (socket, command) tuples.
+        :type jobs: list
+        """
+        return await asyncio.gather(
+            *[socket.fetch(command) for socket, command in jobs],
+            return_exceptions=True
+        )
+
+    def close(self):
+        """
+        Closes the private event loop.
+        """
+        self.loop.close()
@@ -0,0 +1,86 @@
+import random
+import time
+
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+
+
+class CircuitBreaker(object):
+    """
+    Tracks whether a socket is worth talking to.
+
+    The breaker starts out closed (calls go through).  Each failure opens it
+    for an exponentially growing, jittered delay during which calls are
+    skipped altogether.  Once the delay is up the breaker goes half-open and
+    lets a single probe through: a success closes it again, a failure opens
+    it for a longer delay.
+    """
+
+    def __init__(self, base_delay, max_delay, jitter=0.5,
+                 clock=time.time, rand=random.random):
+        """
+        The CircuitBreaker constructor.
+
+        :param base_delay: Seconds to back off for after the first failure,
+            doubled for each consecutive failure after that.
+        :type base_delay: float
+
+        :param max_delay: The most seconds to back off for.
+        :type max_delay: float
+
+        :param jitter: The fraction of each delay that is randomized, so that
+            many breakers opened at once don't all retry at once.
+        :type jitter: float
+
+        :param clock: Function returning the current time in seconds.
+        :type clock: function
+
+        :param rand: Function returning a random float in [0, 1).
+        :type rand: function
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.clock = clock
+        self.rand = rand
+
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0
+
+    def allow(self):
+        """
+        Returns whether a call should go through, moving an open breaker
+        whose delay is up to half-open.
+        """
+        if self.state == OPEN:
+            if self.clock() < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+
+        return True
+
+    def success(self):
+        """
+        Records a successful call, closing the breaker.
+        """
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self):
+        """
+        Records a failed call, opening the breaker and returning the number
+        of seconds until the next probe.
+        """
+        delay = min(
+            self.max_delay, self.base_delay * 2 ** min(self.failures, 32)
+        )
+        delay *= 1 - self.jitter * self.rand()
+
+        self.failures += 1
+        self.state = OPEN
+        self.retry_at = self.clock() + delay
+
+        return delay
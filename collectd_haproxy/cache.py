@@ -0,0 +1,140 @@
+import threading
+import time
+
+
+class PendingFetch(object):
+    """
+    A fetch in flight, which other threads wanting the same result wait on
+    rather than making the fetch themselves.
+    """
+
+    def __init__(self):
+        """
+        The PendingFetch constructor.
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result, error=None):
+        """
+        Records the outcome of the fetch and wakes up any waiters.
+
+        :param result: The fetched result.
+        :type result: object
+
+        :param error: The exception the fetch raised, if any.
+        :type error: Exception
+        """
+        self.result = result
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        """
+        Waits for the fetch to finish, returning its result or raising its
+        exception.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+class ResponseCache(object):
+    """
+    Thread-safe cache of results (e.g. raw socket responses) keyed on
+    (socket path, command), each kept for a given number of seconds.
+
+    Fetches are coalesced: while one thread is fetching a missing result any
+    others asking for it wait and share it, so a socket only sees a single
+    request per command no matter how many readers want the answer.
+    """
+
+    def __init__(self, clock=time.time):
+        """
+        The ResponseCache constructor.
+
+        :param clock: Function returning the current time in seconds.
+        :type clock: function
+        """
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.pending = {}
+
+    def fetch(self, key, ttl, func, *args):
+        """
+        Returns the cached result for a key, calling the given function to
+        fetch it if missing or expired (or waiting for the thread already
+        doing so).
+
+        An exception raised by the fetch is raised in every thread waiting
+        on it and nothing is cached.
+
+        :param key: The (socket path, command) key.
+        :type key: tuple
+
+        :param ttl: How many seconds a fetched result is good for.
+        :type ttl: float
+
+        :param func: The function that fetches the result.
+        :type func: function
+
+        :param args: The arguments to call the function with.
+        :type args: tuple
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                return entry[1]
+
+            pending = self.pending.get(key)
+            if pending is not None:
+                leader = False
+            else:
+                leader = True
+                pending = PendingFetch()
+                self.pending[key] = pending
+
+        if not leader:
+            return pending.wait()
+
+        try:
+            result = func(*args)
+        except Exception as e:
+            with self.lock:
+                del self.pending[key]
+            pending.finish(None, e)
+            raise
+
+        with self.lock:
+            self.expire()
+            self.entries[key] = (self.clock() + ttl, result)
+            del self.pending[key]
+        pending.finish(result)
+
+        return result
+
+    def expire(self):
+        """
+        Drops the expired entries, must be called with the lock held.
+        """
+        now = self.clock()
+        for key in [
+                key for key, entry in self.entries.items() if entry[0] <= now
+        ]:
+            del self.entries[key]
+
+    def clear(self):
+        """
+        Drops all cached entries.
+        """
+        with self.lock:
+            self.entries = {}
+
+
+# the cache shared by every plugin instance in the process
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,169 @@
+import gzip
+import json
+import time
+
+from .connection import PayloadSocket
+
+
+FORMAT = "collectd-haproxy-capture"
+FORMAT_VERSION = 1
+
+
+class CaptureWriter(object):
+    """
+    Records the commands sent to an HAProxy socket along with their raw
+    responses and timings into a capture file that can be replayed later
+    with a `ReplaySocket`.
+
+    Capture files are gzipped JSON lines: a header object followed by one
+    object per command with the "command", raw "response", the seconds the
+    response took ("elapsed") and when it was sent relative to the start of
+    the capture ("offset").
+    """
+
+    def __init__(self, path, socket_file_path=None):
+        """
+        The CaptureWriter constructor.
+
+        :param path: The path of the capture file to write.
+        :type path: str
+
+        :param socket_file_path: The path of the socket being recorded, kept
+            in the capture header for reference.
+        :type socket_file_path: str
+        """
+        self.path = path
+        self.started = time.time()
+
+        self.fd = gzip.open(path, "wb")
+        self.write({
+            "format": FORMAT,
+            "version": FORMAT_VERSION,
+            "socket": socket_file_path,
+            "created": self.started,
+        })
+
+    def record(self, command, response, elapsed):
+        """
+        Records a single command and its raw response.
+
+        :param command: The command sent, e.g. "show stat -1 7 -1"
+        :type command: str
+
+        :param response: The raw response.
+        :type response: str
+
+        :param elapsed: The seconds it took to get the response.
+        :type elapsed: float
+        """
+        self.write({
+            "offset": round(time.time() - elapsed - self.started, 6),
+            "elapsed": round(elapsed, 6),
+            "command": command,
+            "response": response,
+        })
+
+    def write(self, record):
+        """
+        Writes a record as a line of JSON, flushed so that the capture is
+        usable even if the writer is never closed.
+
+        :param record: The record to write.
+        :type record: dict
+        """
+        self.fd.write((json.dumps(record) + "\n").encode("utf-8"))
+        self.fd.flush()
+
+    def close(self):
+        """
+        Closes the capture file.
+        """
+        self.fd.close()
+
+
+def read_capture(path):
+    """
+    Reads a capture file, returning a list of its command records.
+
+    A capture whose writer never closed it (e.g. collectd was killed) is
+    read up to its last complete record.
+
+    :param path: The path of the capture file.
+    :type path: str
+    """
+    records = []
+    with gzip.open(path, "rb") as fd:
+        try:
+            for line in fd:
+                if not line.endswith(b"\n"):
+                    break
+                records.append(json.loads(line.decode("utf-8")))
+        except EOFError:
+            pass
+
+    if not records or records[0].get("format") != FORMAT:
+        raise ValueError("Not a capture file: %s" % path)
+
+    return records[1:]
+
+
+class ReplaySocket(PayloadSocket):
+    """
+    A `PayloadSocket` that replays the responses from a capture file made
+    by a `CaptureWriter`.
+
+    Each command's recorded responses are played back in order, starting
+    over once they run out, so any number of reads can be replayed from a
+    capture.  By default responses are returned at full speed, in "real
+    time" mode each one takes as long as it originally did.
+    """
+
+    def __init__(self, collectd, capture_file_path, name=None, realtime=False):
+        """
+        The ReplaySocket constructor.
+
+        :param collectd: The collectd module.
+        :type collectd: module
+
+        :param capture_file_path: Path to the capture file.
+        :type capture_file_path: str
+
+        :param name: Optional name of the instance the capture came from.
+        :type name: str
+
+        :param realtime: Whether to take as long as the original responses.
+        :type realtime: bool
+        """
+        # skip the PayloadSocket constructor, the payload isn't JSON
+        super(PayloadSocket, self).__init__(
+            collectd, capture_file_path, name=name
+        )
+
+        self.realtime = realtime
+
+        self.responses = {}
+        for record in read_capture(capture_file_path):
+            self.responses.setdefault(record["command"], []).append(
+                (record["response"], record["elapsed"])
+            )
+        self.positions = {}
+
+    def send_command(self, command):
+        """
+        Returns the next recorded response for a given command.
+
+        :param command: The command to "send", e.g. "show stat -1 7 -1"
+        :type command: str
+        """
+        responses = self.responses.get(command)
+        if not responses:
+            self.collectd.error("No recorded response for '%s'" % command)
+            return
+
+        position = self.positions.get(command, 0)
+        self.positions[command] = (position + 1) % len(responses)
+        response, elapsed = responses[position]
+        if self.realtime:
+            time.sleep(elapsed)
+
+        return self.process_command_response(command, self.limit(response))
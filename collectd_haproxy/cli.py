@@ -0,0 +1,270 @@
+import argparse
+import sys
+import time
+
+from .capture import ReplaySocket
+from .connection import PayloadSocket
+from .plugin import HAProxyPlugin
+from .stub import StubCollectd, StubConfigNode
+
+
+# the plugin methods timed as individual "phases" of a read
+PHASES = (
+    "collect_info",
+    "collect_stats",
+    "collect_pools",
+    "collect_activity",
+    "refresh_server_states",
+    "collect_server_states",
+    "collect_tables",
+)
+
+
+def parse_args(argv):
+    """
+    Parses the command line arguments for the standalone runner.
+
+    :param argv: The command line arguments, sans program name.
+    :type argv: list
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m collectd_haproxy",
+        description=(
+            "Run the HAProxy collectd plugin outside of collectd, timing "
+            "each phase of the read cycles."
+        ),
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--socket", help="Path to the HAProxy socket.")
+    source.add_argument(
+        "--payload",
+        help="Path to a recorded JSON payload of command responses."
+    )
+    source.add_argument(
+        "--replay", metavar="PATH",
+        help="Path to a capture file recorded with the RecordPath option."
+    )
+    parser.add_argument(
+        "--realtime", action="store_true",
+        help="Replay captured responses at their original pace."
+    )
+    parser.add_argument(
+        "-n", "--cycles", type=int, default=10,
+        help="Number of read cycles to run (default: 10)."
+    )
+    parser.add_argument(
+        "-o", "--option", action="append", default=[], metavar="KEY=VALUE",
+        help="Plugin config option, e.g. IncludeServerState=true."
+    )
+    parser.add_argument(
+        "--profile", metavar="PATH",
+        help="Run the cycles under cProfile and dump the stats to PATH."
+    )
+    parser.add_argument(
+        "--line-profile", action="store_true",
+        help="Print line-level timings of the hot path (needs line_profiler)."
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Show debug logging."
+    )
+
+    return parser.parse_args(argv)
+
+
+def parse_option(option):
+    """
+    Turns a "Key=value" string into a config node, converting the value the
+    same way collectd does (booleans and numbers are native, the rest are
+    strings).
+
+    :param option: The "Key=value" string.
+    :type option: str
+    """
+    key, _, value = option.partition("=")
+    if value.lower() in ("true", "false"):
+        value = value.lower() == "true"
+    else:
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+
+    return StubConfigNode(key, [value])
+
+
+def time_phases(plugin, collectd, timings):
+    """
+    Wraps each of the plugin's phase methods so that calls, elapsed time and
+    dispatched value counts are tallied into the `timings` dict.
+
+    :param plugin: The plugin instance.
+    :type plugin: HAProxyPlugin
+
+    :param collectd: The stub collectd module the plugin dispatches to.
+    :type collectd: StubCollectd
+
+    :param timings: Dictionary of phase name to [calls, seconds, values].
+    :type timings: dict
+    """
+    def wrap(name, method):
+
+        def timed(*args, **kwargs):
+            tally = timings.setdefault(name, [0, 0.0, 0])
+            dispatched = collectd.dispatched
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                tally[0] += 1
+                tally[1] += time.time() - start
+                tally[2] += collectd.dispatched - dispatched
+
+        return timed
+
+    for name in PHASES:
+        setattr(plugin, name, wrap(name, getattr(plugin, name)))
+
+
+def run_cycles(plugin, cycles):
+    """
+    Runs the plugin's read callback a number of times, returning the total
+    elapsed seconds.
+
+    :param plugin: The plugin instance.
+    :type plugin: HAProxyPlugin
+
+    :param cycles: The number of reads to run.
+    :type cycles: int
+    """
+    start = time.time()
+    for _ in range(cycles):
+        plugin.read()
+
+    return time.time() - start
+
+
+def report(timings, cycles, elapsed, dispatched, stream):
+    """
+    Prints the per-phase timings table.
+
+    :param timings: Dictionary of phase name to [calls, seconds, values].
+    :type timings: dict
+
+    :param cycles: The number of reads that were run.
+    :type cycles: int
+
+    :param elapsed: Total elapsed seconds.
+    :type elapsed: float
+
+    :param dispatched: Total number of values dispatched.
+    :type dispatched: int
+
+    :param stream: Where to write the report.
+    :type stream: file
+    """
+    row = "%-24s %8s %12s %12s %10s\n"
+    stream.write(row % ("phase", "calls", "total ms", "mean ms", "values"))
+    for name in PHASES:
+        if name not in timings:
+            continue
+        calls, seconds, values = timings[name]
+        stream.write(row % (
+            name, calls,
+            "%.3f" % (seconds * 1000), "%.3f" % (seconds * 1000 / calls),
+            values,
+        ))
+    stream.write(row % (
+        "read", cycles,
+        "%.3f" % (elapsed * 1000), "%.3f" % (elapsed * 1000 / cycles),
+        dispatched,
+    ))
+
+
+def main(argv=None, stream=None):
+    """
+    Entry point for `python -m collectd_haproxy`.
+
+    Configures and initializes the plugin against a stub collectd module,
+    runs the requested number of read cycles against a live socket, a
+    recorded payload or a replayed capture and prints per-phase timings and
+    value counts, optionally under cProfile and/or line_profiler.
+
+    :param argv: The command line arguments, defaults to `sys.argv[1:]`.
+    :type argv: list
+
+    :param stream: Where to write output, defaults to stdout.
+    :type stream: file
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    stream = stream or sys.stdout
+
+    collectd = StubCollectd(verbose=args.verbose)
+    plugin = HAProxyPlugin(collectd)
+
+    nodes = [parse_option(option) for option in args.option]
+    nodes.insert(0, StubConfigNode(
+        "Socket", [args.socket or args.payload or args.replay]
+    ))
+    plugin.configure(StubConfigNode("Module", children=nodes))
+    plugin.initialize()
+    if args.payload:
+        plugin.sockets = [PayloadSocket(collectd, args.payload)]
+    elif args.replay:
+        plugin.sockets = [
+            ReplaySocket(collectd, args.replay, realtime=args.realtime)
+        ]
+
+    line_profiler = None
+    if args.line_profile:
+        line_profiler = make_line_profiler(plugin)
+        if line_profiler is None:
+            stream.write("line_profiler is not installed.\n")
+            return 1
+
+    timings = {}
+    time_phases(plugin, collectd, timings)
+
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        elapsed = profiler.runcall(run_cycles, plugin, args.cycles)
+        profiler.dump_stats(args.profile)
+    elif line_profiler:
+        elapsed = line_profiler.runcall(run_cycles, plugin, args.cycles)
+    else:
+        elapsed = run_cycles(plugin, args.cycles)
+
+    report(timings, args.cycles, elapsed, collectd.dispatched, stream)
+
+    if args.profile:
+        import pstats
+
+        stats = pstats.Stats(args.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(20)
+    if line_profiler:
+        line_profiler.print_stats(stream=stream)
+
+    return 0
+
+
+def make_line_profiler(plugin):
+    """
+    Builds a `line_profiler.LineProfiler` covering the hot path of a read,
+    or returns `None` if the optional line_profiler package isn't installed.
+
+    :param plugin: The plugin instance.
+    :type plugin: HAProxyPlugin
+    """
+    try:
+        from line_profiler import LineProfiler
+    except ImportError:
+        return None
+
+    profiler = LineProfiler()
+    for name in PHASES:
+        profiler.add_function(getattr(type(plugin), name))
+    for name in ("send_command", "gen_info", "gen_stat_rows"):
+        profiler.add_function(getattr(type(plugin.sockets[0]), name))
+
+    return profiler
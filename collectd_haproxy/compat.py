@@ -2,6 +2,8 @@ import sys
 
 
 PY3 = sys.version_info >= (3,)
+# "async def" and "await" need python 3.5+
+PY35 = sys.version_info >= (3, 5)
 
 
 def iteritems(dictionary):
@@ -2,12 +2,44 @@ try:
     from cStringIO import StringIO
 except ImportError:  # pragma: no cover
     from io import StringIO  # pragma: no cover
+import csv
 import errno
+import json
+import re
 import socket
+import time
+
+from .compat import iteritems
 
 
 SOCKET_BUFFER_SIZE = 1024
 
+# matches the per-pool lines of "show pools" across HAProxy versions, e.g.
+#   - Pool pipe (32 bytes) : 5 allocated (160 bytes), 5 used, 0 failures, ...
+POOL_RE = re.compile(
+    r"^\s*- Pool (?P<name>\S+) \((?P<size>\d+) bytes\) : "
+    r"(?P<allocated>\d+) allocated \((?P<allocated_bytes>\d+) bytes\), "
+    r"(?P<used>\d+) used.*?(?P<failures>\d+) failures"
+)
+
+
+# "show stat" fields that aren't summed when aggregating across workers:
+# peaks take the highest value, fixed fields the first worker's value
+PEAK_STAT_FIELDS = frozenset([
+    "qmax", "smax", "rate_max", "req_rate_max", "conn_rate_max",
+    "qtime", "ctime", "rtime", "ttime",
+    "qtime_max", "ctime_max", "rtime_max", "ttime_max",
+])
+FIXED_STAT_FIELDS = frozenset([
+    "pid", "iid", "sid", "type", "status", "mode", "algo", "addr", "cookie",
+    "weight", "uweight", "act", "bck", "slim", "qlimit", "rate_lim",
+    "throttle", "tracked", "lastchg", "downtime", "lastsess",
+    "check_status", "check_code", "check_duration", "check_desc",
+    "check_rise", "check_fall", "check_health", "last_chk",
+    "agent_status", "agent_code", "agent_duration", "agent_desc",
+    "agent_rise", "agent_fall", "agent_health", "last_agt",
+])
+
 
 class HAProxySocket(object):
     """
@@ -18,7 +50,7 @@ class HAProxySocket(object):
     proxies/servers.
     """
 
-    def __init__(self, collectd, socket_file_path):
+    def __init__(self, collectd, socket_file_path, name=None):
         """
         The HAProxySocket constructor.
 
@@ -30,16 +62,38 @@ class HAProxySocket(object):
 
         :param socket_file_path: Full path to HAProxy's socket file.
         :type socket_file_path: str
+
+        :param name: Optional name of the instance behind the socket, used to
+            tell metrics apart when more than one socket is polled.
+        :type name: str
         """
         self.collectd = collectd
         self.socket_file_path = socket_file_path
+        self.name = name
 
-    def send_command(self, command):
+        self.max_response_bytes = None
+        self.truncated = False
+        self.recorder = None
+        self.cache = None
+        self.cache_ttl = 0
+
+    def reset(self):
         """
-        Sends a given command to the HAProxy socket.
+        Drops any state tied to the HAProxy process behind the socket, called
+        when that process has been reloaded.
 
-        Collects the response (it can arrive in chunks) and then calls the
-        `process_command_response` method on the result.
+        Plain sockets open a new connection per command so there's nothing to
+        drop, subclasses that hold on to connections or responses override
+        this.
+        """
+
+    def connect(self, command):
+        """
+        Opens a connection to the HAProxy socket and sends the given command.
+
+        Returns the connected socket.  Failures to connect (e.g. HAProxy
+        refusing the connection or the socket file being gone) are raised as
+        `IOError` for the caller to back off on.
 
         :param command: The command to send, e.g. "show stat"
         :type command: str
@@ -48,35 +102,139 @@ class HAProxySocket(object):
         sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         try:
             sock.connect(self.socket_file_path)
-        except IOError as e:
-            if e.errno == errno.ECONNREFUSED:
-                self.collectd.error("Connection refused.  Is HAProxy running?")
-                return
-            else:
-                raise
+        except IOError:
+            sock.close()
+            raise
 
         self.collectd.debug("Running command '%s'" % command)
 
         sock.sendall((command + "\n").encode())
 
-        buff = StringIO()
+        return sock
+
+    def gen_chunks(self, sock):
+        """
+        Generator that yields decoded chunks of a response as they arrive,
+        retrying on EAGAIN/EINTR and closing the socket once it's drained.
 
-        while True:
-            try:
-                chunk = sock.recv(SOCKET_BUFFER_SIZE)
-                if chunk:
-                    buff.write(chunk.decode("ascii"))
-                else:
+        :param sock: A connected socket with a command already sent.
+        :type sock: socket.socket
+        """
+        try:
+            while True:
+                try:
+                    chunk = sock.recv(SOCKET_BUFFER_SIZE)
+                except IOError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EINTR):
+                        raise
+                    continue
+                if not chunk:
                     break
-            except IOError as e:
-                if e.errno not in (errno.EAGAIN, errno.EINTR):
-                    raise
+                yield chunk.decode("ascii")
+        finally:
+            sock.close()
+
+    def send_command(self, command):
+        """
+        Sends a given command to the HAProxy socket.
+
+        Collects the response (it can arrive in chunks) and then calls the
+        `process_command_response` method on the result.
+
+        If `max_response_bytes` is set, reading stops once that many bytes
+        have arrived and the response is cut back to its last full line,
+        with the `truncated` flag set to let the caller know.
+
+        If a `recorder` (e.g. a `CaptureWriter`) is set the raw response is
+        recorded along with how long it took.
+
+        :param command: The command to send, e.g. "show stat"
+        :type command: str
+        """
+        start = time.time()
+        sock = self.connect(command)
+
+        buff = StringIO()
+        size = 0
+
+        chunks = self.gen_chunks(sock)
+        for chunk in chunks:
+            buff.write(chunk)
+            size += len(chunk)
+            if self.max_response_bytes and size >= self.max_response_bytes:
+                chunks.close()
+                break
 
-        sock.close()
         response = buff.getvalue()
         buff.close()
 
-        return self.process_command_response(command, response)
+        if self.recorder is not None:
+            self.recorder.record(command, response, time.time() - start)
+
+        return self.process_command_response(command, self.limit(response))
+
+    def limit(self, response):
+        """
+        Cuts a response down to `max_response_bytes`, dropping any partial
+        trailing line and setting the `truncated` flag if anything was cut.
+
+        :param response: The raw response.
+        :type response: str
+        """
+        if not self.max_response_bytes:
+            return response
+        if len(response) < self.max_response_bytes:
+            return response
+
+        self.truncated = True
+        response = response[:self.max_response_bytes]
+        return response[:response.rfind("\n") + 1]
+
+    def gen_response_lines(self, command):
+        """
+        Generator that sends a command and yields its response line by line
+        as it streams in.
+
+        Unlike `send_command()` the full response is never held in memory,
+        only the current partial line, which makes this suitable for dumps
+        that can run to millions of lines (e.g. "show table <name>").  As
+        memory use doesn't grow with the response, `max_response_bytes`
+        doesn't apply here.  If a `recorder` is set however the response is
+        held on to so that it can be recorded once complete.
+
+        :param command: The command to send, e.g. "show table foo"
+        :type command: str
+        """
+        start = time.time()
+        recorded = [] if self.recorder is not None else None
+        sock = self.connect(command)
+
+        chunks = self.gen_chunks(sock)
+        partial = ""
+        checked = False
+        try:
+            for chunk in chunks:
+                if recorded is not None:
+                    recorded.append(chunk)
+                lines = (partial + chunk).split("\n")
+                partial = lines.pop()
+                if lines and not checked:
+                    checked = True
+                    error_check = lines[0] + "\n"
+                    if not self.process_command_response(command, error_check):
+                        return
+                for line in lines:
+                    if line:
+                        yield line
+        finally:
+            chunks.close()
+            if recorded is not None:
+                self.recorder.record(
+                    command, "".join(recorded), time.time() - start
+                )
+
+        if partial:
+            yield partial
 
     def process_command_response(self, command, response):
         """
@@ -107,7 +265,7 @@ class HAProxySocket(object):
 
         These values represent stats for the whole HAProxy process.
         """
-        info_response = self.send_command("show info")
+        info_response = self.cached("show info", self.send_command)
         if not info_response:
             return
 
@@ -115,12 +273,171 @@ class HAProxySocket(object):
             label, value = line.split(": ")
             yield (label, value)
 
-    def gen_stats(self, include_frontends, include_backends, include_servers):
+    def gen_stat_rows(self, include_frontends, include_backends,
+                      include_servers, proxy_ids=None):
         """
-        Generator that yields (name, values) for individual proxies.
+        Generator that yields the raw "show stat" rows as lists of strings.
 
-        Each tuple has two items, the proxy and a dictionary mapping stat
-        field names to their respective values.
+        The first list yielded is the header, with the leading "# " stripped
+        from the first field name, so that callers can map field names to
+        column indexes once and then index into every following row.
+
+        If a list of proxy ids is given only those proxies are included, with
+        the commands for each pipelined over a single connection.
+
+        With a `cache` set the raw response is shared through it.  Frontend
+        and backend aggregates are then always fetched, so that readers
+        wanting different aggregates share the one response, and rows are
+        picked out here.  Server rows are only fetched for readers asking for
+        them, so that aggregate-only reads (e.g. for `ServerSampling`) stay
+        cheap.
+
+        :param include_frontends: Whether or not to include FRONTEND aggregate
+            stats.
+        :type include_frontends: bool
+
+        :param include_backends: Whether or not to include BACKEND aggregate
+            stats.
+        :type include_backends: bool
+
+        :param include_servers: Whether or not to include individual server
+            stats.
+        :type include_servers: bool
+
+        :param proxy_ids: Optional list of proxy ids ("iid") to limit to.
+        :type proxy_ids: list
+        """
+        kinds = self.shared_kinds(
+            include_frontends, include_backends, proxy_ids
+        )
+        shared = kinds is not None
+        command = self.stat_rows_command(
+            include_frontends or shared, include_backends or shared,
+            include_servers, proxy_ids
+        )
+
+        response = self.cached(command, self.send_command)
+        if not response:
+            return
+
+        fields = None
+        for header, row in split_stat_sections(response):
+            if row is None:
+                if fields is None:
+                    fields = header
+                    svname_index = fields.index("svname") if kinds else None
+                    yield fields
+                matched = header == fields
+                continue
+            if not matched:
+                continue
+            if kinds and not kinds.get(row[svname_index], include_servers):
+                continue
+            yield row
+
+    def shared_kinds(self, include_frontends, include_backends, proxy_ids):
+        """
+        Returns the {svname: wanted} filter for picking the wanted aggregate
+        rows out of a "show stat" response shared through the `cache`, which
+        always has both frontends and backends, or `None` if the response
+        isn't shared (no cache, or limited to given proxy ids).
+
+        :param include_frontends: Whether or not to include FRONTEND aggregate
+            stats.
+        :type include_frontends: bool
+
+        :param include_backends: Whether or not to include BACKEND aggregate
+            stats.
+        :type include_backends: bool
+
+        :param proxy_ids: Optional list of proxy ids ("iid") to limit to.
+        :type proxy_ids: list
+        """
+        if self.cache is None or proxy_ids:
+            return None
+
+        return {"FRONTEND": include_frontends, "BACKEND": include_backends}
+
+    def stat_rows_command(self, include_frontends, include_backends,
+                          include_servers, proxy_ids=None):
+        """
+        Returns the "show stat" command `gen_stat_rows()` sends for the given
+        kinds of proxy stats and proxy ids (barring the rewrite for a shared
+        `cache`), with the commands for each proxy id pipelined.
+
+        :param include_frontends: Whether or not to include FRONTEND aggregate
+            stats.
+        :type include_frontends: bool
+
+        :param include_backends: Whether or not to include BACKEND aggregate
+            stats.
+        :type include_backends: bool
+
+        :param include_servers: Whether or not to include individual server
+            stats.
+        :type include_servers: bool
+
+        :param proxy_ids: Optional list of proxy ids ("iid") to limit to.
+        :type proxy_ids: list
+        """
+        return "; ".join([
+            self.stat_command(
+                include_frontends, include_backends, include_servers, iid
+            )
+            for iid in proxy_ids or [-1]
+        ])
+
+    def cached(self, command, func):
+        """
+        Returns `func(command)`, through the shared `cache` if one is set so
+        that other readers of this socket asking for the same command within
+        `cache_ttl` seconds, or at the same time, share the result.
+
+        Whether the response was truncated is cached along with it, so that
+        every reader sharing a cut-off response gets its `truncated` flag
+        set, not just the one that fetched it.
+
+        :param command: The command the result is for.
+        :type command: str
+
+        :param func: The function fetching the result for the command.
+        :type func: function
+        """
+        if self.cache is None:
+            return func(command)
+
+        response, truncated = self.cache.fetch(
+            (self.socket_file_path, command), self.cache_ttl,
+            self.fetch_flagged, command, func
+        )
+        if truncated:
+            self.truncated = True
+
+        return response
+
+    def fetch_flagged(self, command, func):
+        """
+        Returns a (`func(command)`, truncated) tuple, with truncated being
+        whether that response in particular was cut short.
+
+        :param command: The command the result is for.
+        :type command: str
+
+        :param func: The function fetching the result for the command.
+        :type func: function
+        """
+        already_truncated, self.truncated = self.truncated, False
+        try:
+            response = func(command)
+            return response, self.truncated
+        finally:
+            self.truncated = self.truncated or already_truncated
+
+    def stat_command(self, include_frontends, include_backends,
+                     include_servers, proxy_id=-1):
+        """
+        Returns the "show stat" command for the given kinds of proxy stats,
+        optionally limited to a single proxy.
 
         :param include_frontends: Whether or not to include FRONTEND aggregate
             stats.
@@ -133,6 +450,9 @@ class HAProxySocket(object):
         :param include_servers: Whether or not to include individual server
             stats.
         :type include_servers: bool
+
+        :param proxy_id: The proxy id ("iid") to limit to, -1 for all.
+        :type proxy_id: int
         """
         # the "type filter" is the second param to "show stat", the values
         # are OR'ed together.
@@ -144,18 +464,653 @@ class HAProxySocket(object):
         if include_servers:
             type_filter += 4
 
-        stats_response = self.send_command("show stat -1 %d -1" % type_filter)
-        if not stats_response:
+        return "show stat %s %d -1" % (proxy_id, type_filter)
+
+    def gen_stats(self, include_frontends, include_backends, include_servers):
+        """
+        Generator that yields (name, values) for individual proxies.
+
+        Each tuple has two items, the proxy and a dictionary mapping stat
+        field names to their respective values.
+
+        :param include_frontends: Whether or not to include FRONTEND aggregate
+            stats.
+        :type include_frontends: bool
+
+        :param include_backends: Whether or not to include BACKEND aggregate
+            stats.
+        :type include_backends: bool
+
+        :param include_servers: Whether or not to include individual server
+            stats.
+        :type include_servers: bool
+        """
+        rows = self.gen_stat_rows(
+            include_frontends, include_backends, include_servers
+        )
+        fields = next(rows, None)
+        if fields is None:
             return
 
-        lines = stats_response.split("\n")
-        fields = lines.pop(0).split(",")
         # the first field is the proxy name, which we key off of so
         # it's not included in individual instance records
-        fields.pop(0)
+        fields = fields[1:]
+
+        for values in rows:
+            yield (values[0], dict(zip(fields, values[1:])))
+
+    def gen_server_state_rows(self, backend=None):
+        """
+        Generator that yields the raw "show servers state" rows as lists.
+
+        The output is a version line, a "# "-prefixed space-separated header
+        and then one space-separated line per server.  The first list yielded
+        is the header so callers can resolve column indexes once, every
+        following list is a server row.  Rows are only split as far as the
+        last header column, so trailing free-form fields never shift columns.
+
+        :param backend: Optional backend name or id to limit the output to.
+        :type backend: str
+        """
+        command = "show servers state"
+        if backend is not None:
+            command += " %s" % backend
+
+        response = self.send_command(command)
+        if not response:
+            return
+
+        lines = response.split("\n")
+        # skip the version line
+        while lines and not lines[0].startswith("#"):
+            lines.pop(0)
+        if not lines:
+            return
+
+        fields = lines.pop(0)[1:].split()
+        max_split = len(fields) - 1
+
+        yield fields
 
         for line in lines:
-            values = line.split(",")
-            proxy_name = values.pop(0)
+            if line and not line.startswith("#"):
+                yield line.split(" ", max_split)
+
+    def gen_pools(self):
+        """
+        Generator that yields (name, values) tuples for HAProxy memory pools.
+
+        The values are a dictionary of "pool_size", "pool_allocated",
+        "pool_allocated_bytes", "pool_used" and "pool_failures" taken from
+        the "show pools" output.
+        """
+        response = self.send_command("show pools")
+        if not response:
+            return
+
+        for line in response.split("\n"):
+            match = POOL_RE.match(line)
+            if not match:
+                continue
+
+            values = match.groupdict()
+            name = values.pop("name")
+
+            yield (
+                name,
+                dict(
+                    ("pool_" + label, value)
+                    for label, value in iteritems(values)
+                )
+            )
+
+    def gen_activity(self):
+        """
+        Generator that yields (name, values) tuples from "show activity".
+
+        The values are a list with one entry per thread.  Newer HAProxy
+        versions prefix the per-thread values with a total and wrap them in
+        brackets (e.g. "loops: 2010 [ 1005 1005 ]") while 1.9 only lists the
+        per-thread values, both are handled.  Lines without per-thread
+        numeric values (e.g. "date_now") are skipped.
+        """
+        response = self.send_command("show activity")
+        if not response:
+            return
+
+        for line in response.split("\n"):
+            label, _, rest = line.partition(":")
+            tokens = rest.split()
+            if "[" in tokens:
+                tokens = tokens[tokens.index("[") + 1:]
+                if "]" in tokens:
+                    tokens = tokens[:tokens.index("]")]
+
+            values = [token.lstrip("~") for token in tokens]
+            if not values or not all(value.isdigit() for value in values):
+                continue
+
+            yield (label.strip(), values)
+
+    def gen_tables(self):
+        """
+        Generator that yields (name, details) tuples for HAProxy stick tables.
+
+        The details are a dictionary of the header fields "show table" gives
+        for each table, e.g. {"type": "ip", "size": "102400", "used": "3"}.
+        """
+        for line in self.gen_response_lines("show table"):
+            if not line.startswith("# table: "):
+                continue
+
+            name, details = parse_table_header(line)
+
+            yield (name, details)
+
+    def gen_table_entries(self, table, data_filter=None):
+        """
+        Generator that yields (key, data) tuples for the entries of a given
+        stick table.
+
+        Entries are parsed as they stream in, so arbitrarily large tables
+        can be walked with bounded memory.  The optional `data_filter` is
+        passed through to HAProxy (e.g. "data.http_req_rate gt 100") so
+        that only the interesting entries are sent at all.
+
+        :param table: The name of the stick table.
+        :type table: str
+
+        :param data_filter: Optional HAProxy "data.<type> <op> <value>"
+            filter expression.
+        :type data_filter: str
+        """
+        command = "show table %s" % table
+        if data_filter:
+            command += " " + data_filter
+
+        for line in self.gen_response_lines(command):
+            if line.startswith("#"):
+                continue
+
+            yield parse_table_entry(line)
+
+
+class MasterSocket(HAProxySocket):
+    """
+    An `HAProxySocket` talking to the master CLI of an HAProxy (1.8+) in
+    master-worker mode, which reaches each worker through one socket.
+
+    The current workers are discovered with "show proc" and "show stat" is
+    pipelined to all of them over a single connection (using "@!<pid>"
+    command prefixes), with the results merged together per proxy/server as
+    per `aggregate_stat_rows()`.  Any other command is sent to the first
+    worker, as workers share their configuration.
+    """
+
+    def __init__(self, collectd, socket_file_path, name=None):
+        """
+        The MasterSocket constructor.
+
+        :param collectd: The collectd module.
+        :type collectd: module
+
+        :param socket_file_path: Full path to HAProxy's master socket file.
+        :type socket_file_path: str
+
+        :param name: Optional name of the instance behind the socket.
+        :type name: str
+        """
+        super(MasterSocket, self).__init__(
+            collectd, socket_file_path, name=name
+        )
+
+        self.workers = []
+
+    def reset(self):
+        """
+        Forgets the known workers so that they are rediscovered.
+        """
+        super(MasterSocket, self).reset()
+        self.workers = []
+
+    def send_master_command(self, command):
+        """
+        Sends a command to the master process itself.
+
+        :param command: The command to send, e.g. "show proc"
+        :type command: str
+        """
+        return super(MasterSocket, self).send_command(command)
+
+    def send_command(self, command):
+        """
+        Sends a given command to the first worker process, discovering the
+        workers first if need be.
+
+        :param command: The command to send, e.g. "show info"
+        :type command: str
+        """
+        if not self.workers:
+            self.discover()
+        if not self.workers:
+            return
+
+        return self.send_master_command(
+            "@!%s %s" % (self.workers[0], command)
+        )
+
+    def gen_response_lines(self, command):
+        """
+        Generator that streams the response to a command from the first
+        worker process, line by line.
+
+        :param command: The command to send, e.g. "show table foo"
+        :type command: str
+        """
+        if not self.workers:
+            self.discover()
+        if not self.workers:
+            return iter([])
+
+        return super(MasterSocket, self).gen_response_lines(
+            "@!%s %s" % (self.workers[0], command)
+        )
+
+    def process_command_response(self, command, response):
+        """
+        Handles the master CLI's error for an unknown worker pid (the worker
+        exited) on top of the usual response handling, forgetting the known
+        workers so that they are rediscovered.
+
+        :param command: The command that was run.
+        :type command: str
+
+        :param response: The full response string from running the command.
+        :type response: str
+        """
+        if response.startswith("Can't find the target"):
+            self.collectd.warning("Worker went away: %s" % response.strip())
+            self.workers = []
+            return ""
+
+        return super(MasterSocket, self).process_command_response(
+            command, response
+        )
+
+    def discover(self):
+        """
+        Refreshes the list of current worker pids via "show proc".
+        """
+        self.workers = parse_worker_pids(
+            self.send_master_command("show proc") or ""
+        )
+
+    def stat_rows_command(self, include_frontends, include_backends,
+                          include_servers, proxy_ids=None):
+        """
+        Returns the master CLI command `gen_stat_rows()` sends, i.e. the
+        "show stat" command(s) pipelined to each of the current workers.
+
+        :param include_frontends: Whether or not to include FRONTEND aggregate
+            stats.
+        :type include_frontends: bool
+
+        :param include_backends: Whether or not to include BACKEND aggregate
+            stats.
+        :type include_backends: bool
+
+        :param include_servers: Whether or not to include individual server
+            stats.
+        :type include_servers: bool
+
+        :param proxy_ids: Optional list of proxy ids ("iid") to limit to.
+        :type proxy_ids: list
+        """
+        commands = [
+            self.stat_command(
+                include_frontends, include_backends, include_servers, iid
+            )
+            for iid in proxy_ids or [-1]
+        ]
+
+        return "; ".join(
+            "@!%s %s" % (pid, command)
+            for pid in self.workers for command in commands
+        )
+
+    def gen_stat_rows(self, include_frontends, include_backends,
+                      include_servers, proxy_ids=None):
+        """
+        Generator that yields the "show stat" header and then the rows
+        aggregated across all current worker processes.
+
+        The workers are rediscovered first, so the set of workers polled
+        keeps up as they come and go.
+
+        :param include_frontends: Whether or not to include FRONTEND aggregate
+            stats.
+        :type include_frontends: bool
+
+        :param include_backends: Whether or not to include BACKEND aggregate
+            stats.
+        :type include_backends: bool
+
+        :param include_servers: Whether or not to include individual server
+            stats.
+        :type include_servers: bool
+
+        :param proxy_ids: Optional list of proxy ids ("iid") to limit to.
+        :type proxy_ids: list
+        """
+        self.discover()
+        if not self.workers:
+            return
+
+        kinds = self.shared_kinds(
+            include_frontends, include_backends, proxy_ids
+        )
+        shared = kinds is not None
+        stats_response = self.cached(self.stat_rows_command(
+            include_frontends or shared, include_backends or shared,
+            include_servers, proxy_ids
+        ), self.send_master_command)
+        if not stats_response:
+            return
+
+        # the rows are needed all at once to aggregate them
+        sections = []
+        for header, row in split_stat_sections(stats_response):
+            if row is None:
+                sections.append((header, []))
+            else:
+                sections[-1][1].append(row)
+        if not sections:
+            return
+
+        fields = sections[0][0]
+        matched = [rows for header, rows in sections if header == fields]
+        if len(matched) < len(sections):
+            self.collectd.warning(
+                "Skipped %d worker response(s) with mismatched stat fields" % (
+                    len(sections) - len(matched)
+                )
+            )
+
+        yield fields
+
+        width = len(fields)
+        svname_index = fields.index("svname") if kinds else None
+        for row in aggregate_stat_rows(fields, [
+                [row for row in rows if len(row) == width] for rows in matched
+        ]):
+            if kinds and not kinds.get(row[svname_index], include_servers):
+                continue
+            yield row
+
+
+class PayloadSocket(HAProxySocket):
+    """
+    An `HAProxySocket` that answers commands from a recorded payload rather
+    than a live HAProxy.
+
+    The payload is a JSON object mapping command strings to their raw
+    responses, e.g. {"show info": "Name: HAProxy\\n...", ...}.
+    """
+
+    def __init__(self, collectd, payload_file_path, name=None):
+        """
+        The PayloadSocket constructor.
+
+        :param collectd: The collectd module.
+        :type collectd: module
+
+        :param payload_file_path: Path to the JSON payload file.
+        :type payload_file_path: str
+
+        :param name: Optional name of the instance the payload came from.
+        :type name: str
+        """
+        super(PayloadSocket, self).__init__(
+            collectd, payload_file_path, name=name
+        )
+
+        with open(payload_file_path) as fd:
+            self.responses = json.load(fd)
+
+    def send_command(self, command):
+        """
+        Returns the recorded response for a given command.
+
+        :param command: The command to "send", e.g. "show stat -1 7 -1"
+        :type command: str
+        """
+        response = self.responses.get(command)
+        if response is None:
+            self.collectd.error("No recorded response for '%s'" % command)
+            return
+
+        return self.process_command_response(command, response)
+
+    def gen_response_lines(self, command):
+        """
+        Generator that yields the lines of the recorded response for a given
+        command.
+
+        :param command: The command to "send", e.g. "show table foo"
+        :type command: str
+        """
+        response = self.send_command(command)
+        if not response:
+            return
+
+        for line in response.split("\n"):
+            if line:
+                yield line
+
+
+def split_stat_sections(response):
+    """
+    Generator that splits a (possibly pipelined) "show stat" response into
+    (fields, row) tuples line by line, where fields is the header of the
+    section the row is in, with the leading "# " stripped from the first
+    field name.  Each "# pxname,..." header line itself is yielded as
+    (fields, None), so that sections without rows still show up.
+
+    Lines are only sliced out and tokenized as they're asked for, so a
+    reader that stops early (e.g. at `MaxRows`) doesn't pay for parsing the
+    rest, and neither a list of every line nor of every row is built up.
+    Rows are tokenized as per `split_csv_line()`, so free-text fields quoted
+    for containing commas (e.g. `check_desc` or `cookie`) stay in one piece.
+
+    :param response: The "show stat" response.
+    :type response: str
+    """
+    fields = None
+    start = 0
+    end = len(response)
+    while start < end:
+        stop = response.find("\n", start)
+        if stop < 0:
+            stop = end
+        line = response[start:stop]
+        start = stop + 1
+
+        if line.startswith("#"):
+            fields = line.split(",")
+            fields[0] = fields[0].lstrip("# ")
+            yield fields, None
+        elif not line or fields is None:
+            continue
+        elif '"' in line:
+            yield fields, split_csv_line(line)
+        else:
+            # split_csv_line()'s fast path, inlined as this is the hot loop
+            yield fields, line.split(",")
+
+
+def split_csv_line(line):
+    """
+    Splits a line of HAProxy's CSV output into its fields.
+
+    HAProxy only quotes a field when it contains a comma or a double quote
+    (doubling the latter) and flattens newlines, so lines without any
+    double quote, i.e. nearly all of them, are split with a plain (and much
+    faster) `str.split()`.  Only lines with a quoted field go through the
+    `csv` module.
+
+    :param line: The CSV line.
+    :type line: str
+    """
+    if '"' not in line:
+        return line.split(",")
+
+    return next(csv.reader([line]))
+
+
+def parse_worker_pids(response):
+    """
+    Parses the response to the master CLI's "show proc" into the list of
+    current worker pids, leaving out the master, old (draining) workers and
+    external programs.
+
+    e.g. for::
+
+        #<PID>          <type>          <reloads>       <uptime>
+        1162            master          0               0d00h00m08s
+        # workers
+        1271            worker          1               0d00h00m00s
+        # old workers
+        1233            worker          3               0d00h00m43s
+
+    yields ["1271"].
+
+    :param response: The "show proc" response.
+    :type response: str
+    """
+    pids = []
+    for line in response.split("\n"):
+        if line.startswith("# old workers") or line.startswith("# programs"):
+            break
+        parts = line.split()
+        if len(parts) > 1 and parts[1] == "worker":
+            pids.append(parts[0])
+
+    return pids
+
+
+def aggregate_stat_rows(fields, sections):
+    """
+    Merges the "show stat" rows from several worker processes into one row
+    per proxy/server, in order of first appearance.
+
+    Counters and current values are summed, fields in `PEAK_STAT_FIELDS`
+    take the highest value and those in `FIXED_STAT_FIELDS` (identifiers,
+    settings, states and timestamps) take the first worker's value.
+
+    :param fields: The "show stat" header field names.
+    :type fields: list
+
+    :param sections: A list of lists of rows, one list per worker.
+    :type sections: list
+    """
+    summed = []
+    peaks = []
+    for index, field in enumerate(fields):
+        if index < 2 or field in FIXED_STAT_FIELDS:
+            continue
+        if field in PEAK_STAT_FIELDS:
+            peaks.append(index)
+        else:
+            summed.append(index)
+
+    merged = {}
+    order = []
+    for rows in sections:
+        for row in rows:
+            key = (row[0], row[1])
+            totals = merged.get(key)
+            if totals is None:
+                merged[key] = list(row)
+                order.append(key)
+                continue
+
+            merge_stat_row(totals, row, summed, peaks)
+
+    return [merged[key] for key in order]
+
+
+def merge_stat_row(totals, row, summed, peaks):
+    """
+    Merges one worker's "show stat" row into the running totals for the same
+    proxy/server, in place.
+
+    :param totals: The running totals row.
+    :type totals: list
+
+    :param row: The row to merge in.
+    :type row: list
+
+    :param summed: The indexes of the fields to sum.
+    :type summed: list
+
+    :param peaks: The indexes of the fields to take the highest value of.
+    :type peaks: list
+    """
+    for index in summed:
+        if row[index].isdigit() and totals[index].isdigit():
+            totals[index] = str(int(totals[index]) + int(row[index]))
+        elif row[index] and not totals[index]:
+            totals[index] = row[index]
+    for index in peaks:
+        if row[index].isdigit() and (
+                not totals[index].isdigit() or
+                int(row[index]) > int(totals[index])):
+            totals[index] = row[index]
+
+
+def parse_table_header(line):
+    """
+    Parses a "show table" header line into a (name, details) tuple.
+
+    e.g. "# table: be_rl, type: ip, size:102400, used:3" yields
+    ("be_rl", {"type": "ip", "size": "102400", "used": "3"})
+
+    :param line: The header line.
+    :type line: str
+    """
+    parts = line[len("# table: "):].split(",")
+    name = parts.pop(0).strip()
+
+    details = {}
+    for part in parts:
+        label, _, value = part.partition(":")
+        details[label.strip()] = value.strip()
+
+    return (name, details)
+
+
+def parse_table_entry(line):
+    """
+    Parses a "show table <name>" entry line into a (key, data) tuple.
+
+    e.g. "0x55d4c8e2f0a8: key=10.0.0.1 use=0 exp=59990 gpc0=0
+    http_req_rate(10000)=5" yields ("10.0.0.1", {"use": "0", "exp": "59990",
+    "gpc0": "0", "http_req_rate": "5"}).  Any period in parenthesis on a
+    data type is dropped.
+
+    :param line: The entry line.
+    :type line: str
+    """
+    key = None
+    data = {}
+    for part in line.split(" ")[1:]:
+        label, _, value = part.partition("=")
+        if label == "key":
+            key = value
+            continue
+        paren = label.find("(")
+        if paren != -1:
+            label = label[:paren]
+        data[label] = value
 
-            yield (proxy_name, dict(zip(fields, values)))
+    return (key, data)
@@ -0,0 +1,173 @@
+import os
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+PACKAGE_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "*")
+
+
+class MemoryTracer(object):
+    """
+    Accounts for the memory allocated during each phase of a read, using the
+    `tracemalloc` module (python 3.4+).
+
+    Each phase (i.e. collector method) is wrapped so that the bytes it left
+    allocated and, on python 3.9+, its peak usage are tallied.  At the end of
+    a read the plugin's own top allocation sites for the whole read (e.g. the
+    lines receiving, splitting and dispatching "show stat" responses) are
+    found by comparing snapshots taken at either end of it.
+    """
+
+    def __init__(self, top=10, path=None, frames=1):
+        """
+        The MemoryTracer constructor.
+
+        :param top: The number of top allocation sites to keep per read.
+        :type top: int
+
+        :param path: Optional path of a file to append each read's report to.
+        :type path: str
+
+        :param frames: The number of stack frames to record per allocation.
+        :type frames: int
+        """
+        self.top = top
+        self.path = path
+        self.frames = frames
+
+        self.filename_pattern = PACKAGE_FILES
+
+        self.phases = {}
+        self.sites = []
+        self.snapshot = None
+        self.started = None
+
+    @staticmethod
+    def available():
+        """
+        Returns whether `tracemalloc` is available in this python.
+        """
+        return tracemalloc is not None
+
+    def begin(self):
+        """
+        Starts accounting for a read, starting `tracemalloc` itself on the
+        first call.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+        self.phases = {}
+        self.sites = []
+        if self.top or self.path:
+            self.snapshot = self.take_snapshot()
+        self.started = tracemalloc.get_traced_memory()[0]
+        self.reset_peak()
+
+    def wrap(self, collectors):
+        """
+        Returns the given collector methods wrapped so that each call is
+        accounted for under the method's name.
+
+        :param collectors: The collector methods.
+        :type collectors: list
+        """
+        def wrapped(collector):
+
+            def measured(*args):
+                return self.measure(collector.__name__, collector, *args)
+
+            return measured
+
+        return [wrapped(collector) for collector in collectors]
+
+    def measure(self, phase, func, *args):
+        """
+        Calls a function and adds the bytes it left allocated and its peak
+        usage to the totals for a phase.
+
+        :param phase: The name of the phase, e.g. "collect_stats".
+        :type phase: str
+
+        :param func: The function to call.
+        :type func: function
+
+        :param args: The arguments to call the function with.
+        :type args: tuple
+        """
+        before = tracemalloc.get_traced_memory()[0]
+        self.reset_peak()
+        try:
+            return func(*args)
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            totals = self.phases.setdefault(phase, [0, 0])
+            totals[0] += current - before
+            totals[1] = max(totals[1], peak - before)
+
+    def end(self):
+        """
+        Finishes accounting for a read, adding the "read" phase totals and
+        working out the top allocation sites, then dumping the report if a
+        path is set.
+
+        Returns the dictionary of phase name to [allocated bytes, peak
+        bytes].
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        self.phases["read"] = [
+            current - self.started, max(
+                [peak - self.started] +
+                [totals[1] for totals in self.phases.values()]
+            )
+        ]
+
+        if self.snapshot is not None:
+            stats = self.take_snapshot().compare_to(self.snapshot, "lineno")
+            self.sites = [
+                (str(stat.traceback[0]), stat.size_diff, stat.count_diff)
+                for stat in stats[:self.top or None]
+            ]
+            self.snapshot = None
+
+        if self.path:
+            self.dump()
+
+        return self.phases
+
+    def take_snapshot(self):
+        """
+        Takes a `tracemalloc` snapshot limited to the files matching
+        `filename_pattern` (the plugin's own files by default).
+        """
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(True, self.filename_pattern)
+        ])
+
+    def reset_peak(self):
+        """
+        Resets the traced peak, where supported (python 3.9+), otherwise
+        peaks are measured from when tracing started.
+        """
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def dump(self):
+        """
+        Appends the report for the last read to the file at `path`.
+        """
+        with open(self.path, "a") as output:
+            output.write("# read at %s\n" % time.strftime("%Y-%m-%dT%H:%M:%S"))
+            output.write("%-24s %14s %14s\n" % ("phase", "allocated", "peak"))
+            for phase in sorted(self.phases):
+                allocated, peak = self.phases[phase]
+                output.write("%-24s %14d %14d\n" % (phase, allocated, peak))
+            if self.sites:
+                output.write("%-60s %14s %10s\n" % ("site", "bytes", "blocks"))
+            for site, size, count in self.sites:
+                output.write("%-60s %14d %10d\n" % (site, size, count))
+            output.write("\n")
@@ -1,3 +1,6 @@
+import threading
+
+from .compat import iteritems, coerce_long
 
 
 # a metric cross reference:
@@ -92,4 +95,437 @@ METRIC_XREF = {
     "ctime": ("avg_connect_time", "gauge"),
     "rtime": ("avg_response_time", "gauge"),
     "ttime": ("avg_total_session_time", "gauge"),
+    # string columns, reported as numbers via `STAT_ENUMS`
+    "status": ("status", "gauge"),
+    "check_status": ("last_check_status", "gauge"),
+    "agent_status": ("last_agent_status", "gauge"),
+    "mode": ("proxy_mode", "gauge"),
+    "type": ("proxy_type", "gauge"),
+
+    # metrics from the "show servers state" command, all enumerated numeric
+    # states, see the HAProxy management guide for the meaning of each value
+    "srv_op_state": ("operational_state", "gauge"),
+    "srv_admin_state": ("admin_state", "gauge"),
+    "srv_uweight": ("user_weight", "gauge"),
+    "srv_iweight": ("initial_weight", "gauge"),
+    "srv_time_since_last_change": ("seconds_since_last_change", "gauge"),
+    "srv_check_status": ("check_status", "gauge"),
+    "srv_check_result": ("check_result", "gauge"),
+    "srv_check_health": ("check_health", "gauge"),
+    "srv_check_state": ("check_state", "gauge"),
+    "srv_agent_state": ("agent_state", "gauge"),
+
+    # metrics from the "show pools" command (prefixed, since these are parsed
+    # out of free-form lines rather than named fields)
+    "pool_size": ("pool_item_size_bytes", "gauge"),
+    "pool_allocated": ("pool_allocated", "gauge"),
+    "pool_allocated_bytes": ("pool_allocated_bytes", "gauge"),
+    "pool_used": ("pool_used", "gauge"),
+    "pool_failures": ("pool_failure_count", "counter"),
+
+    # per-thread metrics from the "show activity" command (1.9+)
+    "loops": ("loop_count", "counter"),
+    "wake_cache": ("wake_cache_count", "counter"),
+    "wake_tasks": ("wake_tasks_count", "counter"),
+    "wake_signal": ("wake_signal_count", "counter"),
+    "poll_exp": ("poll_expired_count", "counter"),
+    "poll_drop": ("poll_drop_count", "counter"),
+    "poll_dead": ("poll_dead_count", "counter"),
+    "poll_skip": ("poll_skip_count", "counter"),
+    "fd_skip": ("fd_skip_count", "counter"),
+    "fd_lock": ("fd_lock_count", "counter"),
+    "fd_del": ("fd_del_count", "counter"),
+    "conn_dead": ("dead_connection_count", "counter"),
+    "stream": ("stream_count", "counter"),
+    "empty_rq": ("empty_run_queue_count", "counter"),
+    "long_rq": ("long_run_queue_count", "counter"),
+
+    # metrics from the "show table" command
+    "size": ("table_size", "gauge"),
+    "used": ("table_used", "gauge"),
 }
+
+# "show info" fields that only change when HAProxy restarts/reloads (or on
+# rare runtime changes such as "set maxconn global"), these are cached and only
+# re-sent on change, reload or heartbeat rather than every interval
+STATIC_INFO_FIELDS = frozenset([
+    "Nbproc",
+    "Process_num",
+    "Pid",
+    "Memmax_MB",
+    "Maxsock",
+    "Maxconn",
+    "Hard_maxconn",
+    "MaxSslConns",
+    "Maxpipes",
+    "ConnRateLimit",
+    "SessRateLimit",
+    "SslRateLimit",
+    "CompressBpsRateLim",
+])
+
+
+# HAProxy's own numbering of check results (the HCHK_STATUS_* values), as
+# also used by the "srv_check_status" field of "show servers state"
+CHECK_STATUSES = {
+    "UNK": 0,
+    "INI": 1,
+    "STRT": 2,
+    "HANA": 3,
+    "SOCKERR": 4,
+    "L4OK": 5,
+    "L4TOUT": 6,
+    "L4CON": 7,
+    "L6OK": 8,
+    "L6TOUT": 9,
+    "L6RSP": 10,
+    "L7TOUT": 11,
+    "L7RSP": 12,
+    "L7OK": 13,
+    "L7OKC": 14,
+    "L7STS": 15,
+    "PROCERR": 16,
+    "PROCTOUT": 17,
+    "PROCOK": 18,
+}
+
+
+# string to number tables for the string-valued "show stat" columns
+STAT_ENUMS = {
+    "status": {
+        "DOWN": 0,
+        "UP": 1,
+        "MAINT": 2,
+        "DRAIN": 3,
+        "NOLB": 4,
+        "no check": 5,
+        # frontend and listener statuses
+        "STOP": 0,
+        "OPEN": 1,
+        "FULL": 6,
+    },
+    "check_status": CHECK_STATUSES,
+    "agent_status": CHECK_STATUSES,
+    "mode": {
+        "tcp": 0,
+        "http": 1,
+        "health": 2,
+        "cli": 3,
+        "syslog": 4,
+        "peers": 5,
+    },
+}
+
+# the server census type instances, indexed by server "status" enum value
+SERVER_CENSUS = (
+    "servers_down",
+    "servers_up",
+    "servers_maint",
+    "servers_drain",
+    "servers_nolb",
+    "servers_no_check",
+)
+
+
+def to_long(value):
+    """
+    Converts a numeric "show stat" field to a long, with empty fields
+    counting as zero.  Non-numeric values convert to `None`, like unknown
+    `Enum` values, so that they're skipped rather than the whole row.
+
+    :param value: The raw field value.
+    :type value: str
+    """
+    if not value:
+        return 0
+
+    try:
+        return coerce_long(value)
+    except ValueError:
+        return None
+
+
+class Enum(object):
+    """
+    Converter for a string-valued field, looking values up in a fixed table.
+
+    Decorated variants of the known values (e.g. "UP 1/3" while a server is
+    going down, "MAINT(via)" or "* L7OK" while a check is running) are
+    resolved to the value they decorate the first time they're seen and then
+    cached in the table.  Unknown values convert to `None`.
+    """
+
+    def __init__(self, table):
+        """
+        The Enum constructor.
+
+        :param table: Dictionary of string value to number.
+        :type table: dict
+        """
+        self.table = dict(table)
+
+    def __call__(self, value):
+        """
+        Returns the number for a given string value, or `None`.
+
+        :param value: The raw field value.
+        :type value: str
+        """
+        number = self.table.get(value)
+        if number is not None or not value:
+            return number
+
+        base = value.lstrip("* ").split(" ", 1)[0].split("(", 1)[0]
+        number = self.table.get(base)
+        if number is not None:
+            self.table[value] = number
+
+        return number
+
+
+class ServerCensus(object):
+    """
+    Tally of the servers of each backend by state, built up from "show stat"
+    rows as they go by.
+    """
+
+    def __init__(self, fields, status_enum):
+        """
+        The ServerCensus constructor.
+
+        :param fields: The "show stat" header field names, which must include
+            "svname" and "status".
+        :type fields: list
+
+        :param status_enum: The converter for "status" values.
+        :type status_enum: Enum
+        """
+        self.svname_index = fields.index("svname")
+        self.status_index = fields.index("status")
+        self.status_enum = status_enum
+
+        self.counts = {}
+
+    def add(self, row):
+        """
+        Counts a server row's status, returning `True` if the row was a
+        server's and `False` for frontend and backend rows.
+
+        :param row: The row's field values.
+        :type row: list
+        """
+        if row[self.svname_index] in ("FRONTEND", "BACKEND"):
+            return False
+
+        counts = self.counts.get(row[0])
+        if counts is None:
+            counts = self.counts[row[0]] = [0] * len(SERVER_CENSUS)
+        state = self.status_enum(row[self.status_index])
+        if state is not None and state < len(counts):
+            counts[state] += 1
+
+        return True
+
+
+def compile_xref(xref, overrides):
+    """
+    Returns a copy of a metric cross reference with user overrides applied.
+
+    Each override is keyed by HAProxy field name and is a dict that may have
+    a "type_instance" (to add or rename a metric), a "type" (to add or retype
+    one) and/or a "drop" flag (to ignore the field altogether).  Fields not
+    already in the cross reference default to being a "gauge" named after the
+    field itself.
+
+    Since the result is just another cross reference, overridden fields are
+    compiled into the registry's plans same as the built-in ones.
+
+    :param xref: The base metric cross reference, e.g. `METRIC_XREF`.
+    :type xref: dict
+
+    :param overrides: Dictionary of field name to override options.
+    :type overrides: dict
+    """
+    compiled = dict(xref)
+    for field, override in iteritems(overrides):
+        if override.get("drop"):
+            compiled.pop(field, None)
+            continue
+
+        type_instance, metric_type = compiled.get(field, (field, "gauge"))
+        compiled[field] = (
+            override.get("type_instance", type_instance),
+            override.get("type", metric_type),
+        )
+
+    return compiled
+
+
+class MetricRegistry(object):
+    """
+    Lazy registry of `collectd.Values` instances.
+
+    Rather than building a `collectd.Values` for every known metric up front,
+    instances are only created the first time HAProxy actually reports the
+    matching field.  For "show stat" responses the registry also compiles the
+    header line into a "plan" so rows can be dispatched by column index
+    without any per-value dictionary lookups, each column paired with the
+    converter for its values (an `Enum` for string-valued columns).
+
+    Every thread gets its own pool of `collectd.Values` and plans, so that
+    collection paths running concurrently (e.g. several plugin instances or
+    background threads) never share a `Values` instance and can dispatch
+    without locking.  Clearing the registry from any thread drops every
+    thread's pool.
+    """
+
+    def __init__(self, collectd, plugin_name, xref, enums=None):
+        """
+        The MetricRegistry constructor.
+
+        :param collectd: The collectd module.
+        :type collectd: module
+
+        :param plugin_name: The plugin name passed along to `collectd.Values`.
+        :type plugin_name: str
+
+        :param xref: Metric cross reference of the same shape as
+            `METRIC_XREF`.
+        :type xref: dict
+
+        :param enums: Optional dictionary of field name to string-to-number
+            table for string-valued fields, e.g. `STAT_ENUMS`.
+        :type enums: dict
+        """
+        self.collectd = collectd
+        self.plugin_name = plugin_name
+        self.xref = xref
+        self.converters = dict(
+            (field, Enum(table)) for field, table in iteritems(enums or {})
+        )
+
+        self.local = threading.local()
+        self.generation = 0
+        self.plans_generation = 0
+
+    def pool(self):
+        """
+        Returns the calling thread's pool, a `threading.local` holding its
+        "values" and "plans" dictionaries, emptying either of them if the
+        registry was cleared since the thread last used it.
+        """
+        local = self.local
+        if getattr(local, "generation", None) != self.generation:
+            local.values = {}
+            local.generation = self.generation
+            local.plans_generation = None
+        if local.plans_generation != self.plans_generation:
+            local.plans = {}
+            local.plans_generation = self.plans_generation
+
+        return local
+
+    @property
+    def values(self):
+        """
+        The calling thread's dictionary of created `collectd.Values`.
+        """
+        return self.pool().values
+
+    @property
+    def plans(self):
+        """
+        The calling thread's dictionary of compiled plans.
+        """
+        return self.pool().plans
+
+    def get(self, label):
+        """
+        Returns the `collectd.Values` for a given HAProxy field name,
+        creating it on first use.  Returns `None` for unknown fields.
+
+        :param label: The HAProxy field name, e.g. "CurrConns".
+        :type label: str
+        """
+        values = self.values
+        metric = values.get(label)
+        if metric is not None:
+            return metric
+
+        xref = self.xref.get(label)
+        if xref is None:
+            return None
+
+        metric = self.collectd.Values(
+            plugin=self.plugin_name, type=xref[1], type_instance=xref[0]
+        )
+        values[label] = metric
+        return metric
+
+    def get_custom(self, type_instance, metric_type):
+        """
+        Returns a `collectd.Values` for a metric that isn't keyed off of an
+        HAProxy field name (e.g. derived counts), creating it on first use.
+
+        :param type_instance: The collectd type instance, e.g. "top_keys".
+        :type type_instance: str
+
+        :param metric_type: The collectd type, e.g. "gauge".
+        :type metric_type: str
+        """
+        key = (type_instance, metric_type)
+        values = self.values
+        metric = values.get(key)
+        if metric is None:
+            metric = self.collectd.Values(
+                plugin=self.plugin_name,
+                type=metric_type, type_instance=type_instance
+            )
+            values[key] = metric
+
+        return metric
+
+    def plan(self, fields):
+        """
+        Compiles a "show stat" header into a list of (index, Values,
+        converter) tuples.
+
+        Only columns present in the header *and* known to the cross reference
+        end up in the plan, each paired with the column index it is found at
+        in the data rows and the function that converts its raw values to
+        numbers (`to_long()` unless the field has an enum table).  Plans are
+        cached by header so the work is only done once per distinct HAProxy
+        version/configuration.
+
+        :param fields: The list of field names from the header line.
+        :type fields: list
+        """
+        key = tuple(fields)
+        plans = self.plans
+        plan = plans.get(key)
+        if plan is not None:
+            return plan
+
+        plan = []
+        for index, field in enumerate(fields):
+            metric = self.get(field)
+            if metric is not None:
+                convert = self.converters.get(field, to_long)
+                plan.append((index, metric, convert))
+
+        plans[key] = plan
+        return plan
+
+    def clear_plans(self):
+        """
+        Drops every thread's compiled plans, keeping the created
+        `collectd.Values`.
+        """
+        self.plans_generation += 1
+
+    def clear(self):
+        """
+        Drops every thread's created `collectd.Values` instances and compiled
+        plans.
+        """
+        self.generation += 1
@@ -1,6 +1,66 @@
-from .metrics import METRIC_XREF
-from .connection import HAProxySocket
-from .compat import iteritems, coerce_long
+import heapq
+import os
+import time
+
+from .metrics import (
+    METRIC_XREF, STAT_ENUMS, STATIC_INFO_FIELDS, SERVER_CENSUS,
+    MetricRegistry, Enum, ServerCensus, compile_xref,
+)
+from .connection import HAProxySocket, MasterSocket
+from .breaker import CircuitBreaker, CLOSED
+from .compat import PY35, iteritems, coerce_long
+
+
+# maps config option names to (<plugin attribute>, <value converter>)
+CONFIG_OPTIONS = {
+    "Engine": ("engine_name", str),
+    "Worker": ("use_worker", bool),
+    "WorkerTimeout": ("worker_timeout", float),
+    "IncludeInfo": ("include_info", bool),
+    "InfoHeartbeat": ("info_heartbeat", int),
+    "TrackReloads": ("track_reloads", bool),
+    "DrainingSocket": ("draining_socket_pattern", str),
+    "DrainingWindow": ("draining_window", int),
+    "IncludeStats": ("include_stats", bool),
+    "SnapshotPath": ("snapshot_path", str),
+    "MaxResponseBytes": ("max_response_bytes", int),
+    "ResponseCacheTTL": ("response_cache_ttl", float),
+    "MaxRows": ("max_rows", int),
+    "MaxSeries": ("max_series", int),
+    "ProfileReads": ("profile_reads", int),
+    "ProfilePath": ("profile_path", str),
+    "Profiler": ("profiler_name", str),
+    "TraceMemory": ("trace_memory", bool),
+    "TraceMemoryTop": ("trace_memory_top", int),
+    "TraceMemoryPath": ("trace_memory_path", str),
+    "RecordPath": ("record_path", str),
+    "RecordReads": ("record_reads", int),
+    "IncludeFrontendStats": ("include_frontends", bool),
+    "IncludeBackendStats": ("include_backends", bool),
+    "IncludeServerStats": ("include_servers", bool),
+    "IncludeServerCensus": ("include_server_census", bool),
+    "ServerSampling": ("server_sampling", int),
+    "BackoffBase": ("backoff_base", float),
+    "BackoffMax": ("backoff_max", float),
+    "NotifyStateChanges": ("notify_state_changes", bool),
+    "IncludePools": ("include_pools", bool),
+    "PoolsInterval": ("pools_interval", int),
+    "IncludeActivity": ("include_activity", bool),
+    "ActivityInterval": ("activity_interval", int),
+    "IncludeServerState": ("include_server_state", bool),
+    "ServerStateInterval": ("server_state_interval", int),
+    "IncludeTables": ("include_tables", bool),
+    "TableData": ("table_data_type", str),
+    "TableThreshold": ("table_threshold", int),
+    "TableTopKeys": ("table_top_keys", int),
+}
+
+# maps <Metric> block option names to (<override key>, <value converter>)
+METRIC_OPTIONS = {
+    "TypeInstance": ("type_instance", str),
+    "Type": ("type", str),
+    "Drop": ("drop", bool),
+}
 
 
 class HAProxyPlugin(object):
@@ -26,17 +86,78 @@ class HAProxyPlugin(object):
         """
         self.collectd = collectd
 
-        self.socket_file_path = None
+        self.socket_configs = []
+        self.master_socket_configs = []
+        self.metric_overrides = {}
+        self.engine_name = None
+        self.use_worker = False
+        self.worker_timeout = 30.0
 
         self.include_info = True
         self.include_stats = True
         self.include_frontends = True
         self.include_backends = True
         self.include_servers = True
+        self.include_server_census = False
+        self.server_sampling = 1
+        self.backoff_base = 10.0
+        self.backoff_max = 600.0
+        self.notify_state_changes = False
+        self.include_pools = False
+        self.include_activity = False
+        self.include_server_state = False
+        self.include_tables = False
+
+        self.info_heartbeat = 300
+        self.track_reloads = True
+        self.draining_socket_pattern = None
+        self.draining_window = 60
+        self.pools_interval = 60
+        self.activity_interval = 60
+        self.server_state_interval = 60
+
+        self.snapshot_path = None
+
+        self.max_response_bytes = None
+        self.response_cache_ttl = 0
+        self.max_rows = None
+        self.max_series = None
+
+        self.profile_reads = 0
+        self.profile_path = None
+        self.profiler_name = "cprofile"
+
+        self.trace_memory = False
+        self.trace_memory_top = 10
+        self.trace_memory_path = None
+
+        self.record_path = None
+        self.record_reads = 10
 
-        self.socket = None
-        self.metrics = {}
-        self.stats_type_mask = 0
+        self.table_data_type = None
+        self.table_threshold = None
+        self.table_top_keys = 0
+
+        self.sockets = []
+        self.breakers = {}
+        self.draining = []
+        self.engine = None
+        self.worker = None
+        self.profiler = None
+        self.memory_tracer = None
+        self.recording = 0
+        self.metrics = None
+
+        self.last_collected = {}
+        self.process_ids = {}
+        self.static_info = {}
+        self.server_states = {}
+        self.snapshots = {}
+        self.stat_instances = {}
+        self.sample_cycles = {}
+        self.proxy_states = {}
+        self.status_enum = Enum(STAT_ENUMS["status"])
+        self.truncations = set()
 
     @classmethod
     def register(cls, collectd):
@@ -62,32 +183,59 @@ class HAProxyPlugin(object):
         Iterates over the config object's `children` attribute and sets any
         applicable attributes on the plugin instance.
 
+        The "Socket" and "MasterSocket" options can be given more than once,
+        each with an optional second value naming that socket's instance.
+        `<Metric>` blocks are handled by `configure_metric()`.
+
         :param config: The collectd Config instance.  Passed in automatically
             by collectd itself.
         :type config: collect.Config
         """
         self.collectd.debug("configuring")
         for node in config.children:
-            if node.key == "Socket":
-                self.socket_file_path = node.values[0]
-            elif node.key == "IncludeInfo":
-                self.include_info = bool(node.values[0])
-            elif node.key == "IncludeStats":
-                self.include_stats = bool(node.values[0])
-            elif node.key == "IncludeFrontendStats":
-                self.include_frontends = bool(node.values[0])
-            elif node.key == "IncludeBackendStats":
-                self.include_backends = bool(node.values[0])
-            elif node.key == "IncludeServerStats":
-                self.include_servers = bool(node.values[0])
-            else:
+            if node.key in ("Socket", "MasterSocket"):
+                path = node.values[0]
+                name = node.values[1] if len(node.values) > 1 else None
+                if node.key == "MasterSocket":
+                    self.master_socket_configs.append((path, name))
+                else:
+                    self.socket_configs.append((path, name))
+                continue
+            if node.key == "Metric":
+                self.configure_metric(node)
+                continue
+            if node.key not in CONFIG_OPTIONS:
                 self.collectd.warn("Unknown config option: '%s'" % node.key)
+                continue
+
+            attribute, convert = CONFIG_OPTIONS[node.key]
+            setattr(self, attribute, convert(node.values[0]))
 
-        if not self.socket_file_path:
+        if not self.socket_configs and not self.master_socket_configs:
             self.collectd.error("No HAProxy socket path configured!")
             self.collectd.unregister_init(self.initialize)
             self.collectd.unregister_read(self.read)
 
+    def configure_metric(self, node):
+        """
+        Handles a `<Metric "field">` config block, recording an override
+        for that HAProxy field to be compiled in at initialize time.
+
+        :param node: The "Metric" config node.
+        :type node: collectd.Config
+        """
+        field = node.values[0]
+        override = self.metric_overrides.setdefault(field, {})
+        for child in node.children:
+            if child.key not in METRIC_OPTIONS:
+                self.collectd.warn(
+                    "Unknown option for metric '%s': '%s'" % (field, child.key)
+                )
+                continue
+
+            key, convert = METRIC_OPTIONS[child.key]
+            override[key] = convert(child.values[0])
+
     def initialize(self):
         """
         The 'initialize' collectd callback for the plugin.
@@ -95,75 +243,1111 @@ class HAProxyPlugin(object):
         This callback fires after the 'config' one but before the 'read' one
         gets added to the loop.
 
-        Instantiates a `collectd.Values` for each known metric (these are used
-        to dispatch actual values to collectd) as well as sets up the
-        `HAProxySocket` for fetching the values.
+        Sets up the `MetricRegistry` that lazily creates the `collectd.Values`
+        used to dispatch actual values to collectd (with any `<Metric>`
+        overrides compiled into its cross reference), as well as an
+        `HAProxySocket` for each configured socket path, or `MasterSocket` for
+        each master CLI socket path (and the optional engine that drives
+        them).
+
+        When more than one socket is configured, each one's metrics are
+        prefixed with its name, which defaults to the socket file's base name.
+
+        With `ResponseCacheTTL` set the sockets share the process-wide
+        `RESPONSE_CACHE`, so plugin instances reading the same socket share
+        their "show info" and "show stat" responses.
+
+        With `Worker` set all of that is left to the `CollectorWorker`
+        process, which initializes its own copy of the plugin.
         """
         self.collectd.debug("initializing")
-        self.metrics = {}
-        for metric_name, xref in iteritems(METRIC_XREF):
-            self.metrics[metric_name] = self.collectd.Values(
-                plugin=self.name, type=xref[1], type_instance=xref[0]
+        self.metrics = MetricRegistry(
+            self.collectd, self.name,
+            compile_xref(METRIC_XREF, self.metric_overrides), STAT_ENUMS
+        )
+
+        if self.use_worker:
+            from .worker import CollectorWorker
+
+            self.worker = CollectorWorker(self, self.worker_timeout)
+            self.worker.start()
+            self.collectd.info("Collecting in worker process")
+            return
+
+        socket_class, master_socket_class = self.socket_classes()
+
+        configs = [
+            (path, name, socket_class) for path, name in self.socket_configs
+        ] + [
+            (path, name, master_socket_class)
+            for path, name in self.master_socket_configs
+        ]
+
+        self.sockets = []
+        for path, name, socket_class in configs:
+            if name is None and len(configs) > 1:
+                name = os.path.splitext(os.path.basename(path))[0]
+            socket = socket_class(self.collectd, path, name=name)
+            socket.max_response_bytes = self.max_response_bytes
+            if self.response_cache_ttl:
+                from .cache import RESPONSE_CACHE
+
+                socket.cache = RESPONSE_CACHE
+                socket.cache_ttl = self.response_cache_ttl
+            self.sockets.append(socket)
+
+            self.collectd.info("Using socket path '%s'" % path)
+
+        if self.profile_reads:
+            self.profiler = self.make_profiler()
+        if self.trace_memory:
+            from .memory import MemoryTracer
+
+            if MemoryTracer.available():
+                self.memory_tracer = MemoryTracer(
+                    self.trace_memory_top, self.trace_memory_path
+                )
+            else:
+                self.collectd.error("TraceMemory requires python 3.4+")
+        if self.record_path and self.record_reads:
+            self.start_recording()
+
+    def socket_classes(self):
+        """
+        Sets up the configured `Engine`, if any, and returns the classes to
+        use for sockets and master CLI sockets: `HAProxySocket` and
+        `MasterSocket` by default, their async counterparts for the
+        "asyncio" engine (python 3.5+).
+        """
+        if self.engine_name == "asyncio" and PY35:
+            from .aio import (
+                AsyncEngine, AsyncHAProxySocket, AsyncMasterSocket,
+            )
+
+            self.engine = AsyncEngine(self.collectd)
+            return AsyncHAProxySocket, AsyncMasterSocket
+
+        if self.engine_name == "asyncio":
+            self.collectd.error("The asyncio engine requires python 3.5+")
+        elif self.engine_name:
+            self.collectd.warning("Unknown engine: '%s'" % self.engine_name)
+
+        return HAProxySocket, MasterSocket
+
+    def start_recording(self):
+        """
+        Sets a `CaptureWriter` on each socket so that the raw responses of
+        the next `RecordReads` reads are recorded to "<RecordPath>", or
+        "<RecordPath>.<socket name>" for named sockets.
+        """
+        from .capture import CaptureWriter
+
+        for socket in self.sockets:
+            path = self.record_path
+            if socket.name:
+                path += "." + socket.name
+            socket.recorder = CaptureWriter(path, socket.socket_file_path)
+            self.collectd.info(
+                "Recording the next %d reads from %s to '%s'" % (
+                    self.record_reads, socket.socket_file_path, path
+                )
             )
 
-        self.socket = HAProxySocket(self.collectd, self.socket_file_path)
+        self.recording = self.record_reads
+
+    def stop_recording(self):
+        """
+        Closes and removes the sockets' `CaptureWriter` recorders.
+        """
+        for socket in self.sockets:
+            if socket.recorder is not None:
+                socket.recorder.close()
+                self.collectd.info(
+                    "Wrote capture to '%s'" % socket.recorder.path
+                )
+                socket.recorder = None
+
+        self.recording = 0
+
+    def make_profiler(self):
+        """
+        Returns the `ReadProfiler` for the `ProfileReads` option, or `None`
+        if the profiler is misconfigured.
+        """
+        from .profiling import PROFILERS
+
+        if not self.profile_path:
+            self.collectd.error("ProfileReads requires a ProfilePath!")
+            return None
+        if self.profiler_name not in PROFILERS:
+            self.collectd.error("Unknown profiler: '%s'" % self.profiler_name)
+            return None
 
-        self.collectd.info("Using socket path '%s'" % self.socket_file_path)
+        self.collectd.info(
+            "Profiling the next %d reads with %s" % (
+                self.profile_reads, self.profiler_name
+            )
+        )
+        return PROFILERS[self.profiler_name](
+            self.profile_path, self.profile_reads
+        )
 
     def read(self):
         """
         The 'read' collectd callback for the plugin.
 
-        Simple method that calls `collect_info()` and/or `collect_stats()`
-        based on the configuration.
+        With `Worker` set the read is run in the worker process and its
+        results dispatched (see `dispatch_batch()`).
+
+        If `ProfileReads` is set the read is run under the configured
+        profiler, which is dumped to `ProfilePath` and switched off once
+        enough reads have been profiled.  Otherwise this just defers to
+        `collect()`.
+        """
+        if self.worker is not None:
+            return self.dispatch_batch(self.worker.read())
+
+        if self.profiler is None:
+            return self.collect()
+
+        try:
+            self.profiler.runcall(self.collect)
+        finally:
+            if self.profiler.finished:
+                self.profiler.dump()
+                self.collectd.info(
+                    "Wrote read profile to '%s'" % self.profiler.path
+                )
+                self.profiler = None
+
+    def dispatch_batch(self, batch):
+        """
+        Sends on the values, notifications and log messages from a read
+        made in the worker process.
+
+        :param batch: The (values, notifications, messages) batch from the
+            worker, or `None` if the worker didn't respond.
+        :type batch: tuple
+        """
+        if batch is None:
+            return
+
+        values, notifications, messages = batch
+        for level, message in messages:
+            getattr(self.collectd, level)(message)
+        for plugin_instance, metric_type, type_instance, value in values:
+            self.metrics.get_custom(type_instance, metric_type).dispatch(
+                plugin_instance=plugin_instance, values=value
+            )
+        for attributes in notifications:
+            self.collectd.Notification(**attributes).dispatch()
+
+    def collect(self):
+        """
+        Runs the collectors that are due (see `due_collectors()`) against
+        each socket in turn.  If an engine is configured it gets a chance to
+        prefetch the sockets' responses up front.
+
+        Sockets that fail are backed off from by their `CircuitBreaker` (see
+        `collect_socket()`).
+
+        With `TraceMemory` the collectors are run under the `MemoryTracer`
+        and its per-phase figures are reported (see `report_memory()`).
+
+        With `RecordPath` the sockets' responses are recorded until
+        `RecordReads` reads have been made.
         """
+        collectors = self.due_collectors()
+        self.truncations = set()
+
+        if self.memory_tracer is not None:
+            self.memory_tracer.begin()
+            collectors = self.memory_tracer.wrap(collectors)
+
+        if self.engine is not None:
+            self.engine.prefetch(self.sockets)
+
+        for socket in self.sockets:
+            self.collect_socket(socket, collectors)
+            if socket.truncated:
+                socket.truncated = False
+                self.truncated(socket, "response")
+
+        if self.draining:
+            self.collect_draining()
+
+        if self.memory_tracer is not None:
+            self.report_memory(self.memory_tracer.end())
+
+        if self.recording:
+            self.recording -= 1
+            if not self.recording:
+                self.stop_recording()
+
+    def report_memory(self, phases):
+        """
+        Sends the bytes left allocated and the peak bytes used by each phase
+        of a read, as "allocated" and "peak" values for the "memory.<phase>"
+        plugin instance, and logs the top allocation sites at debug level.
+
+        :param phases: Dictionary of phase name to [allocated bytes, peak
+            bytes].
+        :type phases: dict
+        """
+        allocated = self.metrics.get_custom("allocated", "bytes")
+        peak = self.metrics.get_custom("peak", "bytes")
+        for phase, totals in iteritems(phases):
+            plugin_instance = "memory." + phase
+            allocated.dispatch(
+                plugin_instance=plugin_instance, values=[totals[0]]
+            )
+            peak.dispatch(plugin_instance=plugin_instance, values=[totals[1]])
+
+        for site, size, count in self.memory_tracer.sites:
+            self.collectd.debug(
+                "Allocated %d bytes in %d blocks at %s" % (size, count, site)
+            )
+
+    def collect_socket(self, socket, collectors):
+        """
+        Runs the given collectors against a socket, unless the socket's
+        circuit breaker is open, then sends the breaker's state (0 for
+        closed, 1 for open and 2 for half-open) as the "circuit_state" gauge.
+
+        A socket error (e.g. HAProxy refusing connections or the socket file
+        being gone mid-restart) opens the breaker for an exponentially
+        growing, jittered delay, so an unreachable HAProxy costs next to
+        nothing and is only logged about when it goes away and comes back.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+
+        :param collectors: The collector methods to run.
+        :type collectors: list
+        """
+        breaker = self.breakers.get(socket.socket_file_path)
+        if breaker is None:
+            breaker = CircuitBreaker(self.backoff_base, self.backoff_max)
+            self.breakers[socket.socket_file_path] = breaker
+
+        if breaker.allow():
+            was_closed = breaker.state == CLOSED
+            try:
+                for collector in collectors:
+                    collector(socket)
+            except IOError as e:
+                delay = breaker.failure()
+                log = self.collectd.debug
+                if was_closed:
+                    log = self.collectd.error
+                log("Error reading from %s (%s), retrying in %.1fs" % (
+                    socket.socket_file_path, e, delay
+                ))
+            else:
+                if not was_closed:
+                    self.collectd.info(
+                        "%s is reachable again" % socket.socket_file_path
+                    )
+                breaker.success()
+
+        self.metrics.get_custom("circuit_state", "gauge").dispatch(
+            plugin_instance=socket.name or self.name, values=[breaker.state]
+        )
+
+    def due_collectors(self):
+        """
+        Returns the list of `collect_*()` methods to run for this read, based
+        on the configuration and the interval of the slower collectors.
+        """
+        collectors = []
         if self.include_info:
-            self.collect_info()
+            collectors.append(self.collect_info)
+        elif self.track_reloads:
+            collectors.append(self.detect_reload)
         if self.include_stats:
-            self.collect_stats()
+            collectors.append(self.collect_stats)
+        if self.include_pools and self.is_due("pools", self.pools_interval):
+            collectors.append(self.collect_pools)
+        if self.include_activity and self.is_due(
+                "activity", self.activity_interval):
+            collectors.append(self.collect_activity)
+        if self.include_server_state:
+            if self.is_due("server_state", self.server_state_interval):
+                collectors.append(self.refresh_server_states)
+            collectors.append(self.collect_server_states)
+        if self.include_tables:
+            collectors.append(self.collect_tables)
+
+        return collectors
+
+    def instance_prefix(self, socket):
+        """
+        Returns the string to prefix a socket's plugin instances with, empty
+        unless the socket is named.
+
+        :param socket: The socket the metrics came from.
+        :type socket: HAProxySocket
+        """
+        if socket.name is None:
+            return ""
+
+        return socket.name + "."
+
+    def is_due(self, name, interval):
+        """
+        Returns whether a collector that runs on its own, slower cadence is
+        due to run again, marking it as having run if so.
+
+        :param name: The name of the collector, e.g. "server_state".
+        :type name: str
 
-    def collect_info(self):
+        :param interval: The number of seconds between runs.
+        :type interval: int
+        """
+        now = time.time()
+        last = self.last_collected.get(name)
+        if last is not None and now - last < interval:
+            return False
+
+        self.last_collected[name] = now
+        return True
+
+    def collect_info(self, socket):
         """
         Method for sending HAProxy "info" metrics to collectd.
 
         Iterates over the metric names and values provided by the socket and
         dispatches each known one to collectd.
+
+        Fields in `STATIC_INFO_FIELDS` are cached per socket and only sent
+        when their value changes, when HAProxy reloads or every
+        `InfoHeartbeat` seconds.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
         """
         self.collectd.debug("reading info")
-        for label, value in self.socket.gen_info():
-            if label not in self.metrics:
+        info = list(socket.gen_info())
+        if not info:
+            return
+
+        if self.snapshot_path:
+            self.write_snapshot(
+                socket, "info",
+                [label for label, _ in info], ["info"],
+                [[value for _, value in info]]
+            )
+
+        reloaded = False
+        if self.track_reloads:
+            reloaded = self.check_reload(socket, dict(info))
+        heartbeat = self.is_due(
+            ("static_info", socket.socket_file_path), self.info_heartbeat
+        )
+        static_info = self.static_info.setdefault(socket.socket_file_path, {})
+
+        plugin_instance = socket.name or self.name
+        for label, value in info:
+            metric = self.metrics.get(label)
+            if metric is None:
                 continue
 
-            self.metrics[label].dispatch(
-                plugin_instance=self.name, values=[value]
+            if label in STATIC_INFO_FIELDS:
+                if static_info.get(label) == value and not (
+                        reloaded or heartbeat):
+                    continue
+                static_info[label] = value
+
+            metric.dispatch(plugin_instance=plugin_instance, values=[value])
+
+    def detect_reload(self, socket):
+        """
+        Runs "show info" solely to check for a reload, for when info metrics
+        themselves aren't being collected.
+
+        :param socket: The socket to check.
+        :type socket: HAProxySocket
+        """
+        info = dict(socket.gen_info())
+        if info:
+            self.check_reload(socket, info)
+
+    def check_reload(self, socket, info):
+        """
+        Checks whether the HAProxy process behind a socket has been reloaded
+        or restarted since the last check, based on its "Pid" changing or its
+        "Uptime_sec" going backwards, calling `handle_reload()` if so.
+
+        Returns the previous pid on a reload, `None` otherwise.
+
+        :param socket: The socket the info came from.
+        :type socket: HAProxySocket
+
+        :param info: Dictionary of "show info" fields and values.
+        :type info: dict
+        """
+        pid, uptime = info.get("Pid"), info.get("Uptime_sec")
+        previous = self.process_ids.get(socket.socket_file_path)
+        self.process_ids[socket.socket_file_path] = (pid, uptime)
+
+        if previous is None:
+            return None
+
+        reloaded = pid != previous[0]
+        if not reloaded:
+            try:
+                reloaded = coerce_long(uptime) < coerce_long(previous[1])
+            except (TypeError, ValueError):
+                pass
+
+        if not reloaded:
+            return None
+
+        self.handle_reload(socket, previous[0])
+        return previous[0]
+
+    def handle_reload(self, socket, old_pid):
+        """
+        Throws away everything cached about the process behind a socket once
+        it has been replaced: compiled plans, cached static info and server
+        states, and any connection state held by the socket itself.
+
+        If a `DrainingSocket` pattern is configured the old process's socket
+        is polled for stats for `DrainingWindow` seconds, so traffic on its
+        draining connections is still counted.
+
+        :param socket: The socket whose process was reloaded.
+        :type socket: HAProxySocket
+
+        :param old_pid: The pid of the replaced process.
+        :type old_pid: str
+        """
+        self.collectd.info(
+            "HAProxy reload detected on %s (old pid %s)" % (
+                socket.socket_file_path, old_pid
             )
+        )
+        self.metrics.clear_plans()
+        caches = (
+            self.static_info, self.server_states, self.stat_instances,
+            self.proxy_states,
+        )
+        for cache in caches:
+            cache.pop(socket.socket_file_path, None)
+        self.last_collected.pop("server_state", None)
+        socket.reset()
+
+        if self.draining_socket_pattern and old_pid:
+            self.add_draining(socket, old_pid)
 
-    def collect_stats(self):
+    def add_draining(self, socket, old_pid):
         """
-        Method for sending HAProxy "info" metrics to collectd.
+        Starts polling the socket of a replaced process until its draining
+        window runs out.
+
+        :param socket: The socket whose process was reloaded.
+        :type socket: HAProxySocket
+
+        :param old_pid: The pid of the replaced process.
+        :type old_pid: str
+        """
+        path = self.draining_socket_pattern.replace("%p", old_pid)
+        name = self.instance_prefix(socket) + "draining"
+        draining = HAProxySocket(self.collectd, path, name=name)
+
+        self.draining.append((draining, time.time() + self.draining_window))
 
-        Iterates over the metric names and values provided by the socket,
-        checking that the metric is a known one and taking care of numeric
-        coercion before dispatching to collectd.
+    def collect_draining(self):
         """
-        stats = self.socket.gen_stats(
-            self.include_frontends, self.include_backends, self.include_servers
+        Collects stats from the sockets of replaced, draining processes,
+        dropping any whose window has passed or that stopped answering.
+        """
+        now = time.time()
+        still_draining = []
+        for socket, expires in self.draining:
+            if now >= expires:
+                continue
+            try:
+                self.collect_stats(socket)
+            except IOError:
+                continue
+            still_draining.append((socket, expires))
+
+        self.draining = still_draining
+
+    def collect_stats(self, socket):
+        """
+        Method for sending HAProxy "stats" metrics to collectd.
+
+        The header of the "show stat" response is compiled into a plan of
+        known columns once, then each row is dispatched by column index,
+        taking care of numeric coercion along the way.  String-valued
+        columns such as "status" are reported as the numbers from their
+        `STAT_ENUMS` table.
+
+        With `NotifyStateChanges` each row is also checked for a state
+        transition (see `check_transition()`).
+
+        With `IncludeServerCensus` the servers of each backend are counted by
+        state on the way through and the counts sent at the end, even if
+        `MaxRows` cuts the read short (see `dispatch_census()`).  Server rows
+        are only counted, not dispatched, unless `IncludeServerStats` is set.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        rows = self.gen_stat_rows(socket)
+        fields = next(rows, None)
+        if fields is None:
+            return
+
+        plan = self.metrics.plan(fields)
+        svname_index = fields.index("svname")
+        prefix = self.instance_prefix(socket)
+        census = self.new_census(fields)
+        snapshot = [] if self.snapshot_path else None
+        instances = self.stat_instances.setdefault(
+            socket.socket_file_path, set()
         )
-        for proxy_name, values in stats:
-            server_name = values.pop("svname")
-            plugin_instance = ".".join([proxy_name, server_name])
+        watch = None
+        if self.notify_state_changes:
+            watch = self.state_watch(socket, fields)
 
-            for label, value in iteritems(values):
-                if label not in self.metrics:
+        for row_count, row in enumerate(rows, 1):
+            if self.max_rows and row_count > self.max_rows:
+                self.truncated(socket, "rows")
+                break
+            if census is not None and census.add(row) and (
+                    not self.include_servers):
+                continue
+            if snapshot is not None:
+                snapshot.append(row)
+            plugin_instance = prefix + row[0] + "." + row[svname_index]
+
+            if self.max_series and plugin_instance not in instances and (
+                    not self.admit_series(
+                        socket, instances, plugin_instance, len(plan)
+                    )):
+                continue
+
+            self.dispatch_row(plan, row, plugin_instance)
+            if watch is not None:
+                self.check_transition(watch, row, plugin_instance)
+
+        if census is not None and census.counts:
+            self.dispatch_census(prefix, census.counts)
+        if snapshot is not None:
+            labels = [row[0] + "/" + row[svname_index] for row in snapshot]
+            self.write_snapshot(socket, "stat", fields, labels, snapshot)
+
+    def new_census(self, fields):
+        """
+        Returns a `ServerCensus` to tally a "show stat" response's rows into
+        if `IncludeServerCensus` is set (and the header has a "status"
+        column), otherwise `None`.
+
+        :param fields: The "show stat" header field names.
+        :type fields: list
+        """
+        if not self.include_server_census or "status" not in fields:
+            return None
+
+        return ServerCensus(fields, self.status_enum)
+
+    def dispatch_census(self, prefix, census):
+        """
+        Sends the number of servers in each state ("servers_up",
+        "servers_down", etc.) as gauges of each backend's "<name>.BACKEND"
+        plugin instance.
+
+        :param prefix: The socket's plugin instance prefix.
+        :type prefix: str
+
+        :param census: Dictionary of backend name to server counts.
+        :type census: dict
+        """
+        metrics = [
+            self.metrics.get_custom(type_instance, "gauge")
+            for type_instance in SERVER_CENSUS
+        ]
+        for backend, counts in iteritems(census):
+            plugin_instance = prefix + backend + ".BACKEND"
+            for metric, count in zip(metrics, counts):
+                metric.dispatch(
+                    plugin_instance=plugin_instance, values=[count]
+                )
+
+    def gen_stat_rows(self, socket):
+        """
+        Returns the generator of "show stat" rows (header first) to collect
+        from a socket, sampled if `ServerSampling` is set.  Server rows are
+        included for `IncludeServerCensus` even if `IncludeServerStats` is
+        off.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        if self.include_servers and self.server_sampling > 1:
+            return self.gen_sampled_stat_rows(socket)
+
+        return socket.gen_stat_rows(
+            self.include_frontends, self.include_backends,
+            self.include_servers or self.include_server_census
+        )
+
+    def gen_sampled_stat_rows(self, socket):
+        """
+        Generator that yields "show stat" rows (header first) for the
+        `ServerSampling` mode.
+
+        Frontend and backend aggregates are read every time, but servers are
+        only read for a rotating 1/N slice of the backends (by position in
+        the list of backend proxy ids) via targeted, pipelined
+        "show stat <iid> 4 -1" commands, so each server is covered every N
+        reads.  With an engine set the next read's slice is what gets
+        prefetched (see `prefetch_next_sample()`).
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        rows = socket.gen_stat_rows(self.include_frontends, True, False)
+        fields = next(rows, None)
+        if fields is None:
+            return
+
+        yield fields
+
+        svname_index = fields.index("svname")
+        iid_index = fields.index("iid")
+        proxy_ids = []
+        for row in rows:
+            if row[svname_index] == "BACKEND":
+                proxy_ids.append(row[iid_index])
+                if not self.include_backends:
                     continue
-                if not value:
-                    value = 0
+            yield row
+
+        path = socket.socket_file_path
+        cycle = self.sample_cycles.get(path, 0)
+        self.sample_cycles[path] = cycle + 1
+
+        step = self.server_sampling
+        sample = proxy_ids[cycle % step::step]
+        rows = iter([])
+        if sample:
+            rows = socket.gen_stat_rows(False, False, True, sample)
+            if next(rows, None) != fields:
+                rows = iter([])
+        self.prefetch_next_sample(
+            socket, sample, proxy_ids[(cycle + 1) % step::step]
+        )
+
+        for row in rows:
+            yield row
+
+    def prefetch_next_sample(self, socket, sample, upcoming):
+        """
+        With an engine set, has the socket prefetch the next read's slice of
+        servers instead of this read's, as the slices' commands differ from
+        one read to the next (see `AsyncHAProxySocket.replace_command()`).
+
+        :param socket: The socket being collected from.
+        :type socket: AsyncHAProxySocket
+
+        :param sample: The proxy ids of this read's slice.
+        :type sample: list
+
+        :param upcoming: The proxy ids of the next read's slice.
+        :type upcoming: list
+        """
+        if self.engine is None:
+            return
+
+        commands = [
+            socket.stat_rows_command(False, False, True, proxy_ids)
+            if proxy_ids else None
+            for proxy_ids in (sample, upcoming)
+        ]
+        socket.replace_command(*commands)
+
+    def dispatch_row(self, plan, row, plugin_instance):
+        """
+        Dispatches the values of a single "show stat" row according to a
+        compiled plan, converting each value with its column's converter and
+        skipping values that don't convert (non-numeric values in numeric
+        columns, values an enum table doesn't know).
+
+        :param plan: The (index, Values, converter) plan for the row's header.
+        :type plan: list
+
+        :param row: The row's field values.
+        :type row: list
+
+        :param plugin_instance: The plugin instance to dispatch under.
+        :type plugin_instance: str
+        """
+        for index, metric, convert in plan:
+            value = convert(row[index])
+            if value is not None:
+                metric.dispatch(
+                    plugin_instance=plugin_instance, values=[value]
+                )
+
+    def state_watch(self, socket, fields):
+        """
+        Returns what `check_transition()` needs to track the states of a
+        socket's backends and servers for a given "show stat" header: the
+        socket's dictionary of (iid, sid) to last seen (status, chkdown)
+        followed by the indexes of the "svname", "iid", "sid", "status" and
+        "chkdown" fields.  Returns `None` if any of those fields are missing.
+
+        :param socket: The socket being read from.
+        :type socket: HAProxySocket
+
+        :param fields: The "show stat" header field names.
+        :type fields: list
+        """
+        names = ("svname", "iid", "sid", "status", "chkdown")
+        if not all(name in fields for name in names):
+            return None
+
+        states = self.proxy_states.setdefault(socket.socket_file_path, {})
+        return (states,) + tuple(fields.index(name) for name in names)
+
+    def check_transition(self, watch, row, plugin_instance):
+        """
+        Compares a backend or server row's status and down transition count
+        with the ones seen on the previous read, sending a notification if
+        the state changed.
+
+        Unchanged rows (the vast majority) cost a single tuple comparison.
+
+        :param watch: The tracking state from `state_watch()`.
+        :type watch: tuple
+
+        :param row: The "show stat" row.
+        :type row: list
+
+        :param plugin_instance: The plugin instance of the row.
+        :type plugin_instance: str
+        """
+        states, svname, iid, sid, status, chkdown = watch
+        if row[svname] == "FRONTEND":
+            return
+
+        key = (row[iid], row[sid])
+        current = (row[status], row[chkdown])
+        previous = states.get(key)
+        if previous == current:
+            return
+
+        states[key] = current
+        if previous is not None:
+            self.notify_transition(plugin_instance, previous, current)
+
+    def notify_transition(self, plugin_instance, previous, current):
+        """
+        Sends a collectd notification for a change between two (status,
+        chkdown) states, if it's a meaningful one.
+
+        A change of the base status (e.g. "UP" to "DOWN", but not "UP" to
+        "UP 1/3") is sent with a severity matching the new status.  If the
+        status is the same but the down transition count went up the server
+        went down and came back between reads, which is sent as a warning.
+
+        :param plugin_instance: The plugin instance of the backend/server.
+        :type plugin_instance: str
+
+        :param previous: The previous (status, chkdown) tuple.
+        :type previous: tuple
+
+        :param current: The current (status, chkdown) tuple.
+        :type current: tuple
+        """
+        old_code = self.status_enum(previous[0])
+        new_code = self.status_enum(current[0])
+        if old_code != new_code:
+            severity = self.collectd.NOTIF_WARNING
+            if new_code == STAT_ENUMS["status"]["UP"]:
+                severity = self.collectd.NOTIF_OKAY
+            elif new_code == STAT_ENUMS["status"]["DOWN"]:
+                severity = self.collectd.NOTIF_FAILURE
+            message = "%s is %s (was %s)" % (
+                plugin_instance, current[0], previous[0]
+            )
+        elif current[1].isdigit() and previous[1].isdigit() and (
+                int(current[1]) > int(previous[1])):
+            severity = self.collectd.NOTIF_WARNING
+            message = "%s went down %d time(s) since the last read" % (
+                plugin_instance, int(current[1]) - int(previous[1])
+            )
+        else:
+            return
 
-                try:
-                    value = coerce_long(value)
-                except (TypeError, ValueError):
+        self.collectd.Notification(
+            plugin=self.name, plugin_instance=plugin_instance,
+            type="gauge", type_instance="status",
+            severity=severity, message=message,
+        ).dispatch()
+
+    def admit_series(self, socket, instances, plugin_instance, width):
+        """
+        Checks whether a new stats plugin instance fits under `MaxSeries`,
+        adding it to the known instances if so.
+
+        :param socket: The socket being read from.
+        :type socket: HAProxySocket
+
+        :param instances: The set of plugin instances already admitted.
+        :type instances: set
+
+        :param plugin_instance: The new plugin instance.
+        :type plugin_instance: str
+
+        :param width: The number of series each plugin instance has.
+        :type width: int
+        """
+        if (len(instances) + 1) * width > self.max_series:
+            self.truncated(socket, "series")
+            return False
+
+        instances.add(plugin_instance)
+        return True
+
+    def truncated(self, socket, reason):
+        """
+        Reports that a limit was hit while reading from a socket, logging a
+        warning and dispatching a "truncated_<reason>" metric at most once
+        per socket and reason each read.
+
+        :param socket: The socket being read from.
+        :type socket: HAProxySocket
+
+        :param reason: Which limit was hit, "response", "rows" or "series".
+        :type reason: str
+        """
+        key = (socket.socket_file_path, reason)
+        if key in self.truncations:
+            return
+        self.truncations.add(key)
+
+        self.collectd.warning(
+            "Reached the %s limit reading from %s, data was dropped." % (
+                reason, socket.socket_file_path
+            )
+        )
+        metric = self.metrics.get_custom("truncated_" + reason, "gauge")
+        metric.dispatch(plugin_instance=socket.name or self.name, values=[1])
+
+    def write_snapshot(self, socket, kind, columns, labels, rows):
+        """
+        Publishes a parsed snapshot to the memory-mapped file for the given
+        socket and kind, e.g. "<SnapshotPath>.<socket name>.stat".
+
+        :param socket: The socket the snapshot came from.
+        :type socket: HAProxySocket
+
+        :param kind: The kind of snapshot, "info" or "stat".
+        :type kind: str
+
+        :param columns: The column names.
+        :type columns: list
+
+        :param labels: One label per row.
+        :type labels: list
+
+        :param rows: The rows of string values.
+        :type rows: list
+        """
+        key = (socket.socket_file_path, kind)
+        writer = self.snapshots.get(key)
+        if writer is None:
+            from .snapshot import SnapshotWriter
+
+            path = self.snapshot_path
+            if socket.name:
+                path += "." + socket.name
+            writer = SnapshotWriter(path + "." + kind)
+            self.snapshots[key] = writer
+
+        writer.write(columns, labels, rows)
+
+    def collect_tables(self, socket):
+        """
+        Method for sending HAProxy stick table metrics to collectd.
+
+        Dispatches the size and usage of each table.  If a `TableData` type is
+        configured the entries of each table are streamed as well, counting
+        the keys over the `TableThreshold` (filtered on HAProxy's side) and
+        keeping a bounded heap of the `TableTopKeys` highest keys.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        self.collectd.debug("reading tables")
+        prefix = self.instance_prefix(socket)
+        for table, details in list(socket.gen_tables()):
+            plugin_instance = prefix + "table." + table
+
+            for label in ("size", "used"):
+                metric = self.metrics.get(label)
+                if metric is None or not details.get(label):
                     continue
+                metric.dispatch(
+                    plugin_instance=plugin_instance,
+                    values=[coerce_long(details[label])]
+                )
+
+            if self.table_data_type:
+                self.collect_table_entries(socket, table, plugin_instance)
+
+    def collect_table_entries(self, socket, table, plugin_instance):
+        """
+        Streams the entries of a single stick table and dispatches the
+        aggregations over the configured `TableData` type.
+
+        Memory use is bounded by `TableTopKeys`, regardless of table size.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
 
-                self.metrics[label].dispatch(
+        :param table: The name of the stick table.
+        :type table: str
+
+        :param plugin_instance: The plugin instance to dispatch under.
+        :type plugin_instance: str
+        """
+        data_type = self.table_data_type
+        data_filter = None
+        if self.table_threshold is not None:
+            data_filter = "data.%s gt %d" % (data_type, self.table_threshold)
+
+        count = 0
+        top = []
+        for key, data in socket.gen_table_entries(table, data_filter):
+            value = data.get(data_type)
+            if not value:
+                continue
+            count += 1
+
+            if not self.table_top_keys:
+                continue
+            item = (coerce_long(value), key)
+            if len(top) < self.table_top_keys:
+                heapq.heappush(top, item)
+            elif item > top[0]:
+                heapq.heapreplace(top, item)
+
+        if data_filter:
+            metric = self.metrics.get_custom(
+                "keys_over_" + data_type, "gauge"
+            )
+            metric.dispatch(plugin_instance=plugin_instance, values=[count])
+
+        metric = self.metrics.get_custom("top_" + data_type, "gauge")
+        for value, key in top:
+            metric.dispatch(
+                plugin_instance=plugin_instance,
+                type_instance="top_%s-%s" % (data_type, key),
+                values=[value]
+            )
+
+    def collect_pools(self, socket):
+        """
+        Method for sending HAProxy memory pool metrics to collectd.
+
+        Each pool is dispatched under a "pool.<name>" plugin instance.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        self.collectd.debug("reading pools")
+        prefix = self.instance_prefix(socket)
+        for pool_name, values in socket.gen_pools():
+            plugin_instance = prefix + "pool." + pool_name
+
+            for label, value in iteritems(values):
+                metric = self.metrics.get(label)
+                if metric is None:
+                    continue
+
+                metric.dispatch(
+                    plugin_instance=plugin_instance,
+                    values=[coerce_long(value)]
+                )
+
+    def collect_activity(self, socket):
+        """
+        Method for sending HAProxy scheduler activity metrics to collectd.
+
+        Each thread is dispatched under a "activity.thread<N>" plugin
+        instance, with threads numbered from 1 as HAProxy does.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        self.collectd.debug("reading activity")
+        prefix = self.instance_prefix(socket)
+        for label, values in socket.gen_activity():
+            metric = self.metrics.get(label)
+            if metric is None:
+                continue
+
+            for thread, value in enumerate(values, 1):
+                metric.dispatch(
+                    plugin_instance=prefix + "activity.thread%d" % thread,
+                    values=[coerce_long(value)]
+                )
+
+    def collect_server_states(self, socket):
+        """
+        Method for sending "show servers state" metrics to collectd.
+
+        The parsed (plugin_instance, metric, value) entries cached by
+        `refresh_server_states()` are re-dispatched on every read, while the
+        command itself only runs every `ServerStateInterval` seconds.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        server_states = self.server_states.get(socket.socket_file_path, {})
+        for entries in server_states.values():
+            for plugin_instance, metric, value in entries:
+                metric.dispatch(
                     plugin_instance=plugin_instance, values=[value]
                 )
+
+    def refresh_server_states(self, socket):
+        """
+        Runs "show servers state" and rebuilds the socket's cache of
+        enumerated state values, keyed by backend id.  Values that don't
+        convert are left out, as in `dispatch_row()`.
+
+        :param socket: The socket to collect from.
+        :type socket: HAProxySocket
+        """
+        self.collectd.debug("reading server states")
+        rows = socket.gen_server_state_rows()
+        fields = next(rows, None)
+        if fields is None:
+            return
+
+        plan = self.metrics.plan(fields)
+        be_id = fields.index("be_id")
+        be_name = fields.index("be_name")
+        srv_name = fields.index("srv_name")
+        width = max([entry[0] for entry in plan] + [srv_name]) + 1
+        prefix = self.instance_prefix(socket)
+
+        server_states = {}
+        for row in rows:
+            if len(row) < width:
+                continue
+            plugin_instance = prefix + row[be_name] + "." + row[srv_name]
+            entries = server_states.setdefault(row[be_id], [])
+            for index, metric, convert in plan:
+                value = convert(row[index])
+                if value is not None:
+                    entries.append((plugin_instance, metric, value))
+
+        self.server_states[socket.socket_file_path] = server_states
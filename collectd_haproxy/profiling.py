@@ -0,0 +1,197 @@
+import collections
+import sys
+import threading
+
+
+class ReadProfiler(object):
+    """
+    Base class for profilers that wrap a fixed number of plugin reads and
+    then dump their aggregated stats to a file.
+
+    Subclasses implement `start()`, `stop()` and `dump()`.
+    """
+
+    def __init__(self, path, reads):
+        """
+        The ReadProfiler constructor.
+
+        :param path: The path to write the aggregated stats to.
+        :type path: str
+
+        :param reads: The number of reads to profile.
+        :type reads: int
+        """
+        self.path = path
+        self.remaining = reads
+
+    @property
+    def finished(self):
+        """
+        Whether all of the requested reads have been profiled.
+        """
+        return self.remaining <= 0
+
+    def runcall(self, func):
+        """
+        Runs a function (i.e. one read) under the profiler.
+
+        :param func: The function to run.
+        :type func: function
+        """
+        self.remaining -= 1
+        self.start()
+        try:
+            return func()
+        finally:
+            self.stop()
+
+    def start(self):
+        """
+        Starts profiling.
+        """
+        raise NotImplementedError
+
+    def stop(self):
+        """
+        Stops profiling.
+        """
+        raise NotImplementedError
+
+    def dump(self):
+        """
+        Writes the aggregated stats to the profiler's path.
+        """
+        raise NotImplementedError
+
+
+class CProfileProfiler(ReadProfiler):
+    """
+    Deterministic profiler based on cProfile.  Every call is traced, so the
+    numbers are exact but the reads being profiled run noticeably slower.
+
+    The stats are dumped in the `pstats` format.
+    """
+
+    def __init__(self, path, reads):
+        """
+        The CProfileProfiler constructor.
+
+        :param path: The path to write the pstats file to.
+        :type path: str
+
+        :param reads: The number of reads to profile.
+        :type reads: int
+        """
+        super(CProfileProfiler, self).__init__(path, reads)
+
+        import cProfile
+
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        """
+        Enables the cProfile tracer.
+        """
+        self.profile.enable()
+
+    def stop(self):
+        """
+        Disables the cProfile tracer.
+        """
+        self.profile.disable()
+
+    def dump(self):
+        """
+        Writes the pstats file.
+        """
+        self.profile.dump_stats(self.path)
+
+
+class SamplingProfiler(ReadProfiler):
+    """
+    Low-overhead statistical profiler.  While a read runs, a background
+    thread periodically grabs the reading thread's current stack and tallies
+    it, the read itself is not traced at all.
+
+    The stats are dumped as "collapsed" stacks (one `frame;frame;... count`
+    line per distinct stack, outermost frame first) as used by flame graph
+    tools.
+    """
+
+    def __init__(self, path, reads, interval=0.001):
+        """
+        The SamplingProfiler constructor.
+
+        :param path: The path to write the collapsed stacks to.
+        :type path: str
+
+        :param reads: The number of reads to profile.
+        :type reads: int
+
+        :param interval: The number of seconds between samples.
+        :type interval: float
+        """
+        super(SamplingProfiler, self).__init__(path, reads)
+
+        self.interval = interval
+        self.stacks = collections.defaultdict(int)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts the sampling thread, targeting the calling thread.
+        """
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.sample, args=(threading.current_thread().ident,)
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the sampling thread.
+        """
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def sample(self, thread_id):
+        """
+        Sampling thread loop, tallies the target thread's stack every
+        `interval` seconds until stopped.
+
+        :param thread_id: The ident of the thread to sample.
+        :type thread_id: int
+        """
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s:%d" % (
+                    code.co_filename, code.co_name, code.co_firstlineno
+                ))
+                frame = frame.f_back
+            stack.reverse()
+
+            self.stacks[";".join(stack)] += 1
+
+    def dump(self):
+        """
+        Writes the collapsed stacks, most sampled first.
+        """
+        ordered = sorted(self.stacks.items(), key=lambda item: -item[1])
+        with open(self.path, "w") as output:
+            for stack, count in ordered:
+                output.write("%s %d\n" % (stack, count))
+
+
+PROFILERS = {
+    "cprofile": CProfileProfiler,
+    "sampling": SamplingProfiler,
+}
@@ -0,0 +1,261 @@
+import mmap
+import os
+import struct
+
+
+MAGIC = b"HAPS"
+FORMAT_VERSION = 1
+
+# <magic> <format version> <generation> <column count> <row count>
+# <offset of row labels> <offset of the numeric rows> <total size>
+HEADER = struct.Struct("<4sHQIIIII")
+GENERATION = struct.Struct("<Q")
+GENERATION_OFFSET = 6
+
+LENGTH = struct.Struct("<H")
+
+# value used in the numeric rows for empty or non-numeric fields
+MISSING = -(2 ** 63)
+
+MIN_SIZE = 4096
+
+
+class SnapshotWriter(object):
+    """
+    Publishes parsed HAProxy snapshots into a memory-mapped file that other
+    local processes can read without locks and without touching HAProxy.
+
+    The layout (all little-endian) is a fixed header, then the column names
+    and row labels as length-prefixed UTF-8 strings, then the rows as fixed
+    width signed 64-bit integers (`MISSING` for empty or non-numeric fields).
+
+    The header's generation counter works as a seqlock: it is bumped to an
+    odd value before the data is touched and to the next even value once the
+    write is complete, so readers can detect and retry torn reads.
+    """
+
+    def __init__(self, path):
+        """
+        The SnapshotWriter constructor.
+
+        :param path: Path of the file to publish to, e.g. somewhere under
+            /dev/shm.
+        :type path: str
+        """
+        self.path = path
+        self.fd = None
+        self.map = None
+        self.generation = 0
+
+    def open(self, size):
+        """
+        Opens (and if need be grows) the backing file and maps it, carrying
+        on from the generation of any snapshot already in the file.
+
+        :param size: The minimum number of bytes needed.
+        :type size: int
+        """
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        current = os.fstat(self.fd).st_size
+        if current < size:
+            new_size = max(MIN_SIZE, current)
+            while new_size < size:
+                new_size *= 2
+            os.ftruncate(self.fd, new_size)
+            current = new_size
+
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.fd, current)
+
+        header = HEADER.unpack_from(self.map, 0)
+        if header[0] == MAGIC and header[1] == FORMAT_VERSION:
+            # round up to even in case a previous writer died mid-write
+            self.generation = header[2] + (header[2] % 2)
+
+    def write(self, columns, labels, rows):
+        """
+        Publishes a snapshot.
+
+        :param columns: The column names.
+        :type columns: list
+
+        :param labels: One label per row, e.g. "<pxname>/<svname>".
+        :type labels: list
+
+        :param rows: The rows of string values, each as long as `columns`.
+        :type rows: list
+        """
+        encoded_columns = encode_strings(columns)
+        strings = encoded_columns + encode_strings(labels)
+        labels_offset = HEADER.size + len(encoded_columns)
+        rows_offset = HEADER.size + len(strings)
+        rows_offset += -rows_offset % 8
+
+        row_struct = struct.Struct("<%dq" % len(columns))
+        size = rows_offset + row_struct.size * len(rows)
+
+        if self.map is None or len(self.map) < size:
+            self.open(size)
+
+        GENERATION.pack_into(self.map, GENERATION_OFFSET, self.generation + 1)
+
+        self.map[HEADER.size:HEADER.size + len(strings)] = strings
+        width = len(columns)
+        for index, row in enumerate(rows):
+            values = [to_number(value) for value in row[:width]]
+            values.extend([MISSING] * (width - len(values)))
+            row_struct.pack_into(
+                self.map, rows_offset + index * row_struct.size, *values
+            )
+
+        self.generation += 2
+        HEADER.pack_into(
+            self.map, 0,
+            MAGIC, FORMAT_VERSION, self.generation,
+            len(columns), len(rows), labels_offset, rows_offset, size
+        )
+
+    def close(self):
+        """
+        Unmaps and closes the backing file.
+        """
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SnapshotReader(object):
+    """
+    Reads the latest snapshot published by a `SnapshotWriter`.
+    """
+
+    def __init__(self, path):
+        """
+        The SnapshotReader constructor.
+
+        :param path: Path of the snapshot file.
+        :type path: str
+        """
+        self.path = path
+
+    def read(self, attempts=10):
+        """
+        Returns a (generation, columns, labels, rows) tuple for the latest
+        complete snapshot, or `None` if there isn't one (or no consistent
+        read could be made within the given number of attempts).
+
+        Rows are lists of ints, with `None` for empty/non-numeric fields.
+
+        :param attempts: How many times to retry a torn read.
+        :type attempts: int
+        """
+        for _ in range(attempts):
+            # the file is re-mapped each attempt in case the writer grew it
+            with open(self.path, "rb") as fd:
+                if os.fstat(fd.fileno()).st_size < HEADER.size:
+                    return None
+                snapshot_map = mmap.mmap(
+                    fd.fileno(), 0, access=mmap.ACCESS_READ
+                )
+
+            try:
+                snapshot = self.read_consistent(snapshot_map)
+            finally:
+                snapshot_map.close()
+
+            if snapshot is not None:
+                return snapshot
+
+    def read_consistent(self, snapshot_map):
+        """
+        Makes a single attempt at reading a snapshot, returning `None` if a
+        write was in progress or happened during the read.
+
+        :param snapshot_map: The mapped snapshot file.
+        :type snapshot_map: mmap.mmap
+        """
+        header = HEADER.unpack_from(snapshot_map, 0)
+        magic, version, generation = header[:3]
+        column_count, row_count, labels_offset, rows_offset, size = header[3:]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        if generation % 2 or size > len(snapshot_map):
+            return None
+
+        columns, _ = decode_strings(snapshot_map, HEADER.size, column_count)
+        labels, _ = decode_strings(snapshot_map, labels_offset, row_count)
+
+        row_struct = struct.Struct("<%dq" % column_count)
+        rows = []
+        for index in range(row_count):
+            values = row_struct.unpack_from(
+                snapshot_map, rows_offset + index * row_struct.size
+            )
+            rows.append([
+                None if value == MISSING else value for value in values
+            ])
+
+        if GENERATION.unpack_from(snapshot_map, GENERATION_OFFSET)[0] != (
+                generation):
+            return None
+
+        return (generation, columns, labels, rows)
+
+
+def to_number(value):
+    """
+    Converts a field value to an int, `MISSING` if it's empty or non-numeric.
+
+    :param value: The field value.
+    :type value: str
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def encode_strings(strings):
+    """
+    Encodes a list of strings as length-prefixed UTF-8 bytes.
+
+    :param strings: The strings to encode.
+    :type strings: list
+    """
+    encoded = []
+    for string in strings:
+        data = string.encode("utf-8")
+        encoded.append(LENGTH.pack(len(data)))
+        encoded.append(data)
+
+    return b"".join(encoded)
+
+
+def decode_strings(buff, offset, count):
+    """
+    Decodes `count` length-prefixed UTF-8 strings starting at `offset`,
+    returning the strings and the offset just past the last one.
+
+    :param buff: The buffer to decode from.
+    :type buff: mmap.mmap
+
+    :param offset: Where the first string starts.
+    :type offset: int
+
+    :param count: How many strings to decode.
+    :type count: int
+    """
+    strings = []
+    for _ in range(count):
+        length, = LENGTH.unpack_from(buff, offset)
+        offset += LENGTH.size
+        strings.append(buff[offset:offset + length].decode("utf-8"))
+        offset += length
+
+    return strings, offset
@@ -0,0 +1,266 @@
+import sys
+
+
+class StubValues(object):
+    """
+    Stand-in for `collectd.Values` that records dispatches on its module
+    rather than sending them anywhere.
+    """
+
+    def __init__(self, module, **kwargs):
+        """
+        The StubValues constructor.
+
+        :param module: The `StubCollectd` the values belong to.
+        :type module: StubCollectd
+
+        :param kwargs: The `collectd.Values` attributes, e.g. "plugin",
+            "type" and "type_instance".
+        :type kwargs: dict
+        """
+        self.module = module
+        self.plugin = kwargs.get("plugin")
+        self.type = kwargs.get("type")
+        self.type_instance = kwargs.get("type_instance")
+        self.plugin_instance = kwargs.get("plugin_instance")
+
+    def dispatch(self, **kwargs):
+        """
+        Records a dispatch of these values, like `collectd.Values.dispatch`
+        keyword arguments override the instance's attributes.
+
+        :param kwargs: Attribute overrides, e.g. "plugin_instance" and
+            "values".
+        :type kwargs: dict
+        """
+        self.module.dispatched += 1
+        if self.module.keep_values:
+            self.module.values.append((
+                kwargs.get("plugin_instance", self.plugin_instance),
+                kwargs.get("type", self.type),
+                kwargs.get("type_instance", self.type_instance),
+                kwargs.get("values"),
+            ))
+
+
+class StubNotification(object):
+    """
+    Stand-in for `collectd.Notification` that records dispatches on its
+    module rather than sending them anywhere.
+    """
+
+    def __init__(self, module, **kwargs):
+        """
+        The StubNotification constructor.
+
+        :param module: The `StubCollectd` the notification belongs to.
+        :type module: StubCollectd
+
+        :param kwargs: The `collectd.Notification` attributes, e.g.
+            "severity" and "message".
+        :type kwargs: dict
+        """
+        self.module = module
+        self.attributes = kwargs
+
+    def dispatch(self):
+        """
+        Records the notification on the module, logging it if verbose.
+        """
+        self.module.notifications.append(self.attributes)
+        if self.module.verbose:
+            self.module.log(
+                "notification", self.attributes.get("message", "")
+            )
+
+
+class StubConfigNode(object):
+    """
+    Stand-in for a `collectd.Config` node.
+    """
+
+    def __init__(self, key, values=(), children=()):
+        """
+        The StubConfigNode constructor.
+
+        :param key: The config option name, e.g. "Socket".
+        :type key: str
+
+        :param values: The option's values.
+        :type values: tuple
+
+        :param children: Any child nodes.
+        :type children: list
+        """
+        self.key = key
+        self.values = tuple(values)
+        self.children = list(children)
+
+
+class StubCollectd(object):
+    """
+    A minimal stand-in for the `collectd` module that only exists inside
+    collectd's embedded python interpreter.
+
+    Lets the plugin run standalone (e.g. from the command line runner) with
+    dispatched values counted, and optionally kept, rather than sent on.
+    """
+
+    NOTIF_FAILURE = 1
+    NOTIF_WARNING = 2
+    NOTIF_OKAY = 4
+
+    def __init__(self, verbose=False, keep_values=False, stream=None):
+        """
+        The StubCollectd constructor.
+
+        :param verbose: Whether to print debug log messages as well.
+        :type verbose: bool
+
+        :param keep_values: Whether to keep every dispatched value in the
+            `values` list rather than only counting them.
+        :type keep_values: bool
+
+        :param stream: Where log messages go, defaults to stderr.
+        :type stream: file
+        """
+        self.verbose = verbose
+        self.keep_values = keep_values
+        self.stream = stream or sys.stderr
+
+        self.dispatched = 0
+        self.values = []
+        self.notifications = []
+        self.callbacks = {}
+
+    def Values(self, **kwargs):
+        """
+        Creates a `StubValues` tied to this module.
+
+        :param kwargs: The `collectd.Values` attributes.
+        :type kwargs: dict
+        """
+        return StubValues(self, **kwargs)
+
+    def Notification(self, **kwargs):
+        """
+        Creates a `StubNotification` tied to this module.
+
+        :param kwargs: The `collectd.Notification` attributes.
+        :type kwargs: dict
+        """
+        return StubNotification(self, **kwargs)
+
+    def log(self, level, message):
+        """
+        Writes a log message to the stream.
+
+        :param level: The log level name.
+        :type level: str
+
+        :param message: The message to write.
+        :type message: str
+        """
+        self.stream.write("[%s] %s\n" % (level, message))
+
+    def debug(self, message):
+        """
+        Logs a message at the "debug" level, only if verbose.
+
+        :param message: The message to write.
+        :type message: str
+        """
+        if self.verbose:
+            self.log("debug", message)
+
+    def info(self, message):
+        """
+        Logs a message at the "info" level, only if verbose.
+
+        :param message: The message to write.
+        :type message: str
+        """
+        if self.verbose:
+            self.log("info", message)
+
+    def warn(self, message):
+        """
+        Logs a message at the "warning" level.
+
+        :param message: The message to write.
+        :type message: str
+        """
+        self.log("warning", message)
+
+    def warning(self, message):
+        """
+        Logs a message at the "warning" level, under the name collectd's own
+        module uses.
+
+        :param message: The message to write.
+        :type message: str
+        """
+        self.log("warning", message)
+
+    def error(self, message):
+        """
+        Logs a message at the "error" level.
+
+        :param message: The message to write.
+        :type message: str
+        """
+        self.log("error", message)
+
+    def register_config(self, callback, name=None):
+        """
+        Records the "config" callback.
+
+        :param callback: The callback function.
+        :type callback: function
+
+        :param name: The plugin name.
+        :type name: str
+        """
+        self.callbacks["config"] = callback
+
+    def register_init(self, callback, name=None):
+        """
+        Records the "init" callback.
+
+        :param callback: The callback function.
+        :type callback: function
+
+        :param name: The plugin name.
+        :type name: str
+        """
+        self.callbacks["init"] = callback
+
+    def register_read(self, callback, name=None):
+        """
+        Records the "read" callback.
+
+        :param callback: The callback function.
+        :type callback: function
+
+        :param name: The plugin name.
+        :type name: str
+        """
+        self.callbacks["read"] = callback
+
+    def unregister_init(self, callback):
+        """
+        Drops the "init" callback.
+
+        :param callback: The callback function.
+        :type callback: function
+        """
+        self.callbacks.pop("init", None)
+
+    def unregister_read(self, callback):
+        """
+        Drops the "read" callback.
+
+        :param callback: The callback function.
+        :type callback: function
+        """
+        self.callbacks.pop("read", None)
@@ -0,0 +1,221 @@
+import marshal
+import multiprocessing
+
+from .stub import StubCollectd
+
+
+class WorkerCollectd(StubCollectd):
+    """
+    The stand-in `collectd` module used inside a worker process.
+
+    Dispatched values, notifications and log messages are all buffered up
+    so that each read's worth can be sent back to collectd's process as a
+    single batch (see `batch()`).
+    """
+
+    def __init__(self):
+        """
+        The WorkerCollectd constructor.
+        """
+        super(WorkerCollectd, self).__init__(keep_values=True)
+
+        self.messages = []
+
+    def log(self, level, message):
+        """
+        Buffers a log message, to be logged by collectd's process.
+
+        :param level: The name of the `collectd` logging function, e.g.
+            "warning".
+        :type level: str
+
+        :param message: The message to log.
+        :type message: str
+        """
+        self.messages.append((level, message))
+
+    def debug(self, message):
+        """
+        Buffers a message to log at the "debug" level.
+
+        :param message: The message to log.
+        :type message: str
+        """
+        self.log("debug", message)
+
+    def info(self, message):
+        """
+        Buffers a message to log at the "info" level.
+
+        :param message: The message to log.
+        :type message: str
+        """
+        self.log("info", message)
+
+    def warn(self, message):
+        """
+        Buffers a message to log at the "warning" level.
+
+        :param message: The message to log.
+        :type message: str
+        """
+        self.log("warning", message)
+
+    def warning(self, message):
+        """
+        Buffers a message to log at the "warning" level.
+
+        :param message: The message to log.
+        :type message: str
+        """
+        self.log("warning", message)
+
+    def error(self, message):
+        """
+        Buffers a message to log at the "error" level.
+
+        :param message: The message to log.
+        :type message: str
+        """
+        self.log("error", message)
+
+    def batch(self):
+        """
+        Returns everything buffered since the last batch as a `marshal`-ed
+        (values, notifications, messages) tuple, emptying the buffers.
+
+        Values are (plugin instance, type, type instance, values) tuples,
+        notifications are dictionaries of `collectd.Notification` attributes
+        and messages are (level, message) tuples.
+        """
+        batch = marshal.dumps((
+            tuple(self.values), tuple(self.notifications),
+            tuple(self.messages),
+        ))
+        self.values = []
+        self.notifications = []
+        self.messages = []
+
+        return batch
+
+
+def run_worker(plugin, connection, parent_connection):
+    """
+    The worker process' main loop.
+
+    The plugin (a forked copy of the one in collectd's process) is switched
+    over to a `WorkerCollectd` and initialized, then runs a read for each
+    request on the connection and sends back the resulting batch, until the
+    connection is closed.  The copy's `worker` is cleared first, as it was
+    forked with the parent's set, so that its reads collect rather than
+    defer to a worker of their own.
+
+    :param plugin: The plugin instance.
+    :type plugin: HAProxyPlugin
+
+    :param connection: The worker's end of the pipe.
+    :type connection: multiprocessing.Connection
+
+    :param parent_connection: The parent's end of the pipe, closed here so
+        that the worker sees EOF once the parent goes away.
+    :type parent_connection: multiprocessing.Connection
+    """
+    parent_connection.close()
+
+    collectd = WorkerCollectd()
+    plugin.collectd = collectd
+    plugin.use_worker = False
+    plugin.worker = None
+    plugin.initialize()
+
+    while True:
+        try:
+            connection.recv_bytes()
+        except EOFError:
+            break
+
+        try:
+            plugin.read()
+        except Exception as e:
+            collectd.error("Error reading in worker: %s" % e)
+
+        connection.send_bytes(collectd.batch())
+
+
+class CollectorWorker(object):
+    """
+    Manages a long-lived child process that does a plugin's socket I/O and
+    parsing, so that the work doesn't compete for the GIL of collectd's
+    embedded interpreter with other python plugins.
+
+    The child is forked from collectd's process (collectd's own executable
+    can't be used to spawn a fresh python) and sent a request per read, the
+    response is a `WorkerCollectd` batch to be dispatched.
+    """
+
+    def __init__(self, plugin, timeout):
+        """
+        The CollectorWorker constructor.
+
+        :param plugin: The plugin instance, copied into the worker process.
+        :type plugin: HAProxyPlugin
+
+        :param timeout: The seconds to wait for a read's batch before giving
+            up on the worker and restarting it.
+        :type timeout: float
+        """
+        self.plugin = plugin
+        self.timeout = timeout
+
+        self.process = None
+        self.connection = None
+
+    def start(self):
+        """
+        Forks the worker process.
+        """
+        try:
+            context = multiprocessing.get_context("fork")
+        except AttributeError:  # pragma: no cover
+            context = multiprocessing  # python 2 always forks
+
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(self.plugin, child_connection, self.connection),
+        )
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+
+    def stop(self):
+        """
+        Closes the pipe and terminates the worker process.
+        """
+        self.connection.close()
+        self.process.terminate()
+        self.process.join()
+
+    def read(self):
+        """
+        Has the worker run a read, returning the unmarshalled (values,
+        notifications, messages) batch or `None` if the worker didn't
+        respond within the timeout, in which case it is restarted.
+        """
+        if not self.process.is_alive():
+            self.plugin.collectd.warning("Collector worker died, restarting")
+            self.stop()
+            self.start()
+
+        try:
+            self.connection.send_bytes(b"read")
+            if self.connection.poll(self.timeout):
+                return marshal.loads(self.connection.recv_bytes())
+        except (IOError, EOFError):
+            pass
+
+        self.plugin.collectd.error(
+            "No response from collector worker, restarting"
+        )
+        self.stop()
+        self.start()
@@ -0,0 +1,205 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import Mock, patch
+
+from collectd_haproxy.compat import PY35
+from collectd_haproxy.plugin import HAProxyPlugin
+
+if PY35:
+    from collectd_haproxy.aio import (
+        AsyncEngine, AsyncHAProxySocket, AsyncMasterSocket,
+    )
+    from collectd_haproxy.connection import HAProxySocket
+
+
+RESPONSES = {
+    "show info": "Pid: 12\nCurrConns: 20\n\n",
+    "show stat -1 7 -1": "# pxname,svname,scur,\nfe,FRONTEND,4,\n\n",
+    "show stat -1 3 -1": (
+        "# pxname,svname,iid,scur,\nfe,FRONTEND,2,4,\n"
+        "be1,BACKEND,3,1,\nbe2,BACKEND,4,2,\n\n"
+    ),
+    "show stat 3 4 -1": "# pxname,svname,iid,scur,\nbe1,app01,3,1,\n\n",
+    "show stat 4 4 -1": "# pxname,svname,iid,scur,\nbe2,app01,4,2,\n\n",
+}
+
+
+def serve(server, received):
+    while True:
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        command = conn.recv(1024).decode("ascii").strip()
+        received.append(command)
+        conn.sendall(RESPONSES.get(command, "Unknown command.\n").encode())
+        conn.close()
+
+
+@unittest.skipUnless(PY35, "asyncio engine requires python 3.5+")
+class AsyncEngineTests(unittest.TestCase):
+
+    def setUp(self):
+        super(AsyncEngineTests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.received = []
+        self.paths = []
+        for name in ("proc1", "proc2"):
+            path = os.path.join(self.tmp_dir, name + ".sock")
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(8)
+            self.addCleanup(server.close)
+
+            thread = threading.Thread(
+                target=serve, args=(server, self.received)
+            )
+            thread.daemon = True
+            thread.start()
+
+            self.paths.append(path)
+
+    def test_prefetch_serves_previously_sent_commands(self):
+        collectd = Mock()
+        engine = AsyncEngine(collectd)
+        self.addCleanup(engine.close)
+
+        sockets = [AsyncHAProxySocket(collectd, path) for path in self.paths]
+
+        # first read: nothing to prefetch, commands go out blocking
+        engine.prefetch(sockets)
+        for s in sockets:
+            self.assertEqual(
+                list(s.gen_info()), [("Pid", "12"), ("CurrConns", "20")]
+            )
+        self.assertEqual(self.received, ["show info", "show info"])
+
+        # second read: all prefetched concurrently up front
+        engine.prefetch(sockets)
+        self.assertEqual(len(self.received), 4)
+
+        with patch.object(HAProxySocket, "send_command") as send_command:
+            for s in sockets:
+                self.assertEqual(
+                    list(s.gen_info()), [("Pid", "12"), ("CurrConns", "20")]
+                )
+            self.assertFalse(send_command.called)
+
+    def test_prefetch_failure_falls_back_to_blocking(self):
+        collectd = Mock()
+        engine = AsyncEngine(collectd)
+        self.addCleanup(engine.close)
+
+        missing = os.path.join(self.tmp_dir, "missing.sock")
+        s = AsyncHAProxySocket(collectd, missing)
+        s.commands.add("show info")
+
+        engine.prefetch([s])
+
+        self.assertEqual(s.prefetched, {})
+        self.assertTrue(collectd.debug.called)
+
+        with patch.object(HAProxySocket, "send_command") as send_command:
+            send_command.return_value = "Pid: 12"
+            self.assertEqual(list(s.gen_info()), [("Pid", "12")])
+            send_command.assert_called_once_with("show info")
+
+    def test_prefetched_error_responses_are_processed(self):
+        collectd = Mock()
+
+        s = AsyncHAProxySocket(collectd, self.paths[0])
+        s.prefetched = {"show pools": "Unknown command.\n"}
+
+        self.assertEqual(s.send_command("show pools"), "")
+        collectd.error.assert_called_once_with(
+            "Unknown HAProxy command: show pools"
+        )
+        self.assertEqual(s.pop_commands(), set(["show pools"]))
+        self.assertEqual(s.pop_commands(), set())
+
+    def test_master_socket_commands_are_prefetchable(self):
+        s = AsyncMasterSocket(Mock(), self.paths[0])
+        s.prefetched = {
+            "show proc": "1162 master 0\n1271 worker 1\n",
+            "@!1271 show stat -1 7 -1": (
+                "# pxname,svname,scur,\nfe,FRONTEND,4,\n"
+            ),
+        }
+
+        self.assertEqual(list(s.gen_stat_rows(True, True, True)), [
+            ["pxname", "svname", "scur", ""],
+            ["fe", "FRONTEND", "4", ""],
+        ])
+        self.assertEqual(
+            s.pop_commands(), set(["show proc", "@!1271 show stat -1 7 -1"])
+        )
+        self.assertEqual(self.received, [])
+
+    def test_reset_drops_prefetched(self):
+        s = AsyncHAProxySocket(Mock(), self.paths[0])
+        s.prefetched = {"show info": "Pid: 12\n"}
+
+        s.reset()
+
+        self.assertEqual(s.prefetched, {})
+
+    def test_prefetch_respects_max_response_bytes(self):
+        collectd = Mock()
+        engine = AsyncEngine(collectd)
+        self.addCleanup(engine.close)
+
+        s = AsyncHAProxySocket(collectd, self.paths[0])
+        s.max_response_bytes = 12
+        s.commands.add("show info")
+
+        engine.prefetch([s])
+
+        self.assertEqual(s.prefetched, {"show info": "Pid: 12\n"})
+        self.assertEqual(s.truncated, True)
+
+    def test_replace_command(self):
+        s = AsyncHAProxySocket(Mock(), self.paths[0])
+        s.commands = set(["show info", "show stat 3 4 -1"])
+
+        s.replace_command("show stat 3 4 -1", "show stat 4 4 -1")
+        s.replace_command(None, None)
+
+        self.assertEqual(
+            s.pop_commands(), set(["show info", "show stat 4 4 -1"])
+        )
+
+    def test_server_sampling_prefetches_next_slice(self):
+        p = HAProxyPlugin(Mock())
+        p.socket_configs = [(self.paths[0], None)]
+        p.engine_name = "asyncio"
+        p.include_info = False
+        p.track_reloads = False
+        p.server_sampling = 2
+        p.initialize()
+        self.addCleanup(p.engine.close)
+
+        p.read()
+
+        self.assertEqual(
+            self.received, ["show stat -1 3 -1", "show stat 3 4 -1"]
+        )
+
+        del self.received[:]
+        with patch.object(HAProxySocket, "send_command") as send_command:
+            p.read()
+
+        self.assertFalse(send_command.called)
+        self.assertEqual(
+            sorted(self.received), ["show stat -1 3 -1", "show stat 4 4 -1"]
+        )
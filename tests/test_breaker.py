@@ -0,0 +1,65 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from collectd_haproxy.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        super(CircuitBreakerTests, self).setUp()
+
+        self.now = 1000.0
+        self.breaker = CircuitBreaker(
+            10, 60, clock=lambda: self.now, rand=lambda: 0.0
+        )
+
+    def test_starts_closed(self):
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.allow(), True)
+
+    def test_failure_opens_with_exponential_backoff(self):
+        delays = [self.breaker.failure() for _ in range(5)]
+
+        self.assertEqual(delays, [10, 20, 40, 60, 60])
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_at, 1060)
+
+    def test_jitter(self):
+        breaker = CircuitBreaker(
+            10, 60, jitter=0.5, clock=lambda: self.now, rand=lambda: 0.5
+        )
+
+        self.assertEqual(breaker.failure(), 7.5)
+
+    def test_half_open_probe(self):
+        self.breaker.failure()
+
+        self.now += 9
+        self.assertEqual(self.breaker.allow(), False)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.now += 1
+        self.assertEqual(self.breaker.allow(), True)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+    def test_failed_probe_backs_off_further(self):
+        self.breaker.failure()
+        self.now += 10
+        self.breaker.allow()
+
+        self.assertEqual(self.breaker.failure(), 20)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_success_closes(self):
+        self.breaker.failure()
+        self.now += 10
+        self.breaker.allow()
+
+        self.breaker.success()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertEqual(self.breaker.failure(), 10)
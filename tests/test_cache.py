@@ -0,0 +1,121 @@
+import threading
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import Mock
+
+from collectd_haproxy.cache import ResponseCache
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        super(ResponseCacheTests, self).setUp()
+
+        self.now = 100.0
+        self.cache = ResponseCache(clock=lambda: self.now)
+
+    def test_fetch_caches_until_ttl(self):
+        func = Mock(side_effect=["first", "second"])
+        key = ("/var/run/sock.sock", "show info")
+
+        self.assertEqual(self.cache.fetch(key, 5, func, "show info"), "first")
+
+        self.now += 4
+        self.assertEqual(self.cache.fetch(key, 5, func, "show info"), "first")
+        func.assert_called_once_with("show info")
+
+        self.now += 1
+        self.assertEqual(self.cache.fetch(key, 5, func, "show info"), "second")
+
+    def test_fetch_keys_apart(self):
+        func = Mock(side_effect=lambda command: command)
+
+        self.cache.fetch(("/var/run/a.sock", "show info"), 5, func, "a")
+        self.cache.fetch(("/var/run/b.sock", "show info"), 5, func, "b")
+        self.cache.fetch(("/var/run/a.sock", "show stat"), 5, func, "c")
+
+        self.assertEqual(func.call_count, 3)
+
+    def test_fetch_drops_expired_entries(self):
+        self.cache.fetch(("a", "show info"), 1, Mock())
+        self.now += 2
+        self.cache.fetch(("b", "show info"), 1, Mock())
+
+        self.assertEqual(list(self.cache.entries), [("b", "show info")])
+
+    def test_fetch_error_is_not_cached(self):
+        func = Mock(side_effect=[IOError("refused"), "ok"])
+        key = ("/var/run/sock.sock", "show info")
+
+        self.assertRaises(IOError, self.cache.fetch, key, 5, func)
+        self.assertEqual(self.cache.fetch(key, 5, func), "ok")
+        self.assertEqual(self.cache.pending, {})
+
+    def test_concurrent_fetches_are_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "response"
+
+        key = ("/var/run/sock.sock", "show stat -1 7 -1")
+        results = []
+
+        def read():
+            results.append(self.cache.fetch(key, 5, func))
+
+        leader = threading.Thread(target=read)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=read) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["response"] * 4)
+
+    def test_concurrent_fetch_error_is_shared(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def func():
+            started.set()
+            release.wait()
+            raise IOError("refused")
+
+        key = ("/var/run/sock.sock", "show info")
+        errors = []
+
+        def read():
+            try:
+                self.cache.fetch(key, 5, func)
+            except IOError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=read)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=read)
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(errors, ["refused", "refused"])
+
+    def test_clear(self):
+        self.cache.fetch(("a", "show info"), 5, Mock())
+
+        self.cache.clear()
+
+        self.assertEqual(self.cache.entries, {})
@@ -0,0 +1,117 @@
+import gzip
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import patch, Mock
+
+from collectd_haproxy.capture import CaptureWriter, ReplaySocket, read_capture
+
+
+class CaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        super(CaptureTests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.path = os.path.join(self.tmp_dir, "capture.gz")
+
+    def test_round_trip(self):
+        writer = CaptureWriter(self.path, "/var/run/haproxy.sock")
+        writer.record("show info", "Pid: 12\n", 0.25)
+        writer.record("show stat -1 7 -1", "# pxname,svname,\n", 0.5)
+        writer.close()
+
+        records = read_capture(self.path)
+
+        self.assertEqual(
+            [(r["command"], r["response"], r["elapsed"]) for r in records],
+            [
+                ("show info", "Pid: 12\n", 0.25),
+                ("show stat -1 7 -1", "# pxname,svname,\n", 0.5),
+            ]
+        )
+
+    def test_read_unclosed_capture(self):
+        writer = CaptureWriter(self.path)
+        writer.record("show info", "Pid: 12\n", 0.25)
+        writer.record("show info", "Pid: 13\n", 0.25)
+
+        with open(self.path, "rb") as fd:
+            data = fd.read()
+        with open(self.path, "wb") as fd:
+            fd.write(data[:-4])
+
+        records = read_capture(self.path)
+
+        self.assertEqual(records[0]["response"], "Pid: 12\n")
+        writer.close()
+
+    def test_read_not_a_capture(self):
+        with gzip.open(self.path, "wb") as fd:
+            fd.write(b'{"show info": "Pid: 12"}\n')
+
+        self.assertRaises(ValueError, read_capture, self.path)
+
+    def test_replay_cycles_responses(self):
+        writer = CaptureWriter(self.path)
+        writer.record("show info", "Pid: 12\nUptime_sec: 1\n", 0.25)
+        writer.record("show info", "Pid: 12\nUptime_sec: 2\n", 0.25)
+        writer.close()
+
+        s = ReplaySocket(Mock(), self.path)
+
+        self.assertEqual(
+            [s.send_command("show info") for _ in range(3)],
+            [
+                "Pid: 12\nUptime_sec: 1",
+                "Pid: 12\nUptime_sec: 2",
+                "Pid: 12\nUptime_sec: 1",
+            ]
+        )
+
+    @patch("collectd_haproxy.capture.time.sleep")
+    def test_replay_realtime(self, sleep):
+        writer = CaptureWriter(self.path)
+        writer.record("show info", "Pid: 12\n", 0.25)
+        writer.close()
+
+        s = ReplaySocket(Mock(), self.path)
+        s.send_command("show info")
+
+        self.assertFalse(sleep.called)
+
+        s.realtime = True
+        s.send_command("show info")
+
+        sleep.assert_called_once_with(0.25)
+
+    def test_replay_unknown_command(self):
+        writer = CaptureWriter(self.path)
+        writer.close()
+        collectd = Mock()
+
+        s = ReplaySocket(collectd, self.path)
+
+        self.assertEqual(s.send_command("show info"), None)
+        collectd.error.assert_called_once_with(
+            "No recorded response for 'show info'"
+        )
+
+    def test_replay_gen_response_lines(self):
+        writer = CaptureWriter(self.path)
+        writer.record("show table", "# table: be, type: ip\n", 0.1)
+        writer.close()
+
+        s = ReplaySocket(Mock(), self.path)
+
+        self.assertEqual(
+            list(s.gen_response_lines("show table")),
+            ["# table: be, type: ip"]
+        )
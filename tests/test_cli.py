@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import patch
+
+from collectd_haproxy import cli
+from collectd_haproxy.capture import CaptureWriter
+from collectd_haproxy.compat import PY3
+
+if PY3:
+    from io import StringIO
+else:  # pragma: no cover
+    from StringIO import StringIO
+
+
+class CLITests(unittest.TestCase):
+
+    def setUp(self):
+        super(CLITests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        example_stats_file = os.path.join(
+            os.path.dirname(__file__), "./example_stats.csv"
+        )
+        with open(example_stats_file, "r") as fd:
+            example_stats = fd.read()
+
+        self.payload = os.path.join(self.tmp_dir, "payload.json")
+        with open(self.payload, "w") as fd:
+            json.dump(
+                {
+                    "show info": "Pid: 12\nUptime_sec: 100\nCurrConns: 20\n",
+                    "show stat -1 7 -1": example_stats,
+                },
+                fd
+            )
+
+    def test_parse_option(self):
+        node = cli.parse_option("IncludeInfo=false")
+        self.assertEqual((node.key, node.values), ("IncludeInfo", (False,)))
+
+        node = cli.parse_option("PoolsInterval=30")
+        self.assertEqual((node.key, node.values), ("PoolsInterval", (30.0,)))
+
+        node = cli.parse_option("TableData=http_req_rate")
+        self.assertEqual(node.values, ("http_req_rate",))
+
+    def test_main_with_payload(self):
+        stream = StringIO()
+
+        result = cli.main(["--payload", self.payload, "-n", "3"], stream)
+
+        self.assertEqual(result, 0)
+
+        lines = stream.getvalue().split("\n")
+        self.assertEqual(lines[0].split()[0], "phase")
+        self.assertEqual(lines[1].split()[:2], ["collect_info", "3"])
+        # the static "Pid" is only sent on the first cycle
+        self.assertEqual(lines[1].split()[-1], "7")
+        self.assertEqual(lines[2].split()[:2], ["collect_stats", "3"])
+        self.assertEqual(lines[3].split()[:2], ["read", "3"])
+
+    def test_main_with_replay(self):
+        capture = os.path.join(self.tmp_dir, "capture.gz")
+        writer = CaptureWriter(capture)
+        with open(self.payload) as fd:
+            for command, response in sorted(json.load(fd).items()):
+                writer.record(command, response, 0.5)
+        writer.close()
+        stream = StringIO()
+
+        with patch("collectd_haproxy.capture.time.sleep") as sleep:
+            result = cli.main(["--replay", capture, "-n", "2"], stream)
+
+        self.assertEqual(result, 0)
+        self.assertFalse(sleep.called)
+
+        lines = stream.getvalue().split("\n")
+        self.assertEqual(lines[1].split()[:2], ["collect_info", "2"])
+        self.assertEqual(lines[2].split()[:2], ["collect_stats", "2"])
+
+        with patch("collectd_haproxy.capture.time.sleep") as sleep:
+            cli.main(["--replay", capture, "-n", "1", "--realtime"], stream)
+
+        sleep.assert_called_with(0.5)
+
+    def test_main_with_options(self):
+        stream = StringIO()
+
+        cli.main(
+            ["--payload", self.payload, "-n", "1", "-o", "IncludeStats=false"],
+            stream
+        )
+
+        phases = [line.split()[0] for line in stream.getvalue().split("\n")
+                  if line]
+        self.assertEqual(phases, ["phase", "collect_info", "read"])
+
+    def test_main_with_profile(self):
+        stream = StringIO()
+        profile = os.path.join(self.tmp_dir, "profile.out")
+
+        cli.main(
+            ["--payload", self.payload, "-n", "1", "--profile", profile],
+            stream
+        )
+
+        self.assertTrue(os.path.exists(profile))
+        self.assertIn("function calls", stream.getvalue())
+
+    @patch.object(cli, "make_line_profiler")
+    def test_main_line_profile_not_installed(self, make_line_profiler):
+        make_line_profiler.return_value = None
+        stream = StringIO()
+
+        result = cli.main(
+            ["--payload", self.payload, "--line-profile"], stream
+        )
+
+        self.assertEqual(result, 1)
+        self.assertEqual(
+            stream.getvalue(), "line_profiler is not installed.\n"
+        )
@@ -1,13 +1,21 @@
 import errno
+import json
 import os
+import shutil
+import tempfile
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
-from mock import patch, Mock
+from mock import patch, Mock, ANY
 
-from collectd_haproxy.connection import HAProxySocket
+from collectd_haproxy.cache import ResponseCache
+from collectd_haproxy.connection import (
+    HAProxySocket, MasterSocket, PayloadSocket,
+    parse_worker_pids, aggregate_stat_rows, split_stat_sections,
+    split_csv_line,
+)
 
 
 class HAProxySocketTests(unittest.TestCase):
@@ -41,14 +49,11 @@ class HAProxySocketTests(unittest.TestCase):
 
         s = HAProxySocket(collectd, "/var/run/sock.sock")
 
-        result = s.send_command("a command")
+        self.assertRaises(IOError, s.send_command, "a command")
 
         self.socket.connect.assert_called_once_with("/var/run/sock.sock")
-        self.assertEqual(result, None)
-
-        collectd.error.assert_called_once_with(
-            "Connection refused.  Is HAProxy running?"
-        )
+        self.socket.close.assert_called_once_with()
+        self.assertFalse(collectd.error.called)
 
     def test_send_command_othererror_connecting(self):
         collectd = Mock()
@@ -85,6 +90,48 @@ a
  fake response"""
         )
 
+    def test_send_command_max_response_bytes(self):
+        self.response_chunks = [
+            b"# pxname,svname,\n",
+            b"fe,FRONTEND,\nbe,BACK",
+            b"END,\nbe,app01,\n",
+            b"be,app02,\n",
+            None
+        ]
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+        s.max_response_bytes = 30
+
+        result = s.send_command("show stat")
+
+        self.assertEqual(result, "# pxname,svname,\nfe,FRONTEND,")
+        self.assertEqual(s.truncated, True)
+        self.assertEqual(len(self.response_chunks), 3)
+        self.socket.close.assert_called_once_with()
+
+    def test_send_command_under_max_response_bytes(self):
+        self.response_chunks = [b"Pid: 12\n", None]
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+        s.max_response_bytes = 1024
+
+        self.assertEqual(s.send_command("show info"), "Pid: 12")
+        self.assertEqual(s.truncated, False)
+
+    def test_send_command_records_raw_response(self):
+        self.response_chunks = [b"Pid: 12\nUptime_sec: 100\n", None]
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+        s.max_response_bytes = 10
+        s.recorder = Mock()
+
+        self.assertEqual(s.send_command("show info"), "Pid: 12")
+
+        command, response, elapsed = s.recorder.record.call_args[0]
+        self.assertEqual(command, "show info")
+        self.assertEqual(response, "Pid: 12\nUptime_sec: 100\n")
+        self.assertTrue(elapsed >= 0)
+
     def test_send_command_error_when_sending(self):
         collectd = Mock()
 
@@ -199,6 +246,185 @@ OtherInfo: ok"""
 
         send_command.assert_called_once_with("show stat -1 7 -1")
 
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows_for_proxy_ids(self, send_command):
+        send_command.return_value = "\n".join([
+            "# pxname,svname,iid,scur,",
+            "be1,app01,3,1,",
+            "be1,app02,3,2,",
+            "# pxname,svname,iid,scur,",
+            "be3,app01,5,4,",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        result = list(s.gen_stat_rows(False, False, True, ["3", "5"]))
+
+        send_command.assert_called_once_with(
+            "show stat 3 4 -1; show stat 5 4 -1"
+        )
+        self.assertEqual(result, [
+            ["pxname", "svname", "iid", "scur", ""],
+            ["be1", "app01", "3", "1", ""],
+            ["be1", "app02", "3", "2", ""],
+            ["be3", "app01", "5", "4", ""],
+        ])
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows_shares_cached_response(self, send_command):
+        send_command.return_value = "\n".join([
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,41,",
+            "be,app01,3,",
+            "be,BACKEND,3,",
+        ])
+        cache = ResponseCache()
+
+        frontends = HAProxySocket(Mock(), "/var/run/sock.sock")
+        frontends.cache = cache
+        frontends.cache_ttl = 5
+        servers = HAProxySocket(Mock(), "/var/run/sock.sock")
+        servers.cache = cache
+        servers.cache_ttl = 5
+
+        self.assertEqual(list(frontends.gen_stat_rows(True, False, True)), [
+            ["pxname", "svname", "scur", ""],
+            ["fe", "FRONTEND", "41", ""],
+            ["be", "app01", "3", ""],
+        ])
+        self.assertEqual(list(servers.gen_stat_rows(False, True, True)), [
+            ["pxname", "svname", "scur", ""],
+            ["be", "app01", "3", ""],
+            ["be", "BACKEND", "3", ""],
+        ])
+        send_command.assert_called_once_with("show stat -1 7 -1")
+
+        list(servers.gen_stat_rows(False, False, True, ["3"]))
+
+        send_command.assert_called_with("show stat 3 4 -1")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows_cached_aggregates_skip_servers(self, send_command):
+        send_command.return_value = "\n".join([
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,41,",
+            "be,BACKEND,3,",
+        ])
+        cache = ResponseCache()
+
+        for include_frontends in (True, False):
+            s = HAProxySocket(Mock(), "/var/run/sock.sock")
+            s.cache = cache
+            s.cache_ttl = 5
+
+            rows = list(s.gen_stat_rows(include_frontends, True, False))
+
+            self.assertEqual(rows[-1], ["be", "BACKEND", "3", ""])
+
+        send_command.assert_called_once_with("show stat -1 3 -1")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows_shares_truncation(self, send_command):
+        cache = ResponseCache()
+        sockets = []
+        for _ in range(2):
+            s = HAProxySocket(Mock(), "/var/run/sock.sock")
+            s.cache = cache
+            s.cache_ttl = 5
+            sockets.append(s)
+
+        def truncated_response(command):
+            if command == "show info":
+                return "Pid: 12"
+            sockets[0].truncated = True
+            return "# pxname,svname,scur,\nfe,FRONTEND,41,"
+
+        send_command.side_effect = truncated_response
+
+        for s in sockets:
+            list(s.gen_stat_rows(True, True, True))
+
+        send_command.assert_called_once_with("show stat -1 7 -1")
+        self.assertEqual([s.truncated for s in sockets], [True, True])
+
+        sockets[1].truncated = False
+        list(sockets[1].gen_info())
+
+        self.assertEqual(sockets[1].truncated, False)
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_info_shares_cached_response(self, send_command):
+        send_command.return_value = "Pid: 12\nCurrConns: 3"
+        cache = ResponseCache()
+
+        for _ in range(2):
+            s = HAProxySocket(Mock(), "/var/run/sock.sock")
+            s.cache = cache
+            s.cache_ttl = 5
+
+            self.assertEqual(
+                list(s.gen_info()), [("Pid", "12"), ("CurrConns", "3")]
+            )
+
+        send_command.assert_called_once_with("show info")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows_quoted_fields(self, send_command):
+        send_command.return_value = "\n".join([
+            "# pxname,svname,scur,check_desc,cookie,rate",
+            'be1,app01,1,"Layer7 wrong status, 503",app01,7',
+            'be1,app02,2,"says ""hi"", twice",,8',
+            "be1,app03,3,Layer4 check passed,,9",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        result = list(s.gen_stat_rows(False, False, True))
+
+        self.assertEqual(result[1:], [
+            ["be1", "app01", "1", "Layer7 wrong status, 503", "app01", "7"],
+            ["be1", "app02", "2", 'says "hi", twice', "", "8"],
+            ["be1", "app03", "3", "Layer4 check passed", "", "9"],
+        ])
+
+    @patch("collectd_haproxy.connection.split_csv_line")
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows_parses_lazily(self, send_command, split_line):
+        send_command.return_value = "\n".join(
+            ["# pxname,svname,scur,"] +
+            ['be,app%02d,"up, %d",' % (i, i) for i in range(10)]
+        )
+        split_line.side_effect = split_csv_line
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        rows = s.gen_stat_rows(False, False, True)
+        next(rows)
+        next(rows)
+        next(rows)
+        rows.close()
+
+        self.assertEqual(split_line.call_count, 2)
+
+    def test_split_stat_sections(self):
+        sections = split_stat_sections("\n".join([
+            "be,app00,1,",
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,3,",
+            "",
+            "# pxname,svname,scur,",
+            "# pxname,svname,",
+            "be,app01,1,",
+        ]))
+
+        self.assertEqual(list(sections), [
+            (["pxname", "svname", "scur", ""], None),
+            (["pxname", "svname", "scur", ""], ["fe", "FRONTEND", "3", ""]),
+            (["pxname", "svname", "scur", ""], None),
+            (["pxname", "svname", ""], None),
+            (["pxname", "svname", ""], ["be", "app01", "1", ""]),
+        ])
+
     @patch.object(HAProxySocket, "send_command")
     def test_gen_stats__backend_server(self, send_command):
         send_command.return_value = None
@@ -388,3 +614,500 @@ OtherInfo: ok"""
                 "wretr": "",
             }
         )
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_stat_rows(self, send_command):
+        send_command.return_value = "\n".join([
+            "# pxname,svname,scur,",
+            "frontend,FRONTEND,41,",
+            "appservers,app01,3,",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        result = s.gen_stat_rows(
+            include_frontends=True,
+            include_backends=True,
+            include_servers=True
+        )
+
+        self.assertEqual(
+            list(result),
+            [
+                ["pxname", "svname", "scur", ""],
+                ["frontend", "FRONTEND", "41", ""],
+                ["appservers", "app01", "3", ""],
+            ]
+        )
+
+    def test_gen_response_lines_across_chunks(self):
+        self.response_chunks = [
+            b"# table: be_rl, type: ip",
+            b", size:100, used:2\n0x1: key=a use=0\n",
+            IOError(errno.EINTR, ""),
+            b"0x2: key=b use=1",
+            None
+        ]
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        result = list(s.gen_response_lines("show table be_rl"))
+
+        self.socket.sendall.assert_called_once_with(b"show table be_rl\n")
+        self.assertEqual(
+            result,
+            [
+                "# table: be_rl, type: ip, size:100, used:2",
+                "0x1: key=a use=0",
+                "0x2: key=b use=1",
+            ]
+        )
+        self.socket.close.assert_called_once_with()
+
+    def test_gen_response_lines_records_response(self):
+        self.response_chunks = [b"0x1: key=a\n0x2", b": key=b\n", None]
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+        s.recorder = Mock()
+
+        result = list(s.gen_response_lines("show table be_rl"))
+
+        self.assertEqual(result, ["0x1: key=a", "0x2: key=b"])
+        s.recorder.record.assert_called_once_with(
+            "show table be_rl", "0x1: key=a\n0x2: key=b\n", ANY
+        )
+
+    def test_gen_response_lines_error_response(self):
+        collectd = Mock()
+
+        self.response_chunks = [b"Unknown command.\nUsage: ...\n", None]
+
+        s = HAProxySocket(collectd, "/var/run/sock.sock")
+
+        self.assertEqual(list(s.gen_response_lines("show table")), [])
+        collectd.error.assert_called_once_with(
+            "Unknown HAProxy command: show table"
+        )
+        self.socket.close.assert_called_once_with()
+
+    def test_gen_response_lines_connection_refused(self):
+        self.socket.connect.side_effect = IOError(errno.ECONNREFUSED, "")
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertRaises(
+            IOError, list, s.gen_response_lines("show table")
+        )
+
+    @patch.object(HAProxySocket, "gen_response_lines")
+    def test_gen_tables(self, gen_response_lines):
+        gen_response_lines.return_value = iter([
+            "# table: be_rl, type: ip, size:102400, used:3",
+            "# table: fe_conn, type: string, size:10, used:0",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertEqual(
+            list(s.gen_tables()),
+            [
+                ("be_rl", {"type": "ip", "size": "102400", "used": "3"}),
+                ("fe_conn", {"type": "string", "size": "10", "used": "0"}),
+            ]
+        )
+        gen_response_lines.assert_called_once_with("show table")
+
+    @patch.object(HAProxySocket, "gen_response_lines")
+    def test_gen_table_entries(self, gen_response_lines):
+        gen_response_lines.return_value = iter([
+            "# table: be_rl, type: ip, size:102400, used:2",
+            "0x55d4c8e2f0a8: key=10.0.0.1 use=0 exp=59990 "
+            "http_req_rate(10000)=5",
+            "0x55d4c8e2f0b0: key=10.0.0.2 use=1 exp=100 "
+            "http_req_rate(10000)=12",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        result = s.gen_table_entries("be_rl", "data.http_req_rate gt 4")
+
+        self.assertEqual(
+            list(result),
+            [
+                (
+                    "10.0.0.1",
+                    {"use": "0", "exp": "59990", "http_req_rate": "5"}
+                ),
+                (
+                    "10.0.0.2",
+                    {"use": "1", "exp": "100", "http_req_rate": "12"}
+                ),
+            ]
+        )
+        gen_response_lines.assert_called_once_with(
+            "show table be_rl data.http_req_rate gt 4"
+        )
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_server_state_rows(self, send_command):
+        send_command.return_value = "\n".join([
+            "1",
+            "# be_id be_name srv_id srv_name srv_op_state srv_fqdn",
+            "3 be_app 1 app1 2 -",
+            "3 be_app 2 app2 0 some host",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertEqual(
+            list(s.gen_server_state_rows("be_app")),
+            [
+                [
+                    "be_id", "be_name", "srv_id", "srv_name",
+                    "srv_op_state", "srv_fqdn",
+                ],
+                ["3", "be_app", "1", "app1", "2", "-"],
+                ["3", "be_app", "2", "app2", "0", "some host"],
+            ]
+        )
+        send_command.assert_called_once_with("show servers state be_app")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_server_state_rows_no_legit_response(self, send_command):
+        send_command.return_value = ""
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertEqual(list(s.gen_server_state_rows()), [])
+        send_command.assert_called_once_with("show servers state")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_pools(self, send_command):
+        send_command.return_value = "\n".join([
+            "Dumping pools usage. Use SIGQUIT to flush them.",
+            "  - Pool pipe (32 bytes) : 5 allocated (160 bytes), 5 used, "
+            "0 failures, 2 users [SHARED]",
+            "  - Pool trash (16416 bytes) : 1 allocated (16416 bytes), "
+            "1 used (~0 by thread caches), needed_avg 0, 3 failures, "
+            "2 users, @0x55d4c8e2f0a8 [SHARED]",
+            "Total: 2 pools, 16576 bytes allocated, 16576 used.",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertEqual(
+            list(s.gen_pools()),
+            [
+                (
+                    "pipe",
+                    {
+                        "pool_size": "32",
+                        "pool_allocated": "5",
+                        "pool_allocated_bytes": "160",
+                        "pool_used": "5",
+                        "pool_failures": "0",
+                    }
+                ),
+                (
+                    "trash",
+                    {
+                        "pool_size": "16416",
+                        "pool_allocated": "1",
+                        "pool_allocated_bytes": "16416",
+                        "pool_used": "1",
+                        "pool_failures": "3",
+                    }
+                ),
+            ]
+        )
+        send_command.assert_called_once_with("show pools")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_activity(self, send_command):
+        send_command.return_value = "\n".join([
+            "thread_id: 1 (1..2)",
+            "date_now: 1545045656.454437",
+            "loops: 1005 2200",
+            "wake_tasks: 2010 [ ~1005 1005 ]",
+            "stream: 4 [ 3 1 ]",
+        ])
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertEqual(
+            list(s.gen_activity()),
+            [
+                ("loops", ["1005", "2200"]),
+                ("wake_tasks", ["1005", "1005"]),
+                ("stream", ["3", "1"]),
+            ]
+        )
+        send_command.assert_called_once_with("show activity")
+
+    @patch.object(HAProxySocket, "send_command")
+    def test_gen_pools_and_activity_no_legit_response(self, send_command):
+        send_command.return_value = None
+
+        s = HAProxySocket(Mock(), "/var/run/sock.sock")
+
+        self.assertEqual(list(s.gen_pools()), [])
+        self.assertEqual(list(s.gen_activity()), [])
+
+
+SHOW_PROC = """#<PID>          <type>          <reloads>       <uptime>
+1162            master          0               0d00h00m08s
+# workers
+1271            worker          1               0d00h00m00s
+1272            worker          1               0d00h00m00s
+# old workers
+1233            worker          3               0d00h00m43s
+# programs
+"""
+
+
+class MasterSocketTests(unittest.TestCase):
+
+    def setUp(self):
+        super(MasterSocketTests, self).setUp()
+
+        self.responses = {"show proc": SHOW_PROC}
+
+        patcher = patch.object(HAProxySocket, "send_command")
+        send_command = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        send_command.side_effect = lambda command: self.responses[command]
+        self.send_command = send_command
+
+    def test_parse_worker_pids(self):
+        self.assertEqual(parse_worker_pids(SHOW_PROC), ["1271", "1272"])
+
+    def test_parse_worker_pids_1_8_format(self):
+        response = "\n".join([
+            "#<PID> <type> <relative PID> <reloads> <uptime>",
+            "1162 master 0 0 0d 00h00m08s",
+            "1271 worker 1 0 0d 00h00m00s",
+            "1272 worker 2 0 0d 00h00m00s",
+        ])
+
+        self.assertEqual(parse_worker_pids(response), ["1271", "1272"])
+
+    def test_aggregate_stat_rows(self):
+        fields = [
+            "pxname", "svname", "scur", "smax", "status", "stot", "rtime",
+        ]
+
+        rows = aggregate_stat_rows(fields, [
+            [
+                ["fe", "FRONTEND", "3", "10", "OPEN", "100", ""],
+                ["be", "app01", "1", "4", "UP", "50", "20"],
+            ],
+            [
+                ["be", "app01", "2", "3", "DOWN", "60", "30"],
+                ["be", "app02", "5", "5", "UP", "70", "10"],
+                ["fe", "FRONTEND", "4", "8", "OPEN", "", "5"],
+            ],
+        ])
+
+        self.assertEqual(rows, [
+            ["fe", "FRONTEND", "7", "10", "OPEN", "100", "5"],
+            ["be", "app01", "3", "4", "UP", "110", "30"],
+            ["be", "app02", "5", "5", "UP", "70", "10"],
+        ])
+
+    def test_gen_stat_rows_pipelines_to_workers(self):
+        self.responses[
+            "@!1271 show stat -1 7 -1; @!1272 show stat -1 7 -1"
+        ] = "\n".join([
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,3,",
+            "be,app01,1,",
+            "",
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,4,",
+            "be,app01,2,",
+            "",
+        ])
+
+        s = MasterSocket(Mock(), "/var/run/master.sock")
+
+        self.assertEqual(list(s.gen_stat_rows(True, True, True)), [
+            ["pxname", "svname", "scur", ""],
+            ["fe", "FRONTEND", "7", ""],
+            ["be", "app01", "3", ""],
+        ])
+        self.assertEqual(s.workers, ["1271", "1272"])
+
+    def test_gen_stat_rows_shares_cached_response(self):
+        command = "@!1271 show stat -1 3 -1; @!1272 show stat -1 3 -1"
+        self.responses[command] = "\n".join([
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,3,",
+            "be,BACKEND,1,",
+            "# pxname,svname,scur,",
+            "fe,FRONTEND,4,",
+            "be,BACKEND,2,",
+        ])
+        cache = ResponseCache()
+
+        rows = []
+        for include_frontends in (True, False):
+            s = MasterSocket(Mock(), "/var/run/master.sock")
+            s.cache = cache
+            s.cache_ttl = 5
+
+            rows.append(
+                list(s.gen_stat_rows(include_frontends, False, False))[1:]
+            )
+
+        self.assertEqual(rows, [[["fe", "FRONTEND", "7", ""]], []])
+        self.assertEqual(
+            [c[0][0] for c in self.send_command.call_args_list],
+            ["show proc", command, "show proc"]
+        )
+
+    def test_gen_stat_rows_skips_mismatched_workers(self):
+        self.responses[
+            "@!1271 show stat -1 4 -1; @!1272 show stat -1 4 -1"
+        ] = "\n".join([
+            "# pxname,svname,scur,",
+            "be,app01,1,",
+            "# pxname,svname,scur,stot,",
+            "be,app01,2,30,",
+            "",
+        ])
+        collectd = Mock()
+
+        s = MasterSocket(collectd, "/var/run/master.sock")
+
+        self.assertEqual(list(s.gen_stat_rows(False, False, True)), [
+            ["pxname", "svname", "scur", ""],
+            ["be", "app01", "1", ""],
+        ])
+        collectd.warning.assert_called_once_with(
+            "Skipped 1 worker response(s) with mismatched stat fields"
+        )
+
+    def test_gen_stat_rows_for_proxy_ids(self):
+        self.responses[
+            "@!1271 show stat 3 4 -1; @!1271 show stat 5 4 -1; "
+            "@!1272 show stat 3 4 -1; @!1272 show stat 5 4 -1"
+        ] = "\n".join([
+            "# pxname,svname,scur,",
+            "be1,app01,1,",
+            "# pxname,svname,scur,",
+            "be3,app01,2,",
+            "# pxname,svname,scur,",
+            "be1,app01,3,",
+            "# pxname,svname,scur,",
+            "be3,app01,4,",
+        ])
+
+        s = MasterSocket(Mock(), "/var/run/master.sock")
+
+        self.assertEqual(
+            list(s.gen_stat_rows(False, False, True, ["3", "5"])), [
+                ["pxname", "svname", "scur", ""],
+                ["be1", "app01", "4", ""],
+                ["be3", "app01", "6", ""],
+            ]
+        )
+
+    def test_gen_stat_rows_no_workers(self):
+        self.responses["show proc"] = ""
+
+        s = MasterSocket(Mock(), "/var/run/master.sock")
+
+        self.assertEqual(list(s.gen_stat_rows(True, True, True)), [])
+        self.send_command.assert_called_once_with("show proc")
+
+    def test_send_command_goes_to_first_worker(self):
+        self.responses["@!1271 show info"] = "Pid: 1271\n"
+
+        s = MasterSocket(Mock(), "/var/run/master.sock")
+
+        self.assertEqual(s.send_command("show info"), "Pid: 1271\n")
+        self.assertEqual(s.send_command("show info"), "Pid: 1271\n")
+
+        self.assertEqual(
+            [c[0][0] for c in self.send_command.call_args_list],
+            ["show proc", "@!1271 show info", "@!1271 show info"]
+        )
+
+    def test_worker_gone_forgets_workers(self):
+        collectd = Mock()
+
+        s = MasterSocket(collectd, "/var/run/master.sock")
+        s.workers = ["1271"]
+
+        result = s.process_command_response(
+            "@!1271 show info",
+            "Can't find the target PID matching the prefix '@!1271'\n"
+        )
+
+        self.assertEqual(result, "")
+        self.assertEqual(s.workers, [])
+        self.assertEqual(collectd.warning.call_count, 1)
+
+    def test_reset_forgets_workers(self):
+        s = MasterSocket(Mock(), "/var/run/master.sock")
+        s.workers = ["1271"]
+
+        s.reset()
+
+        self.assertEqual(s.workers, [])
+
+
+class PayloadSocketTests(unittest.TestCase):
+
+    def setUp(self):
+        super(PayloadSocketTests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.payload = os.path.join(self.tmp_dir, "payload.json")
+        with open(self.payload, "w") as fd:
+            json.dump(
+                {
+                    "show info": "Pid: 12\nCurrConns: 20\n",
+                    "show table": "# table: rl, type: ip, size:10, used:1\n",
+                    "show pools": "Unknown command.\n",
+                },
+                fd
+            )
+
+    def test_send_command(self):
+        s = PayloadSocket(Mock(), self.payload)
+
+        self.assertEqual(
+            list(s.gen_info()), [("Pid", "12"), ("CurrConns", "20")]
+        )
+
+    def test_send_command_not_recorded(self):
+        collectd = Mock()
+
+        s = PayloadSocket(collectd, self.payload)
+
+        self.assertEqual(s.send_command("show stat -1 7 -1"), None)
+        collectd.error.assert_called_once_with(
+            "No recorded response for 'show stat -1 7 -1'"
+        )
+
+    def test_send_command_recorded_error(self):
+        collectd = Mock()
+
+        s = PayloadSocket(collectd, self.payload)
+
+        self.assertEqual(list(s.gen_pools()), [])
+        collectd.error.assert_called_once_with(
+            "Unknown HAProxy command: show pools"
+        )
+
+    def test_gen_response_lines(self):
+        s = PayloadSocket(Mock(), self.payload)
+
+        self.assertEqual(
+            list(s.gen_tables()),
+            [("rl", {"type": "ip", "size": "10", "used": "1"})]
+        )
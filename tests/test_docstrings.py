@@ -5,6 +5,16 @@ import collectd_haproxy.plugin
 import collectd_haproxy.connection
 import collectd_haproxy.metrics
 import collectd_haproxy.compat
+import collectd_haproxy.stub
+import collectd_haproxy.cli
+import collectd_haproxy.snapshot
+import collectd_haproxy.profiling
+import collectd_haproxy.breaker
+import collectd_haproxy.memory
+import collectd_haproxy.capture
+import collectd_haproxy.worker
+import collectd_haproxy.cache
+from collectd_haproxy.compat import PY35
 
 
 modules_to_test = (
@@ -12,8 +22,21 @@ modules_to_test = (
     collectd_haproxy.connection,
     collectd_haproxy.metrics,
     collectd_haproxy.compat,
+    collectd_haproxy.stub,
+    collectd_haproxy.cli,
+    collectd_haproxy.snapshot,
+    collectd_haproxy.profiling,
+    collectd_haproxy.breaker,
+    collectd_haproxy.memory,
+    collectd_haproxy.capture,
+    collectd_haproxy.worker,
+    collectd_haproxy.cache,
 )
 
+if PY35:
+    import collectd_haproxy.aio
+    modules_to_test += (collectd_haproxy.aio,)
+
 
 def test_docstrings():
     for module in modules_to_test:
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from collectd_haproxy.memory import MemoryTracer
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+def allocate(size):
+    return [str(i) for i in range(size)]
+
+
+@unittest.skipUnless(tracemalloc, "tracemalloc requires python 3.4+")
+class MemoryTracerTests(unittest.TestCase):
+
+    def setUp(self):
+        super(MemoryTracerTests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.addCleanup(tracemalloc.stop)
+
+    def test_available(self):
+        self.assertEqual(MemoryTracer.available(), True)
+
+    def test_phases(self):
+        kept = []
+
+        def collect_stats(size):
+            kept.append(allocate(size))
+
+        def collect_info(size):
+            allocate(size)
+
+        tracer = MemoryTracer(top=0)
+
+        tracer.begin()
+        collectors = tracer.wrap([collect_stats, collect_info])
+        for collector in collectors:
+            collector(10000)
+        phases = tracer.end()
+
+        self.assertEqual(
+            sorted(phases), ["collect_info", "collect_stats", "read"]
+        )
+        # collect_stats' allocations are kept, collect_info's freed
+        self.assertTrue(phases["collect_stats"][0] > 100000)
+        self.assertTrue(phases["collect_info"][0] < 10000)
+        self.assertTrue(phases["collect_info"][1] > 100000)
+        self.assertTrue(phases["read"][0] >= phases["collect_stats"][0])
+        self.assertEqual(tracer.sites, [])
+
+    def test_measure_accumulates_and_reraises(self):
+        tracer = MemoryTracer(top=0)
+        tracer.begin()
+
+        def broken():
+            raise IOError("oops")
+
+        self.assertRaises(IOError, tracer.measure, "collect_stats", broken)
+        self.assertRaises(IOError, tracer.measure, "collect_stats", broken)
+
+        self.assertEqual(list(tracer.phases), ["collect_stats"])
+
+    def test_top_sites_and_dump(self):
+        path = os.path.join(self.tmp_dir, "memory.txt")
+        kept = []
+
+        tracer = MemoryTracer(top=3, path=path)
+        tracer.filename_pattern = "*test_memory.py"
+
+        tracer.begin()
+        kept.append(tracer.measure("collect_stats", allocate, 10000))
+        tracer.end()
+
+        self.assertTrue(tracer.sites)
+        self.assertTrue(len(tracer.sites) <= 3)
+        site, size, count = tracer.sites[0]
+        self.assertIn("test_memory.py", site)
+        self.assertTrue(size > 0)
+
+        with open(path) as fd:
+            report = fd.read()
+
+        self.assertTrue(report.startswith("# read at "))
+        self.assertIn("collect_stats", report)
+        self.assertIn("test_memory.py", report)
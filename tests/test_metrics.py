@@ -0,0 +1,259 @@
+import threading
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import Mock, call
+
+from collectd_haproxy.metrics import (
+    MetricRegistry, Enum, ServerCensus, STAT_ENUMS, SERVER_CENSUS,
+    compile_xref, to_long,
+)
+
+
+XREF = {
+    "CurrConns": ("current_connections", "gauge"),
+    "scur": ("current_session_count", "gauge"),
+    "stot": ("session_count", "counter"),
+}
+
+
+class MetricRegistryTests(unittest.TestCase):
+
+    def test_get_creates_values_lazily(self):
+        collectd = Mock()
+
+        r = MetricRegistry(collectd, "haproxy", XREF)
+
+        self.assertFalse(collectd.Values.called)
+
+        metric = r.get("CurrConns")
+
+        self.assertEqual(metric, collectd.Values.return_value)
+        collectd.Values.assert_called_once_with(
+            plugin="haproxy", type="gauge", type_instance="current_connections"
+        )
+
+    def test_get_reuses_values(self):
+        collectd = Mock()
+
+        r = MetricRegistry(collectd, "haproxy", XREF)
+
+        self.assertIs(r.get("scur"), r.get("scur"))
+        self.assertEqual(collectd.Values.call_count, 1)
+
+    def test_get_unknown_label(self):
+        collectd = Mock()
+
+        r = MetricRegistry(collectd, "haproxy", XREF)
+
+        self.assertEqual(r.get("Fake"), None)
+        self.assertFalse(collectd.Values.called)
+
+    def test_plan_aligns_with_column_indexes(self):
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: kwargs["type_instance"]
+
+        r = MetricRegistry(collectd, "haproxy", XREF)
+
+        plan = r.plan(["pxname", "svname", "qcur", "scur", "stot", ""])
+
+        self.assertEqual(
+            plan,
+            [
+                (3, "current_session_count", to_long),
+                (4, "session_count", to_long),
+            ]
+        )
+        collectd.Values.assert_has_calls([
+            call(
+                plugin="haproxy",
+                type="gauge", type_instance="current_session_count"
+            ),
+            call(
+                plugin="haproxy",
+                type="counter", type_instance="session_count"
+            ),
+        ])
+
+    def test_plan_is_cached_per_header(self):
+        collectd = Mock()
+
+        r = MetricRegistry(collectd, "haproxy", XREF)
+
+        fields = ["pxname", "svname", "scur"]
+
+        self.assertIs(r.plan(fields), r.plan(list(fields)))
+        self.assertIsNot(r.plan(fields), r.plan(["pxname", "scur"]))
+
+    def test_clear(self):
+        r = MetricRegistry(Mock(), "haproxy", XREF)
+
+        r.plan(["pxname", "scur"])
+        r.clear()
+
+        self.assertEqual(r.values, {})
+        self.assertEqual(r.plans, {})
+
+    def test_values_and_plans_are_per_thread(self):
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        r = MetricRegistry(collectd, "haproxy", XREF)
+
+        main_plan = r.plan(["pxname", "svname", "scur"])
+        results = {}
+
+        def collect():
+            results["plan"] = r.plan(["pxname", "svname", "scur"])
+            results["metric"] = r.get("scur")
+
+        thread = threading.Thread(target=collect)
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(results["plan"], main_plan)
+        self.assertIsNot(results["metric"], r.get("scur"))
+        self.assertEqual(results["plan"][0][0], 2)
+        self.assertEqual(collectd.Values.call_count, 2)
+
+    def test_clear_drops_every_threads_pool(self):
+        r = MetricRegistry(Mock(), "haproxy", XREF)
+        metric = r.get("scur")
+        plan = r.plan(["pxname", "scur"])
+
+        thread = threading.Thread(target=r.clear_plans)
+        thread.start()
+        thread.join()
+
+        self.assertIs(r.get("scur"), metric)
+        self.assertIsNot(r.plan(["pxname", "scur"]), plan)
+
+        thread = threading.Thread(target=r.clear)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(r.values, {})
+        self.assertEqual(r.plans, {})
+
+    def test_plan_uses_enum_converters(self):
+        collectd = Mock()
+
+        r = MetricRegistry(
+            collectd, "haproxy", {"status": ("status", "gauge")},
+            {"status": {"DOWN": 0, "UP": 1}}
+        )
+
+        plan = r.plan(["pxname", "svname", "status"])
+
+        self.assertEqual(len(plan), 1)
+        index, metric, convert = plan[0]
+        self.assertEqual(index, 2)
+        self.assertEqual(convert("UP"), 1)
+        self.assertEqual(convert("DOWN"), 0)
+
+
+class ConverterTests(unittest.TestCase):
+
+    def test_to_long(self):
+        self.assertEqual(to_long("12"), 12)
+        self.assertEqual(to_long(""), 0)
+        self.assertEqual(to_long("UP"), None)
+
+    def test_enum_exact_values(self):
+        status = Enum(STAT_ENUMS["status"])
+
+        self.assertEqual(status("UP"), 1)
+        self.assertEqual(status("DOWN"), 0)
+        self.assertEqual(status("MAINT"), 2)
+        self.assertEqual(status("no check"), 5)
+        self.assertEqual(status("OPEN"), 1)
+
+    def test_enum_decorated_values(self):
+        status = Enum(STAT_ENUMS["status"])
+        check_status = Enum(STAT_ENUMS["check_status"])
+
+        self.assertEqual(status("UP 1/3"), 1)
+        self.assertEqual(status("DOWN (agent)"), 0)
+        self.assertEqual(status("MAINT(via)"), 2)
+        self.assertEqual(check_status("* L7OK"), 13)
+        self.assertEqual(check_status("L4TOUT"), 6)
+
+        self.assertEqual(status.table["UP 1/3"], 1)
+        self.assertNotIn("UP 1/3", STAT_ENUMS["status"])
+
+    def test_enum_unknown_values(self):
+        status = Enum(STAT_ENUMS["status"])
+
+        self.assertEqual(status(""), None)
+        self.assertEqual(status("WEIRD"), None)
+        self.assertNotIn("WEIRD", status.table)
+
+
+class ServerCensusTests(unittest.TestCase):
+
+    def test_add_counts_servers_by_state(self):
+        census = ServerCensus(
+            ["pxname", "svname", "status"], Enum(STAT_ENUMS["status"])
+        )
+
+        self.assertEqual(census.add(["be", "app01", "UP"]), True)
+        self.assertEqual(census.add(["be", "app02", "UP 1/3"]), True)
+        self.assertEqual(census.add(["be", "app03", "DOWN"]), True)
+        self.assertEqual(census.add(["be", "app04", "bogus"]), True)
+        self.assertEqual(census.add(["be", "BACKEND", "UP"]), False)
+        self.assertEqual(census.add(["fe", "FRONTEND", "OPEN"]), False)
+
+        counts = dict(zip(SERVER_CENSUS, census.counts["be"]))
+        self.assertEqual(counts["servers_up"], 2)
+        self.assertEqual(counts["servers_down"], 1)
+        self.assertEqual(sum(counts.values()), 3)
+        self.assertEqual(list(census.counts), ["be"])
+
+
+class CompileXrefTests(unittest.TestCase):
+
+    def test_no_overrides(self):
+        compiled = compile_xref(XREF, {})
+
+        self.assertEqual(compiled, XREF)
+        self.assertIsNot(compiled, XREF)
+
+    def test_add_rename_retype_and_drop(self):
+        compiled = compile_xref(XREF, {
+            "conn_rate": {"type_instance": "connection_rate"},
+            "wrew": {"type": "counter"},
+            "scur": {"type_instance": "sessions"},
+            "stot": {"type": "derive"},
+            "CurrConns": {"drop": True},
+            "bogus": {"drop": True},
+        })
+
+        self.assertEqual(compiled, {
+            "conn_rate": ("connection_rate", "gauge"),
+            "wrew": ("wrew", "counter"),
+            "scur": ("sessions", "gauge"),
+            "stot": ("session_count", "derive"),
+        })
+        self.assertIn("CurrConns", XREF)
+
+    def test_overrides_compile_into_plans(self):
+        collectd = Mock()
+
+        r = MetricRegistry(collectd, "haproxy", compile_xref(XREF, {
+            "conn_rate": {"type_instance": "connection_rate"},
+            "scur": {"drop": True},
+        }))
+
+        plan = r.plan(["pxname", "svname", "scur", "stot", "conn_rate"])
+
+        self.assertEqual([entry[0] for entry in plan], [3, 4])
+        collectd.Values.assert_has_calls([
+            call(
+                plugin="haproxy", type="counter", type_instance="session_count"
+            ),
+            call(
+                plugin="haproxy", type="gauge", type_instance="connection_rate"
+            ),
+        ])
@@ -5,7 +5,11 @@ except ImportError:
 
 from mock import Mock, patch, call
 
+from collectd_haproxy.metrics import METRIC_XREF, STAT_ENUMS, MetricRegistry
 from collectd_haproxy.plugin import HAProxyPlugin
+from collectd_haproxy.breaker import CircuitBreaker
+from collectd_haproxy.compat import PY35
+from collectd_haproxy.stub import StubCollectd, StubConfigNode
 
 
 class HAProxyPluginTests(unittest.TestCase):
@@ -58,11 +62,40 @@ class HAProxyPluginTests(unittest.TestCase):
         config = Mock(
             children=[
                 Mock(key="Socket", values=("/var/run/sock.sock",)),
+                Mock(key="Worker", values=(True,)),
+                Mock(key="WorkerTimeout", values=(15.0,)),
                 Mock(key="IncludeInfo", values=(False,)),
                 Mock(key="IncludeStats", values=(True,)),
                 Mock(key="IncludeFrontendStats", values=(True,)),
                 Mock(key="IncludeBackendStats", values=(True,)),
                 Mock(key="IncludeServerStats", values=(False,)),
+                Mock(key="IncludeServerCensus", values=(True,)),
+                Mock(key="ServerSampling", values=(4.0,)),
+                Mock(key="NotifyStateChanges", values=(True,)),
+                Mock(key="BackoffBase", values=(5.0,)),
+                Mock(key="BackoffMax", values=(120.0,)),
+                Mock(key="IncludePools", values=(True,)),
+                Mock(key="PoolsInterval", values=(300.0,)),
+                Mock(key="IncludeActivity", values=(True,)),
+                Mock(key="ActivityInterval", values=(30.0,)),
+                Mock(key="IncludeServerState", values=(True,)),
+                Mock(key="ServerStateInterval", values=(120.0,)),
+                Mock(key="IncludeTables", values=(True,)),
+                Mock(key="MaxResponseBytes", values=(1048576.0,)),
+                Mock(key="ResponseCacheTTL", values=(0.5,)),
+                Mock(key="MaxRows", values=(5000.0,)),
+                Mock(key="MaxSeries", values=(100000.0,)),
+                Mock(key="ProfileReads", values=(50.0,)),
+                Mock(key="ProfilePath", values=("/tmp/reads.prof",)),
+                Mock(key="Profiler", values=("sampling",)),
+                Mock(key="TraceMemory", values=(True,)),
+                Mock(key="TraceMemoryTop", values=(5.0,)),
+                Mock(key="TraceMemoryPath", values=("/tmp/memory.txt",)),
+                Mock(key="RecordPath", values=("/tmp/capture.gz",)),
+                Mock(key="RecordReads", values=(3.0,)),
+                Mock(key="TableData", values=("http_req_rate",)),
+                Mock(key="TableThreshold", values=(100.0,)),
+                Mock(key="TableTopKeys", values=(5.0,)),
             ]
         )
 
@@ -70,13 +103,87 @@ class HAProxyPluginTests(unittest.TestCase):
 
         p.configure(config)
 
-        self.assertEqual(p.socket_file_path, "/var/run/sock.sock")
+        self.assertEqual(p.socket_configs, [("/var/run/sock.sock", None)])
 
+        self.assertEqual(p.use_worker, True)
+        self.assertEqual(p.worker_timeout, 15.0)
         self.assertEqual(p.include_info, False)
         self.assertEqual(p.include_stats, True)
         self.assertEqual(p.include_frontends, True)
         self.assertEqual(p.include_backends, True)
         self.assertEqual(p.include_servers, False)
+        self.assertEqual(p.include_server_census, True)
+        self.assertEqual(p.include_pools, True)
+        self.assertEqual(p.pools_interval, 300)
+        self.assertEqual(p.include_activity, True)
+        self.assertEqual(p.activity_interval, 30)
+        self.assertEqual(p.include_server_state, True)
+        self.assertEqual(p.server_state_interval, 120)
+        self.assertEqual(p.include_tables, True)
+        self.assertEqual(p.max_response_bytes, 1048576)
+        self.assertEqual(p.response_cache_ttl, 0.5)
+        self.assertEqual(p.max_rows, 5000)
+        self.assertEqual(p.max_series, 100000)
+        self.assertEqual(p.server_sampling, 4)
+        self.assertEqual(p.notify_state_changes, True)
+        self.assertEqual(p.backoff_base, 5.0)
+        self.assertEqual(p.backoff_max, 120.0)
+        self.assertEqual(p.profile_reads, 50)
+        self.assertEqual(p.profile_path, "/tmp/reads.prof")
+        self.assertEqual(p.profiler_name, "sampling")
+        self.assertEqual(p.trace_memory, True)
+        self.assertEqual(p.trace_memory_top, 5)
+        self.assertEqual(p.trace_memory_path, "/tmp/memory.txt")
+        self.assertEqual(p.record_path, "/tmp/capture.gz")
+        self.assertEqual(p.record_reads, 3)
+        self.assertEqual(p.table_data_type, "http_req_rate")
+        self.assertEqual(p.table_threshold, 100)
+        self.assertEqual(p.table_top_keys, 5)
+
+    def test_configure_metric_blocks(self):
+        collectd = Mock()
+
+        config = StubConfigNode("Module", children=[
+            StubConfigNode("Socket", ["/var/run/sock.sock"]),
+            StubConfigNode("Metric", ["conn_rate"], children=[
+                StubConfigNode("TypeInstance", ["connection_rate"]),
+                StubConfigNode("Type", ["gauge"]),
+            ]),
+            StubConfigNode("Metric", ["scur"], children=[
+                StubConfigNode("Drop", [True]),
+                StubConfigNode("Bogus", [1.0]),
+            ]),
+        ])
+
+        p = HAProxyPlugin(collectd)
+
+        p.configure(config)
+
+        self.assertEqual(p.metric_overrides, {
+            "conn_rate": {"type_instance": "connection_rate", "type": "gauge"},
+            "scur": {"drop": True},
+        })
+        collectd.warn.assert_called_once_with(
+            "Unknown option for metric 'scur': 'Bogus'"
+        )
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_compiles_metric_overrides(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.metric_overrides = {
+            "conn_rate": {"type_instance": "connection_rate"},
+            "scur": {"drop": True},
+        }
+
+        p.initialize()
+
+        self.assertEqual(
+            p.metrics.xref["conn_rate"], ("connection_rate", "gauge")
+        )
+        self.assertNotIn("scur", p.metrics.xref)
 
     def test_configure_unknown_config_option(self):
         collectd = Mock()
@@ -92,7 +199,7 @@ class HAProxyPluginTests(unittest.TestCase):
 
         p.configure(config)
 
-        self.assertEqual(p.socket_file_path, "/var/run/sock.sock")
+        self.assertEqual(p.socket_configs, [("/var/run/sock.sock", None)])
 
         self.assertEqual(p.include_info, True)
         self.assertEqual(p.include_stats, True)
@@ -116,22 +223,113 @@ class HAProxyPluginTests(unittest.TestCase):
 
         p.configure(config)
 
-        self.assertEqual(p.socket_file_path, None)
+        self.assertEqual(p.socket_configs, [])
 
         collectd.unregister_init.assert_called_once_with(p.initialize)
         collectd.unregister_read.assert_called_once_with(p.read)
 
+    def test_configure_multiple_sockets(self):
+        config = Mock(
+            children=[
+                Mock(key="Socket", values=("/var/run/proc1.sock",)),
+                Mock(key="Socket", values=("/var/run/proc2.sock", "second")),
+            ]
+        )
+
+        p = HAProxyPlugin(Mock())
+
+        p.configure(config)
+
+        self.assertEqual(
+            p.socket_configs,
+            [("/var/run/proc1.sock", None), ("/var/run/proc2.sock", "second")]
+        )
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_sets_sockets_attribute(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.max_response_bytes = 4096
+
+        p.initialize()
+
+        self.assertEqual(p.sockets, [HAProxySocket.return_value])
+        self.assertEqual(HAProxySocket.return_value.max_response_bytes, 4096)
+        self.assertEqual(p.engine, None)
+        HAProxySocket.assert_called_once_with(
+            collectd, "/var/run/asdf.sock", name=None
+        )
+
+    def test_configure_master_socket(self):
+        collectd = Mock()
+
+        config = StubConfigNode("Module", children=[
+            StubConfigNode("MasterSocket", ["/var/run/master.sock"]),
+        ])
+
+        p = HAProxyPlugin(collectd)
+
+        p.configure(config)
+
+        self.assertEqual(p.socket_configs, [])
+        self.assertEqual(
+            p.master_socket_configs, [("/var/run/master.sock", None)]
+        )
+        self.assertFalse(collectd.unregister_read.called)
+
+    @patch("collectd_haproxy.plugin.MasterSocket")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_master_sockets(self, HAProxySocket, MasterSocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/proc1.sock", None)]
+        p.master_socket_configs = [("/var/run/master.sock", None)]
+
+        p.initialize()
+
+        self.assertEqual(
+            p.sockets, [HAProxySocket.return_value, MasterSocket.return_value]
+        )
+        HAProxySocket.assert_called_once_with(
+            collectd, "/var/run/proc1.sock", name="proc1"
+        )
+        MasterSocket.assert_called_once_with(
+            collectd, "/var/run/master.sock", name="master"
+        )
+
     @patch("collectd_haproxy.plugin.HAProxySocket")
-    def test_initialize_sets_socket_attribute(self, HAProxySocket):
+    def test_initialize_names_multiple_sockets(self, HAProxySocket):
         collectd = Mock()
 
         p = HAProxyPlugin(collectd)
-        p.socket_file_path = "/var/run/asdf.sock"
+        p.socket_configs = [
+            ("/var/run/proc1.sock", None),
+            ("/var/run/proc2.sock", "second"),
+        ]
 
         p.initialize()
 
-        self.assertEqual(p.socket, HAProxySocket.return_value)
-        HAProxySocket.assert_called_once_with(collectd, "/var/run/asdf.sock")
+        self.assertEqual(len(p.sockets), 2)
+        HAProxySocket.assert_has_calls([
+            call(collectd, "/var/run/proc1.sock", name="proc1"),
+            call(collectd, "/var/run/proc2.sock", name="second"),
+        ])
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_unknown_engine(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.engine_name = "threads"
+
+        p.initialize()
+
+        self.assertEqual(p.engine, None)
+        collectd.warning.assert_called_once_with("Unknown engine: 'threads'")
 
     @patch(
         "collectd_haproxy.plugin.METRIC_XREF",
@@ -140,53 +338,52 @@ class HAProxyPluginTests(unittest.TestCase):
             "hrsp_5xx": ("http_response_5xx", "counter"),
         }
     )
-    def test_initialize_sets_up_metrics(self):
+    def test_initialize_sets_up_lazy_metrics(self):
         collectd = Mock()
 
         p = HAProxyPlugin(collectd)
 
         p.initialize()
 
+        self.assertIsInstance(p.metrics, MetricRegistry)
         self.assertEqual(
-            p.metrics,
+            p.metrics.xref,
             {
-                "CurrConns": collectd.Values.return_value,
-                "hrsp_5xx": collectd.Values.return_value,
+                "CurrConns": ("current_connections", "gauge"),
+                "hrsp_5xx": ("http_response_5xx", "counter"),
             }
         )
+        self.assertFalse(collectd.Values.called)
 
-        collectd.Values.assert_has_calls([
-            call(
-                plugin="haproxy",
-                type="gauge", type_instance="current_connections"
-            ),
-            call(
-                plugin="haproxy",
-                type="counter", type_instance="http_response_5xx"
-            ),
-        ], any_order=True)
-
+    @patch.object(HAProxyPlugin, "detect_reload")
     @patch.object(HAProxyPlugin, "collect_stats")
     @patch.object(HAProxyPlugin, "collect_info")
-    def test_read_collects_info_only_if_flag_set(self, info, stats):
+    def test_read_collects_info_only_if_flag_set(self, info, stats, detect):
         p = HAProxyPlugin(Mock())
+        socket = Mock(truncated=False)
+        p.sockets = [socket]
+        p.metrics = Mock()
 
         p.include_info = False
 
         p.read()
 
         self.assertFalse(info.called)
+        detect.assert_called_once_with(socket)
 
         p.include_info = True
 
         p.read()
 
-        info.assert_called_once_with()
+        info.assert_called_once_with(socket)
 
     @patch.object(HAProxyPlugin, "collect_stats")
     @patch.object(HAProxyPlugin, "collect_info")
     def test_read_collects_stats_only_if_flag_set(self, info, stats):
         p = HAProxyPlugin(Mock())
+        socket = Mock(truncated=False)
+        p.sockets = [socket]
+        p.metrics = Mock()
 
         p.include_stats = False
 
@@ -198,7 +395,7 @@ class HAProxyPluginTests(unittest.TestCase):
 
         p.read()
 
-        stats.assert_called_once_with()
+        stats.assert_called_once_with(socket)
 
     @patch("collectd_haproxy.plugin.HAProxySocket")
     def test_collect_info_skips_unknown_metrics(self, HAProxySocket):
@@ -207,60 +404,1282 @@ class HAProxyPluginTests(unittest.TestCase):
             ("hrsp_5xx", 0),
             ("UpstreamErrors", 1),
         ]
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
 
-        p = HAProxyPlugin(Mock())
-        p.metrics = {"CurConns": Mock(), "hrsp_5xx": Mock(), "Fake": Mock()}
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "CurConns": ("current_connections", "gauge"),
+                "hrsp_5xx": ("http_response_5xx", "counter"),
+                "Fake": ("fake", "gauge"),
+            }
+        )
 
-        p.socket = HAProxySocket.return_value
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
 
-        p.collect_info()
+        p.collect_info(socket)
 
-        p.metrics["CurConns"].dispatch.assert_called_once_with(
+        self.assertEqual(set(p.metrics.values), set(["CurConns", "hrsp_5xx"]))
+        p.metrics.values["CurConns"].dispatch.assert_called_once_with(
             plugin_instance="haproxy", values=[10],
         )
-        p.metrics["hrsp_5xx"].dispatch.assert_called_once_with(
+        p.metrics.values["hrsp_5xx"].dispatch.assert_called_once_with(
             plugin_instance="haproxy", values=[0],
         )
 
     @patch("collectd_haproxy.plugin.HAProxySocket")
     def test_collect_stats(self, HAProxySocket):
-        HAProxySocket.return_value.gen_stats.return_value = [
-            (
-                "app_servers",
-                {
-                    "svname": "app01",
-                    "CurrConns": 15,
-                    "hrsp_4xx": 3,
-                    "MemMax": "120mb",
-                    "FakeStatus": "ok",
-                }
-            ),
-            (
-                "app_servers",
-                {
-                    "svname": "app02",
-                    "CurrConns": 8,
-                    "hrsp_4xx": None,
-                    "MemMax": "100mb",
-                }
-            )
-        ]
+        HAProxySocket.return_value.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "CurrConns", "hrsp_4xx", "MemMax", "Fake"],
+            ["app_servers", "app01", "15", "3", "120mb", "ok"],
+            ["app_servers", "app02", "8", "", "100mb", "ok"],
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
 
-        p = HAProxyPlugin(Mock())
-        p.metrics = {"CurrConns": Mock(), "hrsp_4xx": Mock(), "MemMax": Mock()}
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "CurrConns": ("current_connections", "gauge"),
+                "hrsp_4xx": ("http_response_4xx", "counter"),
+                "MemMax": ("max_memory", "gauge"),
+                "Unreported": ("unreported", "gauge"),
+            }
+        )
 
-        p.socket = HAProxySocket.return_value
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
 
-        p.collect_stats()
+        p.collect_stats(socket)
 
-        p.metrics["CurrConns"].dispatch.assert_has_calls([
+        self.assertNotIn("Unreported", p.metrics.values)
+
+        p.metrics.values["CurrConns"].dispatch.assert_has_calls([
             call(plugin_instance="app_servers.app01", values=[15]),
             call(plugin_instance="app_servers.app02", values=[8]),
         ], any_order=True)
 
-        p.metrics["hrsp_4xx"].dispatch.assert_has_calls([
+        p.metrics.values["hrsp_4xx"].dispatch.assert_has_calls([
             call(plugin_instance="app_servers.app01", values=[3]),
             call(plugin_instance="app_servers.app02", values=[0]),
         ], any_order=True)
 
-        self.assertFalse(p.metrics["MemMax"].called)
+        self.assertFalse(p.metrics.values["MemMax"].dispatch.called)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_stats_no_response(self, HAProxySocket):
+        HAProxySocket.return_value.gen_stat_rows.return_value = iter([])
+
+        p = HAProxyPlugin(Mock())
+        p.metrics = Mock()
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+
+        p.collect_stats(socket)
+
+        self.assertFalse(p.metrics.plan.called)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_tables(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        socket.gen_tables.return_value = iter([
+            ("be_rl", {"type": "ip", "size": "1000", "used": "4"}),
+        ])
+        socket.gen_table_entries.return_value = iter([
+            ("10.0.0.1", {"http_req_rate": "20"}),
+            ("10.0.0.2", {"http_req_rate": "50"}),
+            ("10.0.0.3", {"http_req_rate": "11"}),
+            ("10.0.0.4", {"http_req_rate": "30"}),
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "size": ("table_size", "gauge"),
+                "used": ("table_used", "gauge"),
+            }
+        )
+        p.table_data_type = "http_req_rate"
+        p.table_threshold = 10
+        p.table_top_keys = 2
+
+        p.collect_tables(socket)
+
+        socket.gen_table_entries.assert_called_once_with(
+            "be_rl", "data.http_req_rate gt 10"
+        )
+
+        p.metrics.values["size"].dispatch.assert_called_once_with(
+            plugin_instance="table.be_rl", values=[1000]
+        )
+        p.metrics.values["used"].dispatch.assert_called_once_with(
+            plugin_instance="table.be_rl", values=[4]
+        )
+        over = p.metrics.values[("keys_over_http_req_rate", "gauge")]
+        over.dispatch.assert_called_once_with(
+            plugin_instance="table.be_rl", values=[4]
+        )
+        top = p.metrics.values[("top_http_req_rate", "gauge")]
+        top.dispatch.assert_has_calls([
+            call(
+                plugin_instance="table.be_rl",
+                type_instance="top_http_req_rate-10.0.0.4", values=[30]
+            ),
+            call(
+                plugin_instance="table.be_rl",
+                type_instance="top_http_req_rate-10.0.0.2", values=[50]
+            ),
+        ])
+        self.assertEqual(top.dispatch.call_count, 2)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_tables_without_data_type(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        socket.gen_tables.return_value = iter([
+            ("be_rl", {"type": "ip", "size": "1000", "used": "4"}),
+        ])
+
+        p = HAProxyPlugin(Mock())
+        p.metrics = MetricRegistry(Mock(), "haproxy", {})
+
+        p.collect_tables(socket)
+
+        self.assertFalse(socket.gen_table_entries.called)
+
+    @patch("collectd_haproxy.plugin.time")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_server_states_cached_between_refreshes(
+            self, HAProxySocket, mock_time
+    ):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        socket.gen_server_state_rows.side_effect = lambda: iter([
+            ["be_id", "be_name", "srv_id", "srv_name", "srv_op_state"],
+            ["3", "be_app", "1", "app1", "2"],
+            ["4", "be_db", "1", "db1", "0"],
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "srv_op_state": ("operational_state", "gauge"),
+            }
+        )
+        p.sockets = [socket]
+        p.include_info = False
+        p.include_stats = False
+        p.include_server_state = True
+        p.server_state_interval = 60
+
+        mock_time.time.return_value = 1000
+        p.read()
+        mock_time.time.return_value = 1030
+        p.read()
+
+        self.assertEqual(socket.gen_server_state_rows.call_count, 1)
+        self.assertEqual(
+            sorted(p.server_states[socket.socket_file_path]), ["3", "4"]
+        )
+
+        p.metrics.values["srv_op_state"].dispatch.assert_has_calls([
+            call(plugin_instance="be_app.app1", values=[2]),
+            call(plugin_instance="be_db.db1", values=[0]),
+        ] * 2, any_order=True)
+
+        mock_time.time.return_value = 1060
+        p.read()
+
+        self.assertEqual(socket.gen_server_state_rows.call_count, 2)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_server_states_skips_bad_values(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.gen_server_state_rows.return_value = iter([
+            ["be_id", "be_name", "srv_id", "srv_name", "srv_op_state"],
+            ["3", "be_app", "1", "app1", "2"],
+            ["3", "be_app", "2", "app2", "-"],
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "srv_op_state": ("operational_state", "gauge"),
+            }
+        )
+
+        p.refresh_server_states(socket)
+        p.collect_server_states(socket)
+
+        op_state = p.metrics.values["srv_op_state"]
+        self.assertEqual(op_state.dispatch.call_args_list, [
+            call(plugin_instance="be_app.app1", values=[2]),
+        ])
+
+    @patch.object(HAProxyPlugin, "refresh_server_states")
+    @patch.object(HAProxyPlugin, "collect_server_states")
+    @patch.object(HAProxyPlugin, "collect_stats")
+    @patch.object(HAProxyPlugin, "collect_info")
+    def test_read_collects_server_state_only_if_flag_set(
+            self, info, stats, server_states, refresh
+    ):
+        p = HAProxyPlugin(Mock())
+        socket = Mock(truncated=False)
+        p.sockets = [socket]
+        p.metrics = Mock()
+
+        p.read()
+
+        self.assertFalse(server_states.called)
+
+        p.include_server_state = True
+
+        p.read()
+
+        server_states.assert_called_once_with(socket)
+        refresh.assert_called_once_with(socket)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_pools(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        socket.gen_pools.return_value = iter([
+            ("pipe", {"pool_used": "5", "pool_unknown": "1"}),
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {"pool_used": ("pool_used", "gauge")}
+        )
+
+        p.collect_pools(socket)
+
+        p.metrics.values["pool_used"].dispatch.assert_called_once_with(
+            plugin_instance="pool.pipe", values=[5]
+        )
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_activity(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        socket.gen_activity.return_value = iter([
+            ("loops", ["1005", "2200"]),
+            ("ctxsw", ["1", "1"]),
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {"loops": ("loop_count", "counter")}
+        )
+
+        p.collect_activity(socket)
+
+        self.assertEqual(list(p.metrics.values), ["loops"])
+        p.metrics.values["loops"].dispatch.assert_has_calls([
+            call(plugin_instance="activity.thread1", values=[1005]),
+            call(plugin_instance="activity.thread2", values=[2200]),
+        ])
+
+    @patch("collectd_haproxy.plugin.time")
+    @patch.object(HAProxyPlugin, "collect_activity")
+    @patch.object(HAProxyPlugin, "collect_pools")
+    @patch.object(HAProxyPlugin, "collect_stats")
+    @patch.object(HAProxyPlugin, "collect_info")
+    def test_read_collects_pools_and_activity_on_their_intervals(
+            self, info, stats, pools, activity, mock_time
+    ):
+        p = HAProxyPlugin(Mock())
+        p.sockets = [Mock(truncated=False)]
+        p.metrics = Mock()
+        p.include_pools = True
+        p.include_activity = True
+        p.pools_interval = 30
+        p.activity_interval = 10
+
+        for now in (100, 110, 120, 130):
+            mock_time.time.return_value = now
+            p.read()
+
+        self.assertEqual(pools.call_count, 2)
+        self.assertEqual(activity.call_count, 4)
+
+    @patch.object(HAProxyPlugin, "collect_stats")
+    @patch.object(HAProxyPlugin, "collect_info")
+    def test_read_prefetches_with_engine_then_collects_each_socket(
+            self, info, stats
+    ):
+        p = HAProxyPlugin(Mock())
+        sockets = [Mock(truncated=False), Mock(truncated=False)]
+        p.sockets = sockets
+        p.metrics = Mock()
+        p.engine = Mock()
+
+        p.read()
+
+        p.engine.prefetch.assert_called_once_with(sockets)
+        info.assert_has_calls([call(sockets[0]), call(sockets[1])])
+        stats.assert_has_calls([call(sockets[0]), call(sockets[1])])
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_stats_named_socket(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = "proc2"
+        socket.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "scur"],
+            ["app_servers", "app01", "15"],
+        ])
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {"scur": ("current_session_count", "gauge")}
+        )
+
+        p.collect_stats(socket)
+
+        collectd.Values.return_value.dispatch.assert_called_once_with(
+            plugin_instance="proc2.app_servers.app01", values=[15]
+        )
+
+    @unittest.skipUnless(PY35, "asyncio engine requires python 3.5+")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_asyncio_engine(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.master_socket_configs = [("/var/run/master.sock", None)]
+        p.engine_name = "asyncio"
+
+        with patch("collectd_haproxy.aio.AsyncEngine") as AsyncEngine:
+            p.initialize()
+
+        from collectd_haproxy.aio import AsyncHAProxySocket, AsyncMasterSocket
+
+        self.assertEqual(p.engine, AsyncEngine.return_value)
+        self.assertIsInstance(p.sockets[0], AsyncHAProxySocket)
+        self.assertIsInstance(p.sockets[1], AsyncMasterSocket)
+        self.assertFalse(HAProxySocket.called)
+
+    @patch("collectd_haproxy.plugin.PY35", False)
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_asyncio_engine_unsupported(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.engine_name = "asyncio"
+
+        p.initialize()
+
+        collectd.error.assert_called_once_with(
+            "The asyncio engine requires python 3.5+"
+        )
+        self.assertEqual(p.engine, None)
+        self.assertEqual(p.sockets, [HAProxySocket.return_value])
+
+    @patch("collectd_haproxy.plugin.time")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_info_caches_static_fields(self, HAProxySocket, mock_time):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        info = [
+            ("Pid", "12"),
+            ("Maxconn", "2000"),
+            ("Uptime_sec", "100"),
+            ("CurrConns", "5"),
+        ]
+        socket.gen_info.side_effect = lambda: iter(info)
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "Pid": ("pid", "gauge"),
+                "Maxconn": ("max_connections", "gauge"),
+                "Uptime_sec": ("uptime_seconds", "gauge"),
+                "CurrConns": ("current_connections", "gauge"),
+            }
+        )
+        p.info_heartbeat = 300
+
+        def dispatch_counts():
+            return dict(
+                (label, metric.dispatch.call_count)
+                for label, metric in p.metrics.values.items()
+            )
+
+        mock_time.time.return_value = 1000
+        p.collect_info(socket)
+        info[2] = ("Uptime_sec", "110")
+        mock_time.time.return_value = 1010
+        p.collect_info(socket)
+
+        self.assertEqual(
+            dispatch_counts(),
+            {"Pid": 1, "Maxconn": 1, "Uptime_sec": 2, "CurrConns": 2}
+        )
+
+        # runtime change of a static value
+        info[1] = ("Maxconn", "4000")
+        mock_time.time.return_value = 1020
+        p.collect_info(socket)
+
+        self.assertEqual(
+            dispatch_counts(),
+            {"Pid": 1, "Maxconn": 2, "Uptime_sec": 3, "CurrConns": 3}
+        )
+
+        # reload, new pid
+        info[0] = ("Pid", "13")
+        info[2] = ("Uptime_sec", "1")
+        mock_time.time.return_value = 1030
+        p.collect_info(socket)
+
+        self.assertEqual(
+            dispatch_counts(),
+            {"Pid": 2, "Maxconn": 3, "Uptime_sec": 4, "CurrConns": 4}
+        )
+
+        # heartbeat
+        mock_time.time.return_value = 1300
+        p.collect_info(socket)
+
+        self.assertEqual(
+            dispatch_counts(),
+            {"Pid": 3, "Maxconn": 4, "Uptime_sec": 5, "CurrConns": 5}
+        )
+
+    @patch.object(HAProxyPlugin, "handle_reload")
+    def test_check_reload(self, handle_reload):
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+
+        p = HAProxyPlugin(Mock())
+
+        self.assertEqual(
+            p.check_reload(socket, {"Pid": "12", "Uptime_sec": "100"}), None
+        )
+        self.assertEqual(
+            p.check_reload(socket, {"Pid": "12", "Uptime_sec": "110"}), None
+        )
+        self.assertFalse(handle_reload.called)
+
+        self.assertEqual(
+            p.check_reload(socket, {"Pid": "12", "Uptime_sec": "3"}), "12"
+        )
+        self.assertEqual(
+            p.check_reload(socket, {"Pid": "14", "Uptime_sec": "4"}), "12"
+        )
+        self.assertEqual(p.check_reload(socket, {"Pid": "14"}), None)
+
+        handle_reload.assert_has_calls([
+            call(socket, "12"), call(socket, "12"),
+        ])
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_handle_reload_invalidates_socket_state(self, HAProxySocket):
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = None
+        socket.truncated = False
+        other = "/var/run/other.sock"
+
+        p = HAProxyPlugin(Mock())
+        p.metrics = Mock()
+        p.static_info = {socket.socket_file_path: {"Pid": "12"}, other: {}}
+        p.server_states = {socket.socket_file_path: {"3": []}, other: {}}
+        p.last_collected = {"server_state": 1000, "pools": 1000}
+
+        p.handle_reload(socket, "12")
+
+        p.metrics.clear_plans.assert_called_once_with()
+        socket.reset.assert_called_once_with()
+        self.assertEqual(p.static_info, {other: {}})
+        self.assertEqual(p.server_states, {other: {}})
+        self.assertEqual(p.last_collected, {"pools": 1000})
+        self.assertEqual(p.draining, [])
+        self.assertFalse(HAProxySocket.called)
+
+    @patch("collectd_haproxy.plugin.time")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_draining_socket_polled_during_window(
+            self, HAProxySocket, mock_time
+    ):
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = "proc1"
+        draining = HAProxySocket.return_value
+
+        p = HAProxyPlugin(Mock())
+        p.metrics = Mock()
+        p.draining_socket_pattern = "/var/run/haproxy-%p.sock"
+        p.draining_window = 30
+
+        mock_time.time.return_value = 1000
+        p.handle_reload(socket, "12")
+
+        HAProxySocket.assert_called_once_with(
+            p.collectd, "/var/run/haproxy-12.sock", name="proc1.draining"
+        )
+
+        with patch.object(p, "collect_stats") as collect_stats:
+            mock_time.time.return_value = 1020
+            p.collect_draining()
+            collect_stats.assert_called_once_with(draining)
+
+            mock_time.time.return_value = 1030
+            p.collect_draining()
+            self.assertEqual(collect_stats.call_count, 1)
+
+        self.assertEqual(p.draining, [])
+
+    @patch("collectd_haproxy.plugin.time")
+    def test_draining_socket_dropped_when_gone(self, mock_time):
+        mock_time.time.return_value = 1000
+        draining = Mock()
+
+        p = HAProxyPlugin(Mock())
+        p.draining = [(draining, 1060)]
+
+        with patch.object(p, "collect_stats") as collect_stats:
+            collect_stats.side_effect = IOError(2, "No such file")
+            p.collect_draining()
+
+        self.assertEqual(p.draining, [])
+
+    @patch("collectd_haproxy.snapshot.SnapshotWriter")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_stats_writes_snapshot(self, HAProxySocket, Writer):
+        socket = HAProxySocket.return_value
+        socket.name = "proc1"
+        socket.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "scur"],
+            ["app_servers", "app01", "15"],
+            ["app_servers", "app02", "3"],
+        ])
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.snapshot_path = "/dev/shm/haproxy"
+
+        p.collect_stats(socket)
+
+        Writer.assert_called_once_with("/dev/shm/haproxy.proc1.stat")
+        Writer.return_value.write.assert_called_once_with(
+            ["pxname", "svname", "scur"],
+            ["app_servers/app01", "app_servers/app02"],
+            [["app_servers", "app01", "15"], ["app_servers", "app02", "3"]],
+        )
+
+    @patch("collectd_haproxy.snapshot.SnapshotWriter")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_info_writes_snapshot(self, HAProxySocket, Writer):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.truncated = False
+        socket.gen_info.side_effect = lambda: iter(
+            [("Pid", "12"), ("Tasks", "3")]
+        )
+
+        p = HAProxyPlugin(Mock())
+        p.metrics = MetricRegistry(Mock(), "haproxy", {})
+        p.snapshot_path = "/dev/shm/haproxy"
+
+        p.collect_info(socket)
+        p.collect_info(socket)
+
+        Writer.assert_called_once_with("/dev/shm/haproxy.info")
+        Writer.return_value.write.assert_has_calls([
+            call(["Pid", "Tasks"], ["info"], [["12", "3"]]),
+        ] * 2)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_stats_max_rows(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "scur"],
+            ["be", "app01", "1"],
+            ["be", "app02", "2"],
+            ["be", "app03", "3"],
+        ])
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {"scur": ("current_session_count", "gauge")}
+        )
+        p.max_rows = 2
+
+        p.collect_stats(socket)
+
+        collectd.Values.assert_has_calls([
+            call(
+                plugin="haproxy",
+                type="gauge", type_instance="current_session_count"
+            ),
+            call().dispatch(plugin_instance="be.app01", values=[1]),
+            call().dispatch(plugin_instance="be.app02", values=[2]),
+            call(
+                plugin="haproxy", type="gauge", type_instance="truncated_rows"
+            ),
+            call().dispatch(plugin_instance="haproxy", values=[1]),
+        ])
+        self.assertEqual(collectd.warning.call_count, 1)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_stats_max_series(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.gen_stat_rows.side_effect = lambda *args: iter([
+            ["pxname", "svname", "scur", "stot"],
+            ["be", "app01", "1", "10"],
+            ["be", "app02", "2", "20"],
+            ["be", "app03", "3", "30"],
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", {
+                "scur": ("current_session_count", "gauge"),
+                "stot": ("session_count", "counter"),
+            }
+        )
+        p.max_series = 5
+
+        p.collect_stats(socket)
+        p.truncations = set()
+        p.collect_stats(socket)
+
+        scur = p.metrics.values["scur"]
+        self.assertEqual(
+            [c[1]["plugin_instance"] for c in scur.dispatch.call_args_list],
+            ["be.app01", "be.app02"] * 2
+        )
+        truncated = p.metrics.values[("truncated_series", "gauge")]
+        self.assertEqual(truncated.dispatch.call_count, 2)
+
+    def test_truncated_reported_once_per_read(self):
+        collectd = Mock()
+        socket = Mock(truncated=True, socket_file_path="/var/run/sock.sock")
+        socket.name = None
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.include_info = False
+        p.include_stats = False
+        p.track_reloads = False
+        p.sockets = [socket]
+
+        p.truncated(socket, "rows")
+        p.truncated(socket, "rows")
+
+        self.assertEqual(collectd.warning.call_count, 1)
+
+        p.read()
+
+        self.assertEqual(socket.truncated, False)
+        self.assertEqual(collectd.warning.call_count, 2)
+        collectd.warning.assert_called_with(
+            "Reached the response limit reading from /var/run/sock.sock, "
+            "data was dropped."
+        )
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_profiler(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.profile_reads = 5
+        p.profile_path = "/tmp/reads.prof"
+
+        p.initialize()
+
+        self.assertEqual(type(p.profiler).__name__, "CProfileProfiler")
+        self.assertEqual(p.profiler.remaining, 5)
+        self.assertEqual(p.profiler.path, "/tmp/reads.prof")
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_profiler_misconfigured(self, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.profile_reads = 5
+
+        p.initialize()
+
+        self.assertEqual(p.profiler, None)
+        collectd.error.assert_called_once_with(
+            "ProfileReads requires a ProfilePath!"
+        )
+
+        p.profile_path = "/tmp/reads.prof"
+        p.profiler_name = "py-spy"
+
+        p.initialize()
+
+        self.assertEqual(p.profiler, None)
+        collectd.error.assert_called_with("Unknown profiler: 'py-spy'")
+
+    def test_read_profiles_then_switches_off(self):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.collect = Mock()
+        profiler = Mock(path="/tmp/reads.prof", finished=False)
+        profiler.runcall.side_effect = lambda func: func()
+        p.profiler = profiler
+
+        p.read()
+
+        profiler.runcall.assert_called_once_with(p.collect)
+        self.assertEqual(profiler.dump.called, False)
+        self.assertEqual(p.profiler, profiler)
+
+        profiler.finished = True
+        p.read()
+
+        profiler.dump.assert_called_once_with()
+        self.assertEqual(p.profiler, None)
+
+        p.read()
+
+        self.assertEqual(profiler.runcall.call_count, 2)
+        self.assertEqual(p.collect.call_count, 3)
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_collect_stats_encodes_status(self, HAProxySocket):
+        socket = HAProxySocket.return_value
+        socket.name = None
+        socket.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "scur", "status", "check_status"],
+            ["be", "app01", "1", "UP", "L7OK"],
+            ["be", "app02", "oops", "DOWN", "L4CON"],
+            ["be", "app03", "3", "MAINT(via)", ""],
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy", METRIC_XREF, STAT_ENUMS
+        )
+
+        p.collect_stats(socket)
+
+        status = p.metrics.values["status"]
+        self.assertEqual(status.dispatch.call_args_list, [
+            call(plugin_instance="be.app01", values=[1]),
+            call(plugin_instance="be.app02", values=[0]),
+            call(plugin_instance="be.app03", values=[2]),
+        ])
+        check_status = p.metrics.values["check_status"]
+        self.assertEqual(check_status.dispatch.call_args_list, [
+            call(plugin_instance="be.app01", values=[13]),
+            call(plugin_instance="be.app02", values=[7]),
+        ])
+        scur = p.metrics.values["scur"]
+        self.assertEqual(scur.dispatch.call_args_list, [
+            call(plugin_instance="be.app01", values=[1]),
+            call(plugin_instance="be.app03", values=[3]),
+        ])
+
+    def test_collect_stats_server_census(self):
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = None
+        socket.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "status", "scur"],
+            ["fe", "FRONTEND", "OPEN", "9"],
+            ["be1", "app01", "UP", "1"],
+            ["be1", "app02", "UP 1/3", "2"],
+            ["be1", "app03", "DOWN", "0"],
+            ["be1", "app04", "MAINT (via be2/app01)", "0"],
+            ["be1", "BACKEND", "UP", "3"],
+            ["be2", "app01", "DRAIN", "4"],
+            ["be2", "app02", "no check", "5"],
+            ["be2", "BACKEND", "UP", "9"],
+        ])
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy",
+            {"scur": ("current_session_count", "gauge")}
+        )
+        p.include_servers = False
+        p.include_server_census = True
+
+        p.collect_stats(socket)
+
+        socket.gen_stat_rows.assert_called_once_with(True, True, True)
+        scur = p.metrics.values["scur"].dispatch.call_args_list
+        self.assertEqual(
+            [c[1]["plugin_instance"] for c in scur],
+            ["fe.FRONTEND", "be1.BACKEND", "be2.BACKEND"]
+        )
+
+        def census(type_instance):
+            metric = p.metrics.values[(type_instance, "gauge")]
+            return dict(
+                (c[1]["plugin_instance"], c[1]["values"][0])
+                for c in metric.dispatch.call_args_list
+            )
+
+        self.assertEqual(census("servers_up"), {
+            "be1.BACKEND": 2, "be2.BACKEND": 0,
+        })
+        self.assertEqual(census("servers_down"), {
+            "be1.BACKEND": 1, "be2.BACKEND": 0,
+        })
+        self.assertEqual(census("servers_maint")["be1.BACKEND"], 1)
+        self.assertEqual(census("servers_drain")["be2.BACKEND"], 1)
+        self.assertEqual(census("servers_nolb")["be2.BACKEND"], 0)
+        self.assertEqual(census("servers_no_check")["be2.BACKEND"], 1)
+
+    def test_collect_stats_server_census_max_rows(self):
+        rows = [
+            ["pxname", "svname", "status", "scur"],
+            ["be1", "app01", "UP", "1"],
+            ["be1", "app02", "DOWN", "0"],
+            ["be1", "BACKEND", "UP", "1"],
+            ["be2", "app01", "UP", "4"],
+            ["be2", "BACKEND", "UP", "4"],
+        ]
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        dispatched = {}
+        for include_servers in (False, True):
+            socket = Mock(socket_file_path="/var/run/sock.sock")
+            socket.name = None
+            socket.gen_stat_rows.return_value = iter(rows)
+
+            p = HAProxyPlugin(collectd)
+            p.metrics = MetricRegistry(
+                collectd, "haproxy",
+                {"scur": ("current_session_count", "gauge")}
+            )
+            p.include_servers = include_servers
+            p.include_server_census = True
+            p.max_rows = 3
+
+            p.collect_stats(socket)
+
+            up = p.metrics.values[("servers_up", "gauge")]
+            self.assertEqual(up.dispatch.call_args_list, [
+                call(plugin_instance="be1.BACKEND", values=[1]),
+            ])
+            down = p.metrics.values[("servers_down", "gauge")]
+            self.assertEqual(down.dispatch.call_args_list, [
+                call(plugin_instance="be1.BACKEND", values=[1]),
+            ])
+            scur = p.metrics.values["scur"].dispatch.call_args_list
+            dispatched[include_servers] = [
+                c[1]["plugin_instance"] for c in scur
+            ]
+
+        self.assertEqual(dispatched, {
+            False: ["be1.BACKEND"],
+            True: ["be1.app01", "be1.app02", "be1.BACKEND"],
+        })
+
+    def test_collect_stats_server_sampling(self):
+        aggregates = [
+            ["pxname", "svname", "iid", "scur"],
+            ["fe", "FRONTEND", "2", "9"],
+            ["be1", "BACKEND", "3", "1"],
+            ["be2", "BACKEND", "4", "2"],
+            ["be3", "BACKEND", "5", "3"],
+        ]
+        servers = {
+            "3": [["be1", "app01", "3", "1"]],
+            "4": [["be2", "app01", "4", "2"]],
+            "5": [["be3", "app01", "5", "3"]],
+        }
+
+        def gen_stat_rows(fe, be, srv, proxy_ids=None):
+            if proxy_ids is None:
+                self.assertEqual((fe, be, srv), (True, True, False))
+                return iter(aggregates)
+            self.assertEqual((fe, be, srv), (False, False, True))
+            rows = [aggregates[0]]
+            for proxy_id in proxy_ids:
+                rows.extend(servers[proxy_id])
+            return iter(rows)
+
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = None
+        socket.gen_stat_rows.side_effect = gen_stat_rows
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(
+            collectd, "haproxy",
+            {"scur": ("current_session_count", "gauge")}
+        )
+        p.include_backends = False
+        p.server_sampling = 2
+
+        dispatched = []
+        for _ in range(3):
+            p.collect_stats(socket)
+            calls = p.metrics.values["scur"].dispatch.call_args_list
+            dispatched.append(
+                [c[1]["plugin_instance"] for c in calls]
+            )
+            p.metrics.values["scur"].dispatch.reset_mock()
+
+        self.assertEqual(dispatched, [
+            ["fe.FRONTEND", "be1.app01", "be3.app01"],
+            ["fe.FRONTEND", "be2.app01"],
+            ["fe.FRONTEND", "be1.app01", "be3.app01"],
+        ])
+
+    def test_collect_stats_notifies_state_changes(self):
+        header = ["pxname", "svname", "iid", "sid", "chkdown", "status"]
+        reads = [
+            [
+                ["fe", "FRONTEND", "2", "0", "", "OPEN"],
+                ["be", "app01", "3", "1", "0", "UP"],
+                ["be", "app02", "3", "2", "0", "UP"],
+                ["be", "BACKEND", "3", "0", "0", "UP"],
+            ],
+            [
+                ["fe", "FRONTEND", "2", "0", "", "STOP"],
+                ["be", "app01", "3", "1", "1", "DOWN"],
+                ["be", "app02", "3", "2", "0", "UP 1/3"],
+                ["be", "BACKEND", "3", "0", "0", "UP"],
+            ],
+            [
+                ["fe", "FRONTEND", "2", "0", "", "STOP"],
+                ["be", "app01", "3", "1", "1", "UP"],
+                ["be", "app02", "3", "2", "2", "UP"],
+                ["be", "BACKEND", "3", "0", "0", "UP"],
+            ],
+        ]
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = None
+        collectd = StubCollectd()
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.notify_state_changes = True
+
+        messages = []
+        for rows in reads:
+            socket.gen_stat_rows.return_value = iter([header] + rows)
+            p.collect_stats(socket)
+            messages.append([
+                (n["severity"], n["message"]) for n in collectd.notifications
+            ])
+            collectd.notifications = []
+
+        self.assertEqual(messages, [
+            [],
+            [(1, "be.app01 is DOWN (was UP)")],
+            [
+                (4, "be.app01 is UP (was DOWN)"),
+                (2, "be.app02 went down 2 time(s) since the last read"),
+            ],
+        ])
+        self.assertEqual(collectd.notifications, [])
+        self.assertEqual(
+            p.proxy_states["/var/run/sock.sock"][("3", "1")], ("UP", "1")
+        )
+
+    def test_collect_stats_no_state_fields(self):
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = None
+        socket.gen_stat_rows.return_value = iter([
+            ["pxname", "svname", "status"],
+            ["be", "app01", "UP"],
+        ])
+        collectd = StubCollectd()
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.notify_state_changes = True
+
+        p.collect_stats(socket)
+
+        self.assertEqual(p.proxy_states, {})
+
+    def test_collect_socket_backs_off_unreachable_sockets(self):
+        now = [1000.0]
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+        socket = Mock(socket_file_path="/var/run/sock.sock", truncated=False)
+        socket.name = None
+        collector = Mock()
+        collector.side_effect = IOError(2, "No such file or directory")
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        breaker = CircuitBreaker(
+            10, 60, clock=lambda: now[0], rand=lambda: 0.0
+        )
+        p.breakers["/var/run/sock.sock"] = breaker
+
+        p.collect_socket(socket, [collector])
+
+        self.assertEqual(breaker.retry_at, 1010.0)
+        collectd.error.assert_called_once_with(
+            "Error reading from /var/run/sock.sock "
+            "([Errno 2] No such file or directory), retrying in 10.0s"
+        )
+
+        # skipped while open
+        now[0] = 1005.0
+        p.collect_socket(socket, [collector])
+        self.assertEqual(collector.call_count, 1)
+
+        # failed half-open probe, logged quietly
+        now[0] = 1010.0
+        p.collect_socket(socket, [collector])
+        self.assertEqual(collector.call_count, 2)
+        self.assertEqual(collectd.error.call_count, 1)
+        self.assertEqual(breaker.retry_at, 1030.0)
+
+        # successful probe closes the breaker
+        now[0] = 1030.0
+        collector.side_effect = None
+        p.collect_socket(socket, [collector])
+        self.assertEqual(collector.call_count, 3)
+        collectd.info.assert_called_once_with(
+            "/var/run/sock.sock is reachable again"
+        )
+
+        state = p.metrics.values[("circuit_state", "gauge")]
+        self.assertEqual(
+            [c[1]["values"] for c in state.dispatch.call_args_list],
+            [[1], [1], [1], [0]]
+        )
+
+    def test_collect_socket_creates_breakers(self):
+        collectd = Mock()
+        socket = Mock(socket_file_path="/var/run/sock.sock")
+        socket.name = "proc1"
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.backoff_base = 5
+        p.backoff_max = 30
+
+        p.collect_socket(socket, [])
+
+        breaker = p.breakers["/var/run/sock.sock"]
+        self.assertEqual((breaker.base_delay, breaker.max_delay), (5, 30))
+        collectd.Values.return_value.dispatch.assert_called_once_with(
+            plugin_instance="proc1", values=[0]
+        )
+
+    def test_collect_traces_memory(self):
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+        socket = Mock(socket_file_path="/var/run/sock.sock", truncated=False)
+        socket.name = None
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.sockets = [socket]
+        p.include_info = False
+        p.track_reloads = False
+        p.collect_stats = Mock(__name__="collect_stats")
+
+        tracer = Mock(sites=[("plugin.py:10", 2048, 3)])
+        tracer.wrap.side_effect = lambda collectors: collectors
+        tracer.end.return_value = {
+            "collect_stats": [1024, 4096], "read": [2048, 4096],
+        }
+        p.memory_tracer = tracer
+
+        p.collect()
+
+        tracer.begin.assert_called_once_with()
+        tracer.wrap.assert_called_once_with([p.collect_stats])
+        p.collect_stats.assert_called_once_with(socket)
+        allocated = p.metrics.values[("allocated", "bytes")]
+        self.assertEqual(allocated.dispatch.call_count, 2)
+        allocated.dispatch.assert_any_call(
+            plugin_instance="memory.collect_stats", values=[1024]
+        )
+        allocated.dispatch.assert_any_call(
+            plugin_instance="memory.read", values=[2048]
+        )
+        peak = p.metrics.values[("peak", "bytes")]
+        self.assertEqual(peak.dispatch.call_count, 2)
+        collectd.debug.assert_any_call(
+            "Allocated 2048 bytes in 3 blocks at plugin.py:10"
+        )
+
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    @patch("collectd_haproxy.memory.MemoryTracer")
+    def test_initialize_memory_tracer(self, MemoryTracer, HAProxySocket):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.trace_memory = True
+        p.trace_memory_path = "/tmp/memory.txt"
+
+        p.initialize()
+
+        self.assertEqual(p.memory_tracer, MemoryTracer.return_value)
+        MemoryTracer.assert_called_once_with(10, "/tmp/memory.txt")
+
+        MemoryTracer.available.return_value = False
+        p.memory_tracer = None
+
+        p.initialize()
+
+        self.assertEqual(p.memory_tracer, None)
+        collectd.error.assert_called_once_with(
+            "TraceMemory requires python 3.4+"
+        )
+
+    @patch("collectd_haproxy.capture.CaptureWriter")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_records_reads(self, HAProxySocket, CaptureWriter):
+        collectd = Mock()
+
+        def make_socket(collectd, path, name=None):
+            socket = Mock(socket_file_path=path, truncated=False)
+            socket.name = name
+            return socket
+
+        HAProxySocket.side_effect = make_socket
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [
+            ("/var/run/one.sock", None), ("/var/run/two.sock", "lb"),
+        ]
+        p.record_path = "/tmp/capture.gz"
+        p.record_reads = 2
+        p.include_info = False
+        p.include_stats = False
+        p.track_reloads = False
+
+        p.initialize()
+
+        CaptureWriter.assert_any_call(
+            "/tmp/capture.gz.one", "/var/run/one.sock"
+        )
+        CaptureWriter.assert_any_call(
+            "/tmp/capture.gz.lb", "/var/run/two.sock"
+        )
+        recorder = CaptureWriter.return_value
+        self.assertEqual(
+            [socket.recorder for socket in p.sockets], [recorder, recorder]
+        )
+
+        p.collect()
+
+        self.assertEqual(recorder.close.call_count, 0)
+
+        p.collect()
+
+        self.assertEqual(recorder.close.call_count, 2)
+        self.assertEqual(
+            [socket.recorder for socket in p.sockets], [None, None]
+        )
+        self.assertEqual(p.recording, 0)
+
+    @patch("collectd_haproxy.worker.CollectorWorker")
+    @patch("collectd_haproxy.plugin.HAProxySocket")
+    def test_initialize_starts_worker(self, HAProxySocket, CollectorWorker):
+        collectd = Mock()
+
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.use_worker = True
+
+        p.initialize()
+
+        CollectorWorker.assert_called_once_with(p, 30.0)
+        CollectorWorker.return_value.start.assert_called_once_with()
+        self.assertEqual(p.worker, CollectorWorker.return_value)
+        self.assertEqual(p.sockets, [])
+        self.assertFalse(HAProxySocket.called)
+
+    def test_read_dispatches_worker_batch(self):
+        collectd = Mock()
+        collectd.Values.side_effect = lambda **kwargs: Mock(**kwargs)
+
+        p = HAProxyPlugin(collectd)
+        p.metrics = MetricRegistry(collectd, "haproxy", {})
+        p.collect = Mock()
+        p.worker = Mock()
+        p.worker.read.return_value = (
+            (
+                ("app", "gauge", "scur", [3]),
+                ("app.app01", "gauge", "scur", [1]),
+            ),
+            ({"plugin": "haproxy", "message": "app01 is DOWN"},),
+            (("warning", "slow"),),
+        )
+
+        p.read()
+
+        self.assertFalse(p.collect.called)
+        scur = p.metrics.values[("scur", "gauge")]
+        scur.dispatch.assert_any_call(plugin_instance="app", values=[3])
+        scur.dispatch.assert_any_call(plugin_instance="app.app01", values=[1])
+        collectd.Notification.assert_called_once_with(
+            plugin="haproxy", message="app01 is DOWN"
+        )
+        collectd.Notification.return_value.dispatch.assert_called_once_with()
+        collectd.warning.assert_called_once_with("slow")
+
+        p.worker.read.return_value = None
+
+        p.read()
+
+        self.assertEqual(scur.dispatch.call_count, 2)
+
+    def test_initialize_shares_response_cache(self):
+        from collectd_haproxy.cache import RESPONSE_CACHE
+
+        p = HAProxyPlugin(Mock())
+        p.socket_configs = [("/var/run/asdf.sock", None)]
+        p.response_cache_ttl = 0.5
+
+        p.initialize()
+
+        self.assertIs(p.sockets[0].cache, RESPONSE_CACHE)
+        self.assertEqual(p.sockets[0].cache_ttl, 0.5)
+
+        other = HAProxyPlugin(Mock())
+        other.socket_configs = [("/var/run/asdf.sock", None)]
+
+        other.initialize()
+
+        self.assertEqual(other.sockets[0].cache, None)
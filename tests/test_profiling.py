@@ -0,0 +1,88 @@
+import os
+import pstats
+import shutil
+import tempfile
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from collectd_haproxy.profiling import (
+    ReadProfiler, CProfileProfiler, SamplingProfiler,
+)
+
+
+def busy_read():
+    deadline = time.time() + 0.05
+    while time.time() < deadline:
+        sum(range(100))
+
+
+class ProfilingTests(unittest.TestCase):
+
+    def setUp(self):
+        super(ProfilingTests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.path = os.path.join(self.tmp_dir, "reads.prof")
+
+    def test_finished_after_requested_reads(self):
+        profiler = CProfileProfiler(self.path, 2)
+
+        self.assertEqual(profiler.finished, False)
+        profiler.runcall(lambda: None)
+        self.assertEqual(profiler.finished, False)
+        profiler.runcall(lambda: None)
+        self.assertEqual(profiler.finished, True)
+
+    def test_runcall_returns_result(self):
+        profiler = CProfileProfiler(self.path, 1)
+
+        self.assertEqual(profiler.runcall(lambda: 3), 3)
+
+    def test_base_class_is_abstract(self):
+        profiler = ReadProfiler(self.path, 1)
+
+        self.assertRaises(NotImplementedError, profiler.start)
+        self.assertRaises(NotImplementedError, profiler.stop)
+        self.assertRaises(NotImplementedError, profiler.dump)
+
+    def test_cprofile_dump(self):
+        profiler = CProfileProfiler(self.path, 1)
+
+        profiler.runcall(busy_read)
+        profiler.dump()
+
+        stats = pstats.Stats(self.path)
+        self.assertTrue(
+            any(func[2] == "busy_read" for func in stats.stats)
+        )
+
+    def test_sampling_dump(self):
+        profiler = SamplingProfiler(self.path, 1)
+
+        profiler.runcall(busy_read)
+        profiler.dump()
+
+        self.assertEqual(profiler.thread, None)
+        with open(self.path) as fd:
+            lines = fd.read().splitlines()
+
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertTrue(int(count) > 0)
+        self.assertTrue(
+            any(":busy_read:" in line for line in lines)
+        )
+
+    def test_sampling_stops_on_error(self):
+        profiler = SamplingProfiler(self.path, 1)
+
+        def broken():
+            raise IOError("oops")
+
+        self.assertRaises(IOError, profiler.runcall, broken)
+        self.assertEqual(profiler.thread, None)
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from collectd_haproxy.snapshot import (
+    SnapshotWriter, SnapshotReader, GENERATION, GENERATION_OFFSET,
+)
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        super(SnapshotTests, self).setUp()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.path = os.path.join(self.tmp_dir, "haproxy.stat")
+
+    def test_round_trip(self):
+        writer = SnapshotWriter(self.path)
+        self.addCleanup(writer.close)
+
+        writer.write(
+            ["pxname", "svname", "scur", "status"],
+            ["fe/FRONTEND", "be/app01"],
+            [["fe", "FRONTEND", "41", "OPEN"], ["be", "app01", "", "UP", ""]],
+        )
+
+        self.assertEqual(
+            SnapshotReader(self.path).read(),
+            (
+                2,
+                ["pxname", "svname", "scur", "status"],
+                ["fe/FRONTEND", "be/app01"],
+                [[None, None, 41, None], [None, None, None, None]],
+            )
+        )
+
+    def test_generation_increases_and_file_grows(self):
+        writer = SnapshotWriter(self.path)
+        self.addCleanup(writer.close)
+
+        writer.write(["scur"], ["a"], [["1"]])
+        small_size = os.path.getsize(self.path)
+
+        writer.write(["scur"], ["row"] * 2000, [["-3"]] * 2000)
+
+        generation, columns, labels, rows = SnapshotReader(self.path).read()
+
+        self.assertEqual(generation, 4)
+        self.assertEqual(len(rows), 2000)
+        self.assertEqual(rows[-1], [-3])
+        self.assertTrue(os.path.getsize(self.path) > small_size)
+
+    def test_new_writer_continues_generation(self):
+        writer = SnapshotWriter(self.path)
+        writer.write(["scur"], ["a"], [["1"]])
+        writer.write(["scur"], ["a"], [["2"]])
+        writer.close()
+
+        writer = SnapshotWriter(self.path)
+        self.addCleanup(writer.close)
+        writer.write(["scur"], ["a"], [["3"]])
+
+        self.assertEqual(
+            SnapshotReader(self.path).read(), (6, ["scur"], ["a"], [[3]])
+        )
+
+    def test_read_during_write_is_rejected(self):
+        writer = SnapshotWriter(self.path)
+        self.addCleanup(writer.close)
+        writer.write(["scur"], ["a"], [["1"]])
+
+        # simulate a writer that's midway through an update
+        GENERATION.pack_into(writer.map, GENERATION_OFFSET, 3)
+
+        self.assertEqual(SnapshotReader(self.path).read(attempts=2), None)
+
+    def test_read_empty_file(self):
+        open(self.path, "w").close()
+
+        self.assertEqual(SnapshotReader(self.path).read(), None)
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from collectd_haproxy.plugin import HAProxyPlugin
+from collectd_haproxy.stub import StubCollectd, StubConfigNode
+
+
+# modules only needed by optional features, which shouldn't be loaded just
+# by collectd importing the plugin
+OPTIONAL_MODULES = (
+    "collectd_haproxy.aio",
+    "collectd_haproxy.cache",
+    "collectd_haproxy.capture",
+    "collectd_haproxy.memory",
+    "collectd_haproxy.profiling",
+    "collectd_haproxy.snapshot",
+    "collectd_haproxy.worker",
+)
+
+# generous enough for a loaded CI box, well under what importing everything
+# used to take
+IMPORT_BUDGET = 0.25
+INITIALIZE_BUDGET = 0.05
+
+IMPORT_SCRIPT = """
+import json, sys, time
+before = set(sys.modules)
+start = time.time()
+import collectd_haproxy
+elapsed = time.time() - start
+sys.stdout.write(json.dumps({
+    "elapsed": elapsed, "modules": sorted(set(sys.modules) - before),
+}))
+"""
+
+
+class StartupTests(unittest.TestCase):
+
+    def import_plugin(self):
+        process = subprocess.Popen(
+            [sys.executable, "-c", IMPORT_SCRIPT],
+            stdout=subprocess.PIPE,
+            cwd=os.path.join(os.path.dirname(__file__), ".."),
+        )
+        output = process.communicate()[0]
+
+        return json.loads(output.decode("utf-8"))
+
+    def test_import_defers_optional_modules(self):
+        result = self.import_plugin()
+
+        loaded = set(result["modules"])
+        self.assertIn("collectd_haproxy.plugin", loaded)
+        self.assertEqual(
+            [name for name in OPTIONAL_MODULES if name in loaded], []
+        )
+
+    def test_import_budget(self):
+        elapsed = min(self.import_plugin()["elapsed"] for _ in range(3))
+
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_initialize_budget(self):
+        config = StubConfigNode("Module", children=[
+            StubConfigNode("Socket", ["/var/run/haproxy-%d.sock" % i])
+            for i in range(16)
+        ])
+
+        start = time.time()
+        p = HAProxyPlugin(StubCollectd())
+        p.configure(config)
+        p.initialize()
+        elapsed = time.time() - start
+
+        self.assertEqual(len(p.sockets), 16)
+        self.assertEqual(p.metrics.values, {})
+        self.assertLess(elapsed, INITIALIZE_BUDGET)
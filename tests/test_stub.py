@@ -0,0 +1,78 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import Mock
+
+from collectd_haproxy.stub import StubCollectd
+
+
+class StubCollectdTests(unittest.TestCase):
+
+    def test_values_dispatch_counts(self):
+        collectd = StubCollectd()
+
+        values = collectd.Values(
+            plugin="haproxy", type="gauge", type_instance="current_connections"
+        )
+        values.dispatch(plugin_instance="haproxy", values=[10])
+        values.dispatch(plugin_instance="haproxy", values=[11])
+
+        self.assertEqual(collectd.dispatched, 2)
+        self.assertEqual(collectd.values, [])
+
+    def test_values_dispatch_keeps_values(self):
+        collectd = StubCollectd(keep_values=True)
+
+        values = collectd.Values(
+            plugin="haproxy", type="gauge", type_instance="current_connections"
+        )
+        values.dispatch(plugin_instance="haproxy", values=[10])
+        values.dispatch(
+            plugin_instance="table.rl", type_instance="top", values=[3]
+        )
+
+        self.assertEqual(
+            collectd.values,
+            [
+                ("haproxy", "gauge", "current_connections", [10]),
+                ("table.rl", "gauge", "top", [3]),
+            ]
+        )
+
+    def test_notification_dispatch(self):
+        stream = Mock()
+        collectd = StubCollectd(verbose=True, stream=stream)
+
+        collectd.Notification(
+            plugin="haproxy", severity=collectd.NOTIF_FAILURE,
+            message="be.app01 is DOWN (was UP)",
+        ).dispatch()
+
+        self.assertEqual(collectd.notifications, [{
+            "plugin": "haproxy", "severity": 1,
+            "message": "be.app01 is DOWN (was UP)",
+        }])
+        stream.write.assert_called_once_with(
+            "[notification] be.app01 is DOWN (was UP)\n"
+        )
+
+    def test_logging(self):
+        stream = Mock()
+        collectd = StubCollectd(stream=stream)
+
+        collectd.debug("hidden")
+        collectd.error("oh no")
+
+        stream.write.assert_called_once_with("[error] oh no\n")
+
+    def test_register_and_unregister(self):
+        collectd = StubCollectd()
+        callback = Mock()
+
+        collectd.register_init(callback, name="haproxy")
+        collectd.register_read(callback, name="haproxy")
+        collectd.unregister_read(callback)
+
+        self.assertEqual(collectd.callbacks, {"init": callback})
@@ -0,0 +1,164 @@
+import marshal
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from mock import Mock
+
+from collectd_haproxy.plugin import HAProxyPlugin
+from collectd_haproxy.stub import StubCollectd
+from collectd_haproxy.worker import WorkerCollectd, CollectorWorker
+
+
+RESPONSES = {
+    "show info": "Pid: 12\nCurrConns: 20\n\n",
+    "show stat -1 7 -1": "# pxname,svname,scur,\nfe,FRONTEND,4,\n\n",
+}
+
+
+def serve(server):
+    while True:
+        try:
+            conn, _ = server.accept()
+        except (OSError, socket.error):
+            return
+        command = conn.recv(1024).decode("ascii").strip()
+        conn.sendall(RESPONSES.get(command, "Unknown command.\n").encode())
+        conn.close()
+
+
+class FakePlugin(object):
+
+    def __init__(self, collectd, delay=0):
+        self.collectd = collectd
+        self.delay = delay
+        self.use_worker = True
+        self.reads = 0
+
+    def initialize(self):
+        self.collectd.info("initialized in worker")
+
+    def read(self):
+        self.reads += 1
+        time.sleep(self.delay)
+        if self.reads == 2:
+            raise ValueError("bad row")
+        self.collectd.Values(
+            plugin="haproxy", type="gauge", type_instance="scur"
+        ).dispatch(plugin_instance="app", values=[self.reads])
+
+
+class WorkerCollectdTests(unittest.TestCase):
+
+    def test_batch(self):
+        collectd = WorkerCollectd()
+
+        collectd.Values(
+            plugin="haproxy", type="derive", type_instance="stot"
+        ).dispatch(plugin_instance="app", values=[10])
+        collectd.Notification(severity=1, message="app is DOWN").dispatch()
+        collectd.debug("debugging")
+        collectd.warn("warned")
+        collectd.warning("warning")
+
+        batch = marshal.loads(collectd.batch())
+
+        self.assertEqual(batch, (
+            (("app", "derive", "stot", [10]),),
+            ({"severity": 1, "message": "app is DOWN"},),
+            (
+                ("debug", "debugging"), ("warning", "warned"),
+                ("warning", "warning"),
+            ),
+        ))
+        self.assertEqual(marshal.loads(collectd.batch()), ((), (), ()))
+
+
+class CollectorWorkerTests(unittest.TestCase):
+
+    def test_read(self):
+        collectd = Mock()
+        worker = CollectorWorker(FakePlugin(collectd), 5)
+        worker.start()
+        self.addCleanup(worker.stop)
+
+        values, notifications, messages = worker.read()
+
+        self.assertEqual(values, (("app", "gauge", "scur", [1]),))
+        self.assertEqual(messages, (("info", "initialized in worker"),))
+
+        values, notifications, messages = worker.read()
+
+        self.assertEqual(values, ())
+        self.assertEqual(
+            messages, (("error", "Error reading in worker: bad row"),)
+        )
+
+        values, notifications, messages = worker.read()
+
+        self.assertEqual(values, (("app", "gauge", "scur", [3]),))
+        self.assertFalse(collectd.error.called)
+
+    def test_read_timeout_restarts(self):
+        collectd = Mock()
+        worker = CollectorWorker(FakePlugin(collectd, delay=1), 0.1)
+        worker.start()
+        self.addCleanup(worker.stop)
+        process = worker.process
+
+        self.assertEqual(worker.read(), None)
+
+        collectd.error.assert_called_once_with(
+            "No response from collector worker, restarting"
+        )
+        self.assertFalse(process.is_alive())
+        self.assertTrue(worker.process.is_alive())
+
+    def test_read_dead_worker_restarts(self):
+        collectd = Mock()
+        worker = CollectorWorker(FakePlugin(collectd), 5)
+        worker.start()
+        self.addCleanup(worker.stop)
+        worker.process.terminate()
+        worker.process.join()
+
+        values, notifications, messages = worker.read()
+
+        collectd.warning.assert_called_once_with(
+            "Collector worker died, restarting"
+        )
+        self.assertEqual(values, (("app", "gauge", "scur", [1]),))
+
+    def test_read_real_plugin(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "haproxy.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(8)
+        self.addCleanup(server.close)
+        thread = threading.Thread(target=serve, args=(server,))
+        thread.daemon = True
+        thread.start()
+
+        collectd = StubCollectd(keep_values=True, stream=Mock())
+        p = HAProxyPlugin(collectd)
+        p.socket_configs = [(path, None)]
+        p.use_worker = True
+        p.initialize()
+        self.addCleanup(p.worker.stop)
+
+        for _ in range(2):
+            p.read()
+
+        self.assertEqual(collectd.values.count(
+            ("fe.FRONTEND", "gauge", "current_session_count", [4])
+        ), 2)
+        self.assertFalse(collectd.stream.write.called)